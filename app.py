@@ -3,19 +3,62 @@ import pandas as pd
 import numpy as np
 import json
 import os
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-import yfinance as yf
 from datetime import date, timedelta
 
-# ======== 修正中文亂碼 (設置 Matplotlib 字體) ========
-# 雲端環境簡化設定，避免 findSystemFonts 卡住
-rcParams['font.sans-serif'] = ['Microsoft JhengHei', 'DFKai-SB', 'DejaVu Sans', 'sans-serif']
-rcParams['axes.unicode_minus'] = False
+from pnl_engine import (
+    OPTION_MULTIPLIER,
+    MICRO_OPTION_MULTIPLIER,
+    ETF_SHARES_PER_LOT,
+    LEVERAGE_00631L,
+    etf_index_delta,
+    positions_to_legs,
+    price_grid,
+    evaluate_books,
+)
+from payoff_analyzer import payoff_extremes, payoff_segments
+from backtest import run_backtest
+from charts import pnl_figure
+from tables import build_scenario_table, build_leg_detail, style_scenario_table, column_formats
+from scenario_cache import analyze_positions, scenario_cache, scenario_key
+from price_store import PriceStore
+from portfolios import PortfolioRepository, DEFAULT_USER, DEFAULT_PORTFOLIO
+from positions import Position, Product, OptionType, Direction, SCHEMA_VERSION, migrate_document, load_positions
+from tracing import Tracer, trace_enabled, TRACE_FILE_ENV_VAR, DEFAULT_TRACE_PATH
+from storage import (
+    BACKEND_LOCAL,
+    BACKEND_MEMORY,
+    configured_backend,
+    open_store,
+    DEFAULT_LOCAL_PATH,
+    LEGACY_LOCAL_PATH,
+    LEGACY_FIREBASE_PATH,
+)
+from quotes import QuoteService, QuoteRefresher, INDEX_TICKER, ETF_TICKER, FETCH_BUDGET_SECONDS
+from mc_risk import run_var, simulate_rebalanced_etf, calendar_to_trading_days
+from option_pricing import (
+    DAYS_PER_YEAR,
+    leg_value_pnl_matrix,
+    implied_vols_cached,
+    bs_unit_greeks,
+    leg_greeks,
+    portfolio_greeks,
+    contracts_to_target,
+)
 
 # ======== 頁面設定 ========
 st.set_page_config(page_title="00631L 避險計算器", layout="wide")
 
+# ======== 效能量測 (HEDGE_TRACE=1 或網址加上 ?debug=1 時啟用) ========
+if "tracer" not in st.session_state:
+    debug_flag = st.query_params.get("debug")
+    st.session_state.tracer = Tracer(
+        enabled=trace_enabled(debug_flag) or trace_enabled(),
+        export_path=os.environ.get(TRACE_FILE_ENV_VAR, DEFAULT_TRACE_PATH),
+    )
+tracer = st.session_state.tracer
+tracer.begin_run()
+tracer.phase("版面")
+
 # ======== CSS 樣式 ========
 st.markdown(
     """
@@ -279,96 +322,149 @@ st.markdown('''
 ''', unsafe_allow_html=True)
 
 # ======== 常數設定 ========
-OPTION_MULTIPLIER = 50.0  # 台指選擇權每點 50 元
-MICRO_OPTION_MULTIPLIER = 10.0  # 微台選擇權每點 10 元
-ETF_SHARES_PER_LOT = 1000  # 1張 = 1000股
-LEVERAGE_00631L = 2.0  # 00631L 為 2 倍槓桿 ETF
 PRICE_STEP = 100.0
+STYLED_TABLE_MAX_ROWS = 500  # 超過此列數的試算表不逐格上色
 
 # ======== 網路資料抓取函式 ========
-@st.cache_data(ttl=300)
-def get_tse_index_price(ticker="^TWII"):
-    """從 Yahoo Finance 獲取加權指數的最新價格"""
-    try:
-        tse_ticker = yf.Ticker(ticker)
-        hist = tse_ticker.history(period="5d")
-        if not hist.empty:
-            price = float(hist['Close'].iloc[-1])
-            if price > 1000:
-                return price
+@st.cache_resource
+def get_price_store():
+    """本機價格資料庫 (同一行程內共用)"""
+    return PriceStore()
+
+@st.cache_resource
+def get_quote_refresher():
+    """背景報價更新執行緒 (同一行程內所有 session 共用一份快照)"""
+    return QuoteRefresher(QuoteService(get_price_store())).start()
+
+def get_price_history(ticker, period="10y"):
+    """取得歷史日收盤價 (本機資料庫缺少的部分才連網補齊)"""
+    closes = get_price_store().ensure_history(ticker, period)
+    if closes.empty:
         return None
+    return closes
+
+# ======== 儲存後端設定 ========
+def read_secrets_section(name):
+    """讀取 st.secrets 中的設定區塊，沒有 secrets 檔時回傳 None"""
+    try:
+        if name in st.secrets:
+            return dict(st.secrets[name])
     except Exception:
-        return None
+        pass
+    return None
+
+def firebase_credential_source():
+    """Firebase 憑證來源：本機開發用 JSON 檔，Streamlit Cloud 用 secrets"""
+    if os.path.exists("firebase_key.json"):
+        return "firebase_key.json"
+    return read_secrets_section("firebase")
+
+def storage_settings():
+    """(secrets 的 [storage] 設定, Firebase 憑證來源, 後端名稱)"""
+    settings = read_secrets_section("storage") or {}
+    credential_source = firebase_credential_source()
+    backend = configured_backend(settings, has_firebase_credentials=credential_source is not None)
+    return settings, credential_source, backend
+
+@st.cache_resource
+def get_store():
+    """倉位資料儲存後端的根路徑 (由 HEDGE_STORAGE 環境變數或 secrets 的 [storage] 決定)"""
+    settings, credential_source, backend = storage_settings()
+    return open_store(
+        backend,
+        credential_source,
+        local_path=settings.get("local_path", DEFAULT_LOCAL_PATH),
+    )
 
-@st.cache_data(ttl=300)
-def get_00631L_price():
-    """從 Yahoo Finance 獲取 00631L 的最新價格"""
+@st.cache_resource
+def get_portfolios(user):
+    """使用者的投資組合 (同一行程內共用)；預設使用者第一次使用時匯入舊版單一倉位"""
+    _, credential_source, backend = storage_settings()
+    legacy = None
+    if user == DEFAULT_USER:
+        legacy = open_store(
+            backend,
+            credential_source,
+            local_path=LEGACY_LOCAL_PATH,
+            firebase_path=LEGACY_FIREBASE_PATH,
+        )
+    return PortfolioRepository(get_store(), user, legacy)
+
+def query_user_allowed():
+    """網址參數 ?user= 可任意切換使用者，只在本機 / 記憶體後端或 [storage] allow_query_user = true 時接受"""
+    settings, _, backend = storage_settings()
+    return backend in (BACKEND_LOCAL, BACKEND_MEMORY) or bool(settings.get("allow_query_user", False))
+
+def current_user():
+    """目前使用者：已登入時用 email，否則 (允許時) 用網址參數 ?user=，都沒有時為 default"""
     try:
-        etf_ticker = yf.Ticker("00631L.TW")
-        hist = etf_ticker.history(period="5d")
-        if not hist.empty:
-            price = float(hist['Close'].iloc[-1])
-            if price > 0:
-                return price
-        return None
+        if st.user.is_logged_in and st.user.email:
+            return st.user.email
     except Exception:
-        return None
+        pass
+    if query_user_allowed():
+        return st.query_params.get("user", DEFAULT_USER)
+    return DEFAULT_USER
 
-# ======== Firebase 設定 ========
-FIREBASE_DATABASE_URL = "https://l-op-bf09b-default-rtdb.asia-southeast1.firebasedatabase.app/"
+def active_store():
+    """目前選取組合的儲存物件"""
+    return get_portfolios(current_user()).store(st.session_state.active_portfolio)
 
-# 初始化 Firebase (只執行一次)
-import firebase_admin
-from firebase_admin import credentials, db
-import os
+def active_writer():
+    """目前選取組合的背景延遲寫入"""
+    return get_portfolios(current_user()).writer(st.session_state.active_portfolio)
 
-if "firebase_initialized" not in st.session_state:
+def store_version():
+    """儲存後端快取版本 (僅 Firebase 監聽快取提供，其餘後端為 None)"""
     try:
-        # 優先嘗試本機開發：使用 JSON 檔案
-        if os.path.exists("firebase_key.json"):
-            cred = credentials.Certificate("firebase_key.json")
-        # Streamlit Cloud：從 secrets 取得憑證
-        elif hasattr(st, 'secrets') and 'firebase' in st.secrets:
-            cred_dict = dict(st.secrets["firebase"])
-            cred = credentials.Certificate(cred_dict)
-        else:
-            raise FileNotFoundError("找不到 Firebase 憑證")
-        
-        firebase_admin.initialize_app(cred, {
-            'databaseURL': FIREBASE_DATABASE_URL
-        })
-        st.session_state.firebase_initialized = True
-    except ValueError:
-        # 已經初始化過
-        st.session_state.firebase_initialized = True
-    except Exception as e:
-        st.error(f"Firebase 初始化失敗: {e}")
-        st.session_state.firebase_initialized = False
+        return getattr(active_store(), "version", None)
+    except Exception:
+        return None
 
-# ======== 載入與儲存函式 (Firebase) ========
+# ======== 載入與儲存函式 ========
 def load_data():
-    """從 Firebase 載入倉位資料"""
-    if not st.session_state.get("firebase_initialized", False):
-        return None
+    """從儲存後端載入倉位資料"""
     try:
-        ref = db.reference('hedge_positions')
-        data = ref.get()
+        with tracer.span("讀取資料"):
+            data = active_store().get()
+        # 同一組合的 writer 由所有 session 共用，還有未寫入的修改時不可重設比對基準
+        writer = active_writer()
+        if data is not None and not writer.has_pending:
+            writer.prime(data)
         return data
     except Exception as e:
-        st.error(f"Firebase 讀取失敗: {e}")
+        st.error(f"資料讀取失敗: {e}")
         return None
 
 def save_data(data):
-    """儲存倉位資料到 Firebase"""
-    if not st.session_state.get("firebase_initialized", False):
-        return False
+    """儲存倉位資料 (排入背景寫入，只送出有變動的欄位)"""
     try:
-        ref = db.reference('hedge_positions')
-        ref.set(data)
-        return True
+        writer = active_writer()
     except Exception as e:
-        st.error(f"Firebase 儲存失敗: {e}")
+        st.error(f"資料儲存失敗: {e}")
         return False
+    if writer.last_error is not None:
+        st.error(f"資料儲存失敗: {writer.last_error}")
+    with tracer.span("儲存資料"):
+        writer.submit(data)
+    return True
+
+def session_document():
+    """目前 session 中的倉位資料 (儲存用)"""
+    return {
+        "etf_lots": st.session_state.etf_lots,
+        "etf_cost": st.session_state.etf_cost,
+        "etf_current_price": st.session_state.etf_current_price,
+        "hedge_ratio": st.session_state.hedge_ratio,
+        "cash_cost": st.session_state.cash_cost,
+        "cash_current": st.session_state.cash_current,
+        "option_positions": [p.to_record() for p in st.session_state.option_positions],
+        "schema_version": SCHEMA_VERSION,
+    }
+
+def save_session_data():
+    """儲存目前 session 中的倉位資料"""
+    return save_data(session_document())
 
 # ======== 初始化 session state ========
 if "option_positions" not in st.session_state:
@@ -396,36 +492,105 @@ if "hedge_ratio" not in st.session_state:
 if "data_loaded" not in st.session_state:
     st.session_state.data_loaded = False
 
+if "active_portfolio" not in st.session_state:
+    st.session_state.active_portfolio = DEFAULT_PORTFOLIO
+
 # ********* 初始抓取價格 (每次載入都抓取最新價格) *********
+tracer.phase("報價")
+quote_refresher = get_quote_refresher()
+quote_snapshot = quote_refresher.snapshot()
+
 # 加權指數
-tse_price = get_tse_index_price()
-if tse_price and tse_price > 1000:
-    st.session_state.tse_index_price = tse_price
+tse_quote = quote_snapshot.quotes.get(INDEX_TICKER)
+if tse_quote and tse_quote.price > 1000:
+    st.session_state.tse_index_price = tse_quote.price
 elif st.session_state.tse_index_price is None:
     st.session_state.tse_index_price = 23000.0  # 備用值
 
 # 00631L 現價 - 永遠優先使用 Yahoo Finance 即時價格
-etf_price = get_00631L_price()
-if etf_price:
-    st.session_state.etf_current_price = etf_price
+etf_quote = quote_snapshot.quotes.get(ETF_TICKER)
+if etf_quote and etf_quote.price > 0:
+    st.session_state.etf_current_price = etf_quote.price
 elif st.session_state.etf_current_price is None:
     st.session_state.etf_current_price = 100.0  # 備用值
 
+# ======== 投資組合選擇 ========
+tracer.phase("載入組合")
+def switch_portfolio():
+    """切換組合後重新載入該組合的資料"""
+    st.session_state.data_loaded = False
+    st.session_state.pop("book_result", None)
+
+if "pending_portfolio" in st.session_state:
+    st.session_state.active_portfolio = st.session_state.pop("pending_portfolio")
+    switch_portfolio()
+
+try:
+    portfolio_names = get_portfolios(current_user()).names()
+except Exception as e:
+    st.sidebar.error(f"讀取投資組合清單失敗: {e}")
+    portfolio_names = []
+# 尚未儲存過的預設組合與目前組合也列入選項
+portfolio_names = sorted(set(portfolio_names) | {DEFAULT_PORTFOLIO, st.session_state.active_portfolio})
+
+st.sidebar.markdown("## 📁 投資組合")
+st.sidebar.selectbox(
+    "目前組合",
+    portfolio_names,
+    key="active_portfolio",
+    on_change=switch_portfolio,
+    help="每個組合分別儲存，只載入目前選取的組合",
+)
+with st.sidebar.expander("➕ 新增組合"):
+    new_portfolio_name = st.text_input("組合名稱", key="new_portfolio_name")
+    if st.button("建立空白組合", use_container_width=True):
+        try:
+            created = get_portfolios(current_user()).create(new_portfolio_name, {
+                "etf_lots": 0.0,
+                "etf_cost": 0.0,
+                "hedge_ratio": 0.2,
+                "cash_cost": 0.0,
+                "cash_current": 0.0,
+                "option_positions": [],
+                "schema_version": SCHEMA_VERSION,
+            })
+        except Exception as e:
+            st.error(f"建立組合失敗: {e}")
+        else:
+            # 選擇元件已建立，改在下一次執行前切換
+            st.session_state.pending_portfolio = created
+            st.rerun()
+st.sidebar.markdown("---")
+
 # ********* 自動載入資料 (現價不從檔案讀取，改用即時抓取) *********
+# 其他裝置修改資料後 (監聽快取版本變動) 重新載入；本機還有未寫入的修改時不覆蓋
+current_store_version = store_version()
+if (st.session_state.data_loaded
+        and current_store_version is not None
+        and current_store_version != st.session_state.get("store_version")
+        and not active_writer().has_pending):
+    st.session_state.data_loaded = False
+
 if not st.session_state.data_loaded:
     saved_data = load_data()
     if saved_data:
+        # 舊版資料只在載入時轉換一次，並寫回目前版本
+        saved_data, migrated = migrate_document(saved_data)
         st.session_state.etf_lots = float(saved_data.get("etf_lots", 0.0))
         st.session_state.etf_cost = float(saved_data.get("etf_cost", 0.0))
         st.session_state.hedge_ratio = float(saved_data.get("hedge_ratio", 0.2))
-        st.session_state.option_positions = saved_data.get("option_positions", [])
+        st.session_state.option_positions = load_positions(saved_data)
         # 載入現金資料
         st.session_state.cash_cost = float(saved_data.get("cash_cost", 0.0))
         st.session_state.cash_current = float(saved_data.get("cash_current", 0.0))
         # 現價不再從檔案讀取，改用 Yahoo Finance 即時價格
+        if migrated:
+            save_data(saved_data)
+    st.session_state.store_version = store_version()
     st.session_state.data_loaded = True
 
 # ======== 側邊欄設定 ========
+tracer.phase("側邊欄")
 st.sidebar.markdown("## 📊 00631L 庫存設定")
 
 # 儲存舊值
@@ -494,19 +659,19 @@ hedge_ratio = st.sidebar.number_input(
     min_value=0.0,
     max_value=1.0,
     format="%.2f",
-    help="每 1 張 00631L 需要多少口選擇權避險"
+    help="每 1 張 00631L 固定買進的賣權口數 (用於下方歷史回測)；建議口數依 Delta 計算"
+)
+target_delta_lots = st.sidebar.number_input(
+    "目標淨 Delta (台指口數等值)",
+    value=0.0,
+    step=0.5,
+    format="%.2f",
+    help="0 = 完全 Delta 中性；以台指選擇權 50 元/點換算 (建議口數與 Greeks 區塊共用)",
+    key="target_delta_lots"
 )
 
-# 計算建議避險口數
-suggested_hedge_lots = etf_lots * hedge_ratio
-
-st.sidebar.markdown(f"""
-<div style='padding: 10px; background-color: #f0f9ff; border-radius: 8px; margin-top: 10px;'>
-    <p style='margin:0; font-weight:700; color:#0369a1;'>📌 建議避險口數</p>
-    <p style='margin:5px 0 0 0; font-size:24px; font-weight:800; color:#0c4a6e;'>{suggested_hedge_lots:.1f} 口</p>
-    <p style='margin:0; font-size:12px; color:#64748b;'>({etf_lots:.2f} 張 × {hedge_ratio:.2f})</p>
-</div>
-""", unsafe_allow_html=True)
+# 建議避險口數需要估值參數，先保留位置，於讀取估值參數後填入
+hedge_suggestion_box = st.sidebar.empty()
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("## 📈 模擬設定")
@@ -518,6 +683,48 @@ PRICE_RANGE = st.sidebar.number_input(
     min_value=100,
 )
 
+st.sidebar.markdown("---")
+st.sidebar.markdown("## ⏳ 估值參數")
+
+days_to_expiry = st.sidebar.number_input(
+    "距到期天數",
+    value=7,
+    step=1,
+    min_value=0,
+    help="估值日距離結算日的天數 (用於到期前估值與 Greeks)"
+)
+bs_volatility = st.sidebar.number_input(
+    "波動率 (%)",
+    value=20.0,
+    step=1.0,
+    min_value=0.1,
+    format="%.1f",
+    help="年化波動率"
+) / 100.0
+bs_rate = st.sidebar.number_input(
+    "無風險利率 (%)",
+    value=1.5,
+    step=0.1,
+    min_value=0.0,
+    format="%.2f",
+    help="年化無風險利率"
+) / 100.0
+use_implied_vol = st.sidebar.checkbox(
+    "以權利金反推隱含波動率",
+    value=False,
+    help="以各倉位權利金與當前指數反推 IV，無法求解的倉位改用上方波動率"
+)
+etf_model = st.sidebar.selectbox(
+    "00631L 評價模式",
+    ["線性 2 倍近似", "每日再平衡模擬"],
+    help="每日再平衡模擬會考慮 2 倍槓桿逐日複利與波動耗損，於圖表顯示損益分佈區間"
+)
+show_pre_expiry = st.sidebar.checkbox(
+    "顯示到期前損益曲線",
+    value=False,
+    help="以 Black-Scholes 模型估算到期前某一天的組合價值"
+)
+
 # 更新 session state
 st.session_state.etf_lots = etf_lots
 st.session_state.etf_cost = etf_cost
@@ -529,12 +736,60 @@ st.session_state.cash_current = cash_current
 # 當前指數
 center = st.session_state.tse_index_price
 
+# ======== Delta 避險建議 (側邊欄與庫存摘要共用) ========
+def delta_hedge_suggestion(center, positions, etf_lots, etf_current, days_to_expiry, volatility, rate, target_delta):
+    """00631L 等值指數 Delta 加上現有倉位 Delta，換算成達到目標淨 Delta 的微台期貨與價平台指賣權口數
+
+    與 Greeks 區塊相同以 contracts_to_target 計算；回傳
+    (淨 Delta 元/點, 微台期貨做空口數, 賣權履約價, 賣權買進口數)。
+    """
+    book_delta = float(portfolio_greeks(leg_greeks(center, positions_to_legs(positions), days_to_expiry, volatility, rate)).delta)
+    net_delta = etf_index_delta(center, etf_lots, etf_current) + book_delta
+    put_strike = float(round(center / 100) * 100)
+    put_delta = float(bs_unit_greeks(center, put_strike, days_to_expiry / DAYS_PER_YEAR, rate, volatility, False).delta)
+    futures_lots = contracts_to_target(net_delta, target_delta, -MICRO_OPTION_MULTIPLIER)
+    put_lots = contracts_to_target(net_delta, target_delta, put_delta * OPTION_MULTIPLIER)
+    return net_delta, futures_lots, put_strike, put_lots
+
+hedge_net_delta, hedge_futures_lots, hedge_put_strike, hedge_put_lots = delta_hedge_suggestion(
+    center, st.session_state.option_positions, etf_lots, etf_current, days_to_expiry, bs_volatility, bs_rate,
+    target_delta_lots * OPTION_MULTIPLIER,
+)
+hedge_suggestion_box.markdown(f"""
+<div style='padding: 10px; background-color: #f0f9ff; border-radius: 8px; margin-top: 10px;'>
+    <p style='margin:0; font-weight:700; color:#0369a1;'>📌 建議避險口數 (目標 {target_delta_lots:+.2f} 口台指)</p>
+    <p style='margin:5px 0 0 0; font-size:18px; font-weight:800; color:#0c4a6e;'>微台期貨做空 {hedge_futures_lots:+.1f} 口</p>
+    <p style='margin:0; font-size:18px; font-weight:800; color:#0c4a6e;'>或 買進 {hedge_put_strike:,.0f} 賣權 {hedge_put_lots:+.1f} 口</p>
+    <p style='margin:0; font-size:12px; color:#64748b;'>淨 Delta {hedge_net_delta:+,.0f} 元/點；負數代表需減少該方向部位</p>
+</div>
+""", unsafe_allow_html=True)
+
+def format_quote_age(quote):
+    """報價來源與時間說明"""
+    if quote is None:
+        return "無報價，使用備用值"
+    age = quote.age()
+    if age < 60:
+        age_text = f"{age:.0f} 秒前"
+    elif age < 3600:
+        age_text = f"{age / 60:.0f} 分鐘前"
+    elif age < 86400:
+        age_text = f"{age / 3600:.1f} 小時前"
+    else:
+        age_text = f"{age / 86400:.1f} 天前"
+    return f"{quote.source} · {age_text}"
+
 st.sidebar.markdown(f"""
 <div style='font-size:14px; margin-top: 10px;'>
     <p><b>當前指數:</b> <span style="color:#04335a; font-weight:700;">{center:,.1f}</span></p>
+    <p style='font-size:12px; color:#64748b;'>指數報價: {format_quote_age(tse_quote)}<br>00631L 報價: {format_quote_age(etf_quote)}<br>
+    快照更新: {quote_refresher.age():.0f} 秒前 · 取價耗時 {quote_snapshot.latency * 1000:,.0f} ms</p>
 </div>
 """, unsafe_allow_html=True)
 
+if quote_snapshot.error:
+    st.sidebar.warning(f"報價抓取失敗 ({quote_snapshot.error})，顯示最後成功的報價", icon="⚠️")
+
 # ********* 自動儲存 *********
 if (etf_lots != old_etf_lots or 
     etf_cost != old_etf_cost or 
@@ -542,25 +797,19 @@ if (etf_lots != old_etf_lots or
     hedge_ratio != old_hedge_ratio or
     cash_cost != old_cash_cost or
     cash_current != old_cash_current):
-    save_data({
-        "etf_lots": etf_lots,
-        "etf_cost": etf_cost,
-        "etf_current_price": etf_current,
-        "hedge_ratio": hedge_ratio,
-        "cash_cost": cash_cost,
-        "cash_current": cash_current,
-        "option_positions": st.session_state.option_positions
-    })
+    save_session_data()
     st.sidebar.success("✅ 已自動儲存", icon="💾")
 
 # ======== 主頁面 ========
+tracer.phase("倉位")
 
 # ======== 操作按鈕 ========
 col1, col2 = st.columns(2)
 with col1:
     if st.button("🔄 重新整理價格", use_container_width=True, help="重新抓取最新的 ETF 和指數價格"):
-        st.cache_data.clear()
-        st.success("✅ 已清除快取，將重新載入價格")
+        get_price_store().invalidate_quotes()
+        quote_refresher.request_refresh(wait=FETCH_BUDGET_SECONDS + 1.0)
+        st.success("✅ 已重新抓取價格")
         st.rerun()
 with col2:
     if st.button("🧹 清空所有倉位", use_container_width=True):
@@ -568,15 +817,7 @@ with col2:
         st.session_state.etf_lots = 0.0
         st.session_state.etf_cost = 0.0
         st.session_state.hedge_ratio = 0.2
-        save_data({
-            "etf_lots": 0.0,
-            "etf_cost": 0.0,
-            "etf_current_price": st.session_state.etf_current_price,
-            "hedge_ratio": 0.2,
-            "cash_cost": st.session_state.cash_cost,
-            "cash_current": st.session_state.cash_current,
-            "option_positions": []
-        })
+        save_session_data()
         st.success("已清空所有資料")
         st.rerun()
 
@@ -614,7 +855,7 @@ if etf_lots > 0:
         </div>
         <div style='margin-top: 10px; padding: 8px 10px; background-color: #fef3c7; border-radius: 8px; font-size: 12px;'>
             <span style='font-weight:700; color:#92400e;'>📌 建議避險:</span> 
-            持有 {etf_lots:.2f} 張，建議買入 <b>{suggested_hedge_lots:.1f} 口</b> 賣權進行保護
+            組合淨 Delta {hedge_net_delta:+,.0f} 元/點，達到目標 {target_delta_lots:+.2f} 口台指需做空微台期貨 <b>{hedge_futures_lots:+.1f} 口</b>，或買進 {hedge_put_strike:,.0f} 賣權 <b>{hedge_put_lots:+.1f} 口</b>
         </div>
     </div>
     """, unsafe_allow_html=True)
@@ -647,341 +888,320 @@ if cash_cost > 0 or cash_current > 0:
     """, unsafe_allow_html=True)
 
 # ======== 新增倉位 ========
-st.markdown("<div class='card'>", unsafe_allow_html=True)
-st.markdown('<div class="section-title">➕ 新增倉位</div>', unsafe_allow_html=True)
-
-# 產品類型選擇
-opt_product = st.selectbox("產品", ["台指選擇權 (50元/點)", "微台期貨 (10元/點)"], key="new_opt_product")
-is_micro_futures = "微台期貨" in opt_product
-
-if is_micro_futures:
-    # ===== 微台期貨介面 =====
-    col1, col2 = st.columns([2, 1])
-    
-    with col1:
-        default_strike = round(center / 100) * 100
-        opt_strike = st.number_input("進場價", min_value=0.0, step=100.0, value=float(default_strike), key="micro_strike")
-    with col2:
-        opt_lots = st.number_input("口數", min_value=1, step=1, value=1, key="micro_lots")
-    
-    st.caption("📌 微台期貨：做空方向，一點 10 元")
-    
-    if st.button("✅ 新增微台期貨倉位", use_container_width=True, key="add_micro"):
-        new_position = {
-            "product": "微台期貨",
-            "type": "Futures",
-            "direction": "做空",
-            "strike": float(opt_strike),
-            "lots": int(opt_lots),
-            "premium": 0.0
-        }
-        st.session_state.option_positions.append(new_position)
-        save_data({
-            "etf_lots": st.session_state.etf_lots,
-            "etf_cost": st.session_state.etf_cost,
-            "etf_current_price": st.session_state.etf_current_price,
-            "hedge_ratio": st.session_state.hedge_ratio,
-            "cash_cost": st.session_state.cash_cost,
-            "cash_current": st.session_state.cash_current,
-            "option_positions": st.session_state.option_positions
-        })
-        st.success("已新增微台期貨倉位")
-        st.rerun()
+@st.fragment
+def render_add_position(center):
+    """新增倉位表單；欄位變動只重新執行此片段，新增後才重新執行整頁"""
+    st.markdown("<div class='card'>", unsafe_allow_html=True)
+    st.markdown('<div class="section-title">➕ 新增倉位</div>', unsafe_allow_html=True)
 
-else:
-    # ===== 台指選擇權介面 =====
-    col1, col2 = st.columns([1.2, 1.2])
-    
-    with col1:
-        opt_type = st.selectbox("類型", ["買權 (Call)", "賣權 (Put)"], key="new_opt_type")
-    with col2:
-        opt_direction = st.radio("方向", ["買進", "賣出"], horizontal=True, key="new_opt_direction")
-    
-    col3, col4, col5 = st.columns([1.5, 1, 1.5])
-    
-    with col3:
-        default_strike = round(center / 100) * 100
-        opt_strike = st.number_input("履約價", min_value=0.0, step=100.0, value=float(default_strike), key="opt_strike")
-    with col4:
-        opt_lots = st.number_input("口數", min_value=1, step=1, value=1, key="opt_lots")
-    with col5:
-        opt_premium = st.number_input("權利金 (點)", min_value=0.0, step=1.0, value=0.0, key="opt_premium")
-    
-    if st.button("✅ 新增選擇權倉位", use_container_width=True, key="add_option"):
-        new_position = {
-            "product": "台指",
-            "type": "Call" if "Call" in opt_type else "Put",
-            "direction": opt_direction,
-            "strike": float(opt_strike),
-            "lots": int(opt_lots),
-            "premium": float(opt_premium)
-        }
-        st.session_state.option_positions.append(new_position)
-        save_data({
-            "etf_lots": st.session_state.etf_lots,
-            "etf_cost": st.session_state.etf_cost,
-            "etf_current_price": st.session_state.etf_current_price,
-            "hedge_ratio": st.session_state.hedge_ratio,
-            "cash_cost": st.session_state.cash_cost,
-            "cash_current": st.session_state.cash_current,
-            "option_positions": st.session_state.option_positions
-        })
-        st.success("已新增選擇權倉位")
-        st.rerun()
+    # 產品類型選擇
+    opt_product = st.selectbox("產品", ["台指選擇權 (50元/點)", "微台期貨 (10元/點)"], key="new_opt_product")
+    is_micro_futures = "微台期貨" in opt_product
 
-st.markdown("</div>", unsafe_allow_html=True)
+    if is_micro_futures:
+        # ===== 微台期貨介面 =====
+        col1, col2 = st.columns([2, 1])
+    
+        with col1:
+            default_strike = round(center / 100) * 100
+            opt_strike = st.number_input("進場價", min_value=0.0, step=100.0, value=float(default_strike), key="micro_strike")
+        with col2:
+            opt_lots = st.number_input("口數", min_value=1, step=1, value=1, key="micro_lots")
+    
+        st.caption("📌 微台期貨：做空方向，一點 10 元")
+    
+        if st.button("✅ 新增微台期貨倉位", use_container_width=True, key="add_micro"):
+            new_position = Position.micro_futures(opt_strike, opt_lots)
+            st.session_state.option_positions.append(new_position)
+            save_session_data()
+            st.success("已新增微台期貨倉位")
+            st.rerun()
+
+    else:
+        # ===== 台指選擇權介面 =====
+        col1, col2 = st.columns([1.2, 1.2])
+    
+        with col1:
+            opt_type = st.selectbox("類型", ["買權 (Call)", "賣權 (Put)"], key="new_opt_type")
+        with col2:
+            opt_direction = st.radio("方向", ["買進", "賣出"], horizontal=True, key="new_opt_direction")
+    
+        col3, col4, col5 = st.columns([1.5, 1, 1.5])
+    
+        with col3:
+            default_strike = round(center / 100) * 100
+            opt_strike = st.number_input("履約價", min_value=0.0, step=100.0, value=float(default_strike), key="opt_strike")
+        with col4:
+            opt_lots = st.number_input("口數", min_value=1, step=1, value=1, key="opt_lots")
+        with col5:
+            opt_premium = st.number_input("權利金 (點)", min_value=0.0, step=1.0, value=0.0, key="opt_premium")
+    
+        if st.button("✅ 新增選擇權倉位", use_container_width=True, key="add_option"):
+            new_position = Position(
+                Product.TXO,
+                OptionType.CALL if "Call" in opt_type else OptionType.PUT,
+                Direction(opt_direction),
+                float(opt_strike),
+                int(opt_lots),
+                float(opt_premium),
+            )
+            st.session_state.option_positions.append(new_position)
+            save_session_data()
+            st.success("已新增選擇權倉位")
+            st.rerun()
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+render_add_position(center)
 
 # ======== 現有倉位 ========
-if st.session_state.option_positions:
-    st.markdown("<div class='card'>", unsafe_allow_html=True)
-    st.markdown('<div class="section-title">📋 現有倉位</div>', unsafe_allow_html=True)
+def change_position_lots(index, step):
+    """增減倉位口數 (最少為 0 口，代表暫停計算)"""
+    position = st.session_state.option_positions[index]
+    if position.lots + step >= 0:
+        position.lots += step
+        save_session_data()
+
+def delete_position(index):
+    """刪除倉位"""
+    st.session_state.option_positions.pop(index)
+    save_session_data()
+
+def positions_hash(positions):
+    """倉位內容雜湊 (與情境快取相同的鍵)，用來判斷片段內的點擊是否改變了倉位"""
+    return scenario_key(positions_to_legs(positions))
+
+@st.fragment
+def render_positions():
+    """現有倉位列表；點擊只重新執行此片段，倉位內容改變時才重新執行整頁
+
+    損益圖、試算表、Greeks 與 Monte Carlo 都依賴倉位，因此 ➕、➖、🗑️ 改變口數或刪除倉位時
+    仍會重新執行整頁 (圖表與試算表以內容雜湊快取，損益以增量更新)；
+    沒有改變內容的點擊 (例如 0 口時按 ➖) 只重繪此片段。
+    """
+    if positions_hash(st.session_state.option_positions) != st.session_state.rendered_positions_hash:
+        st.rerun()
+
+    if st.session_state.option_positions:
+        st.markdown("<div class='card'>", unsafe_allow_html=True)
+        st.markdown('<div class="section-title">📋 現有倉位</div>', unsafe_allow_html=True)
     
-    # 計算權利金收支
-    total_premium_in = 0.0  # 收入（賣出）
-    total_premium_out = 0.0  # 支出（買進）
+        # 計算權利金收支
+        total_premium_in = 0.0  # 收入（賣出）
+        total_premium_out = 0.0  # 支出（買進）
     
-    for i, pos in enumerate(st.session_state.option_positions):
-        # 使用 4 欄佈局：資訊、減少、增加、刪除
-        col_info, col_minus, col_plus, col_delete = st.columns([6, 0.5, 0.5, 0.8])
-        
-        # 判斷產品類型 (向下兼容舊資料)
-        product_type = pos.get("product", "台指")
-        is_futures = product_type == "微台期貨" or pos.get("type") == "Futures"
+        for i, pos in enumerate(st.session_state.option_positions):
+            # 使用 4 欄佈局：資訊、減少、增加、刪除
+            col_info, col_minus, col_plus, col_delete = st.columns([6, 0.5, 0.5, 0.8])
         
-        if is_futures:
-            multiplier = MICRO_OPTION_MULTIPLIER
-            product_label = "微台期貨"
-            product_color = "#8b5cf6"  # 紫色
-            type_label = ""  # 期貨不顯示類型
-            dir_tag = "sell-tag"
-            dir_label = "做空"
-            premium_value = 0
-            premium_display = ""
-            premium_style = ""
-        else:
-            multiplier = MICRO_OPTION_MULTIPLIER if product_type == "微台" else OPTION_MULTIPLIER
-            product_label = product_type if product_type else "台指"
-            product_color = "#0891b2"  # 青色
-            type_tag = "call-tag" if pos["type"] == "Call" else "put-tag"
-            type_label = "買權" if pos["type"] == "Call" else "賣權"
-            dir_tag = "buy-tag" if pos["direction"] == "買進" else "sell-tag"
-            dir_label = pos["direction"]
-            
-            premium_value = pos["premium"] * pos["lots"] * multiplier
-            if pos["direction"] == "賣出":
-                total_premium_in += premium_value
-                premium_display = f"+{premium_value:,.0f} 元"
-                premium_style = "color: #10b981;"
-            else:
-                total_premium_out += premium_value
-                premium_display = f"-{premium_value:,.0f} 元"
-                premium_style = "color: #ef4444;"
+            is_futures = pos.is_futures
+            product_label = pos.product.value
         
-        with col_info:
             if is_futures:
-                # 微台期貨顯示格式
-                st.markdown(f"""
-                <div style='padding: 8px 0; display: flex; align-items: center; gap: 10px; flex-wrap: wrap;'>
-                    <span style='color: #64748b;'>#{i+1}</span>
-                    <span style='background-color: {product_color}20; color: {product_color}; padding: 2px 6px; border-radius: 4px; font-size: 12px; font-weight: 600;'>{product_label}</span>
-                    <span class='sell-tag'>做空</span>
-                    <span style='font-weight: 700;'>進場 {pos['strike']:,.0f}</span>
-                    <span style='font-weight: 700; color: #0369a1;'>×{pos['lots']} 口</span>
-                </div>
-                """, unsafe_allow_html=True)
+                product_color = "#8b5cf6"  # 紫色
+                type_label = ""  # 期貨不顯示類型
+                dir_tag = "sell-tag"
+                dir_label = "做空"
+                premium_value = 0
+                premium_display = ""
+                premium_style = ""
             else:
-                # 選擇權顯示格式
-                st.markdown(f"""
-                <div style='padding: 8px 0; display: flex; align-items: center; gap: 10px; flex-wrap: wrap;'>
-                    <span style='color: #64748b;'>#{i+1}</span>
-                    <span style='background-color: {product_color}20; color: {product_color}; padding: 2px 6px; border-radius: 4px; font-size: 12px; font-weight: 600;'>{product_label}</span>
-                    <span class='{dir_tag}'>{dir_label}</span>
-                    <span class='{type_tag}'>{type_label}</span>
-                    <span style='font-weight: 700;'>{pos['strike']:,.0f}</span>
-                    <span style='font-weight: 700; color: #0369a1;'>×{pos['lots']} 口</span>
-                    <span>@{pos['premium']:.0f} 點</span>
-                    <span style='font-weight: 700; {premium_style}'>{premium_display}</span>
-                </div>
-                """, unsafe_allow_html=True)
+                product_color = "#0891b2"  # 青色
+                type_tag = "call-tag" if pos.is_call else "put-tag"
+                type_label = pos.type.label
+                dir_tag = "buy-tag" if pos.direction is Direction.BUY else "sell-tag"
+                dir_label = pos.direction.value
+            
+                premium_value = pos.premium * pos.lots * pos.multiplier
+                if pos.direction is Direction.SELL:
+                    total_premium_in += premium_value
+                    premium_display = f"+{premium_value:,.0f} 元"
+                    premium_style = "color: #10b981;"
+                else:
+                    total_premium_out += premium_value
+                    premium_display = f"-{premium_value:,.0f} 元"
+                    premium_style = "color: #ef4444;"
+        
+            with col_info:
+                if is_futures:
+                    # 微台期貨顯示格式
+                    st.markdown(f"""
+                    <div style='padding: 8px 0; display: flex; align-items: center; gap: 10px; flex-wrap: wrap;'>
+                        <span style='color: #64748b;'>#{i+1}</span>
+                        <span style='background-color: {product_color}20; color: {product_color}; padding: 2px 6px; border-radius: 4px; font-size: 12px; font-weight: 600;'>{product_label}</span>
+                        <span class='sell-tag'>做空</span>
+                        <span style='font-weight: 700;'>進場 {pos.strike:,.0f}</span>
+                        <span style='font-weight: 700; color: #0369a1;'>×{pos.lots} 口</span>
+                    </div>
+                    """, unsafe_allow_html=True)
+                else:
+                    # 選擇權顯示格式
+                    st.markdown(f"""
+                    <div style='padding: 8px 0; display: flex; align-items: center; gap: 10px; flex-wrap: wrap;'>
+                        <span style='color: #64748b;'>#{i+1}</span>
+                        <span style='background-color: {product_color}20; color: {product_color}; padding: 2px 6px; border-radius: 4px; font-size: 12px; font-weight: 600;'>{product_label}</span>
+                        <span class='{dir_tag}'>{dir_label}</span>
+                        <span class='{type_tag}'>{type_label}</span>
+                        <span style='font-weight: 700;'>{pos.strike:,.0f}</span>
+                        <span style='font-weight: 700; color: #0369a1;'>×{pos.lots} 口</span>
+                        <span>@{pos.premium:.0f} 點</span>
+                        <span style='font-weight: 700; {premium_style}'>{premium_display}</span>
+                    </div>
+                    """, unsafe_allow_html=True)
         
-        with col_minus:
-            if st.button("➖", key=f"minus_opt_{i}", help="減少口數 (0=暫停計算)", use_container_width=True):
-                if st.session_state.option_positions[i]["lots"] > 0:
-                    st.session_state.option_positions[i]["lots"] -= 1
-                    save_data({
-                        "etf_lots": st.session_state.etf_lots,
-                        "etf_cost": st.session_state.etf_cost,
-                        "etf_current_price": st.session_state.etf_current_price,
-                        "hedge_ratio": st.session_state.hedge_ratio,
-                        "cash_cost": st.session_state.cash_cost,
-                        "cash_current": st.session_state.cash_current,
-                        "option_positions": st.session_state.option_positions
-                    })
-                    st.rerun()
+            # 以 on_click 回呼修改倉位，點擊後只需執行一次腳本
+            with col_minus:
+                st.button("➖", key=f"minus_opt_{i}", help="減少口數 (0=暫停計算)", use_container_width=True,
+                          on_click=change_position_lots, args=(i, -1))
         
-        with col_plus:
-            if st.button("➕", key=f"plus_opt_{i}", help="增加口數", use_container_width=True):
-                st.session_state.option_positions[i]["lots"] += 1
-                save_data({
-                    "etf_lots": st.session_state.etf_lots,
-                    "etf_cost": st.session_state.etf_cost,
-                    "etf_current_price": st.session_state.etf_current_price,
-                    "hedge_ratio": st.session_state.hedge_ratio,
-                    "cash_cost": st.session_state.cash_cost,
-                    "cash_current": st.session_state.cash_current,
-                    "option_positions": st.session_state.option_positions
-                })
-                st.rerun()
+            with col_plus:
+                st.button("➕", key=f"plus_opt_{i}", help="增加口數", use_container_width=True,
+                          on_click=change_position_lots, args=(i, 1))
         
-        with col_delete:
-            if st.button("🗑️", key=f"del_opt_{i}", type="secondary", help="刪除倉位", use_container_width=True):
-                st.session_state.option_positions.pop(i)
-                save_data({
-                    "etf_lots": st.session_state.etf_lots,
-                    "etf_cost": st.session_state.etf_cost,
-                    "etf_current_price": st.session_state.etf_current_price,
-                    "hedge_ratio": st.session_state.hedge_ratio,
-                    "cash_cost": st.session_state.cash_cost,
-                    "cash_current": st.session_state.cash_current,
-                    "option_positions": st.session_state.option_positions
-                })
-                st.rerun()
+            with col_delete:
+                st.button("🗑️", key=f"del_opt_{i}", type="secondary", help="刪除倉位", use_container_width=True,
+                          on_click=delete_position, args=(i,))
         
-        st.markdown("<hr style='margin: 5px 0;'>", unsafe_allow_html=True)
+            st.markdown("<hr style='margin: 5px 0;'>", unsafe_allow_html=True)
     
-    # 權利金收支摘要
-    net_premium = total_premium_in - total_premium_out
-    net_style = "profit" if net_premium >= 0 else "loss"
+        # 權利金收支摘要
+        net_premium = total_premium_in - total_premium_out
+        net_style = "profit" if net_premium >= 0 else "loss"
     
-    st.markdown(f"""
-    <div style='margin-top: 10px; padding: 12px; background-color: #f8fafc; border-radius: 8px;'>
-        <div style='display: flex; justify-content: space-between; margin-bottom: 5px;'>
-            <span>賣出權利金收入:</span>
-            <span class='profit'>+{total_premium_in:,.0f} 元</span>
-        </div>
-        <div style='display: flex; justify-content: space-between; margin-bottom: 5px;'>
-            <span>買進權利金支出:</span>
-            <span class='loss'>-{total_premium_out:,.0f} 元</span>
-        </div>
-        <hr style='margin: 8px 0;'>
-        <div style='display: flex; justify-content: space-between; font-weight: 700; font-size: 16px;'>
-            <span>淨權利金:</span>
-            <span class='{net_style}'>{net_premium:+,.0f} 元</span>
+        st.markdown(f"""
+        <div style='margin-top: 10px; padding: 12px; background-color: #f8fafc; border-radius: 8px;'>
+            <div style='display: flex; justify-content: space-between; margin-bottom: 5px;'>
+                <span>賣出權利金收入:</span>
+                <span class='profit'>+{total_premium_in:,.0f} 元</span>
+            </div>
+            <div style='display: flex; justify-content: space-between; margin-bottom: 5px;'>
+                <span>買進權利金支出:</span>
+                <span class='loss'>-{total_premium_out:,.0f} 元</span>
+            </div>
+            <hr style='margin: 8px 0;'>
+            <div style='display: flex; justify-content: space-between; font-weight: 700; font-size: 16px;'>
+                <span>淨權利金:</span>
+                <span class='{net_style}'>{net_premium:+,.0f} 元</span>
+            </div>
         </div>
-    </div>
-    """, unsafe_allow_html=True)
+        """, unsafe_allow_html=True)
     
-    st.markdown("</div>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+st.session_state.rendered_positions_hash = positions_hash(st.session_state.option_positions)
+render_positions()
 
 # ======== 損益計算與圖表 ========
+def position_label(index, pos):
+    """圖表提示中的倉位名稱"""
+    if pos.is_futures:
+        return f"#{index + 1} {pos.product.value} {pos.direction.value} {pos.strike:,.0f} ×{pos.lots}"
+    return f"#{index + 1} {pos.direction.value} {pos.type.value} {pos.strike:,.0f} ×{pos.lots}"
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def pnl_chart_spec(prices, etf_profits, option_profits, combined_profits, pre_expiry_profits,
+                   days_to_expiry, etf_bands, break_evens, center, legs_key, _unit_pnl, _lots, leg_labels):
+    """損益曲線圖的 Plotly 規格；以輸入內容的雜湊快取，內容不變時不重新組圖
+
+    各倉位損益矩陣 (價格 × 倉位) 不參與雜湊 (底線開頭的參數)，改以 legs_key 代表
+    倉位內容，未命中時才展開 _unit_pnl × _lots。
+    """
+    return pnl_figure(
+        prices, etf_profits, option_profits, combined_profits, pre_expiry_profits,
+        days_to_expiry, etf_bands, break_evens, center, _unit_pnl * _lots, leg_labels,
+    )
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def scenario_table(prices, center, etf_profits, option_profits, combined_profits):
+    """損益試算表 (數值欄位，以輸入內容的雜湊快取)"""
+    return build_scenario_table(prices, center, etf_profits, option_profits, combined_profits)
+
+def number_columns(frame):
+    """數值欄位的 column_config (格式優先於 Styler，因此數字格式只在此設定)"""
+    return {
+        column: st.column_config.NumberColumn(column, format=fmt)
+        for column, fmt in column_formats(frame).items()
+    }
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def leg_detail_table(prices, legs_key, _unit_pnl, _lots, leg_labels):
+    """各倉位損益明細 (價格 × 倉位)；與損益圖相同，以 legs_key 代替矩陣內容雜湊"""
+    return build_leg_detail(prices, _unit_pnl * _lots, leg_labels)
+
 if etf_lots > 0 or st.session_state.option_positions:
+    tracer.phase("損益計算")
+    # 建立精確分段線性損益，以均勻格點 + 履約價取樣；相同倉位與參數直接取用快取結果，
+    # 只調整單一倉位口數、新增或刪除時以每口損益向量增量更新
+    analysis, st.session_state.scenario_state = analyze_positions(
+        st.session_state.option_positions, center, etf_lots, etf_cost, etf_current, PRICE_RANGE, PRICE_STEP,
+        state=st.session_state.get("scenario_state"),
+    )
+    legs = analysis.legs
+    legs_key = scenario_key(legs)  # 倉位內容 (含口數) 的雜湊，O(倉位數)
+    payoff = analysis.payoff
+    price_low = max(center - PRICE_RANGE, 0.0)
+    price_high = center + PRICE_RANGE
+    prices = analysis.prices
+    break_evens = analysis.break_evens
+    cache_stats = scenario_cache.stats()
+    st.sidebar.caption(
+        f"情境快取：命中 {cache_stats.hits}・未命中 {cache_stats.misses}・"
+        f"{cache_stats.entries} 筆 / {cache_stats.nbytes / 1024:,.0f} KB"
+    )
+    etf_profits = analysis.etf_pnl
+    option_profits = analysis.option_pnl
+    combined_profits = analysis.combined_pnl
     
-    # 計算損益函數
-    def calc_position_pnl(pos, settlement_price):
-        """計算單一倉位的損益（支援選擇權和期貨）"""
-        strike = pos["strike"]
-        lots = pos["lots"]
-        premium = pos.get("premium", 0)
-        
-        # 判斷產品類型
-        product_type = pos.get("product", "台指")
-        is_futures = product_type == "微台期貨" or pos.get("type") == "Futures"
-        
-        if is_futures:
-            # 微台期貨損益計算（做空）
-            # 做空損益 = (進場價 - 結算價) × 口數 × 10元
-            pnl = (strike - settlement_price) * lots * MICRO_OPTION_MULTIPLIER
-            return pnl
-        else:
-            # 選擇權損益計算
-            multiplier = MICRO_OPTION_MULTIPLIER if product_type == "微台" else OPTION_MULTIPLIER
-            
-            # 計算內含價值
-            if pos["type"] == "Call":
-                intrinsic = max(0.0, settlement_price - strike)
-            else:  # Put
-                intrinsic = max(0.0, strike - settlement_price)
-            
-            # 計算損益 = (內含價值 - 權利金) × 口數 × 乘數
-            if pos["direction"] == "買進":
-                pnl = (intrinsic - premium) * lots * multiplier
-            else:  # 賣出
-                pnl = (premium - intrinsic) * lots * multiplier
-            
-            return pnl
-    
-    def calc_etf_pnl(index_price, base_index, etf_lots, etf_cost, etf_current):
-        """計算 00631L 在不同指數價位下的損益"""
-        if etf_lots <= 0 or base_index <= 0:
-            return 0.0
-        
-        # 指數變動比例
-        index_change_pct = (index_price - base_index) / base_index
-        
-        # 00631L 是 2 倍槓桿，價格變動 = 指數變動 × 2
-        etf_price_change_pct = index_change_pct * LEVERAGE_00631L
-        
-        # 新的 ETF 價格
-        new_etf_price = etf_current * (1 + etf_price_change_pct)
-        
-        # 計算損益 = (新價格 - 成本) × 股數
-        shares = etf_lots * ETF_SHARES_PER_LOT
-        profit = (new_etf_price - etf_cost) * shares
-        
-        return profit
+    # 各倉位波動率 (可由權利金反推 IV)
+    leg_volatility = bs_volatility
+    if use_implied_vol:
+        leg_iv = implied_vols_cached(legs, center, days_to_expiry, bs_rate)
+        leg_volatility = np.where(np.isnan(leg_iv), bs_volatility, leg_iv)
+        solved_count = int((~np.isnan(leg_iv)).sum())
+        option_count = int((~legs.is_futures).sum())
+        st.sidebar.caption(f"已反推 {solved_count}/{option_count} 個選擇權倉位的隱含波動率")
     
-    # 計算價格範圍
-    offsets = np.arange(-PRICE_RANGE, PRICE_RANGE + 1e-6, PRICE_STEP)
-    prices = [center + float(off) for off in offsets]
+    # 到期前估值 (Black-Scholes)
+    if show_pre_expiry:
+        pre_expiry_leg_pnl = leg_value_pnl_matrix(
+            prices, legs, days_to_expiry, leg_volatility, bs_rate
+        )
+        pre_expiry_profits = etf_profits + pre_expiry_leg_pnl.sum(axis=1)
     
-    # 計算各價位損益
-    etf_profits = []
-    option_profits = []
-    combined_profits = []
-    
-    for p in prices:
-        # ETF 損益
-        etf_pnl = calc_etf_pnl(p, center, etf_lots, etf_cost, etf_current)
-        etf_profits.append(etf_pnl)
-        
-        # 倉位組合損益（選擇權 + 期貨）
-        opt_pnl = sum(calc_position_pnl(pos, p) for pos in st.session_state.option_positions)
-        option_profits.append(opt_pnl)
-        
-        # 總損益
-        combined_profits.append(etf_pnl + opt_pnl)
+    # 00631L 每日再平衡模擬 (損益分佈)
+    if etf_lots > 0 and etf_model == "每日再平衡模擬":
+        etf_bands = simulate_rebalanced_etf(
+            prices, center, etf_lots, etf_cost, etf_current,
+            n_days=calendar_to_trading_days(days_to_expiry),
+            sigma=bs_volatility,
+        )
+    else:
+        etf_bands = None
     
     # ======== 損益曲線圖 ========
+    tracer.phase("損益曲線圖")
     st.markdown("<div class='card'>", unsafe_allow_html=True)
     st.markdown('<div class="section-title">📈 損益曲線</div>', unsafe_allow_html=True)
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
-    # 繪製各曲線
-    if etf_lots > 0:
-        ax.plot(prices, etf_profits, label="00631L", color="#3b82f6", linewidth=2, linestyle="--", alpha=0.7)
-    
-    if st.session_state.option_positions:
-        ax.plot(prices, option_profits, label="Options", color="#f59e0b", linewidth=2, linestyle="--", alpha=0.7)
-    
-    ax.plot(prices, combined_profits, label="Total P/L", color="#10b981", linewidth=3)
-    
-    # 零線
-    ax.axhline(y=0, color='gray', linestyle='-', linewidth=0.5)
-    ax.axvline(x=center, color='red', linestyle='--', linewidth=1, alpha=0.5, label=f"Current {center:,.0f}")
-    
-    ax.set_xlabel("Settlement Index", fontsize=12)
-    ax.set_ylabel("P/L (TWD)", fontsize=12)
-    ax.set_title("P/L Curve", fontsize=14, fontweight='bold')
-    ax.legend(loc='best')
-    ax.grid(True, alpha=0.3)
-    
-    # 格式化 Y 軸
-    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x:,.0f}'))
-    
-    plt.tight_layout()
-    st.pyplot(fig)
-    plt.close()
+    visible_break_evens = break_evens[(break_evens >= price_low) & (break_evens <= price_high)]
+    with tracer.span("圖表規格"):
+        chart_spec = pnl_chart_spec(
+            prices,
+            etf_profits if etf_lots > 0 else None,
+            option_profits if st.session_state.option_positions else None,
+            combined_profits,
+            pre_expiry_profits if show_pre_expiry else None,
+            days_to_expiry,
+            etf_bands,
+            visible_break_evens,
+            center,
+            legs_key,
+            analysis.unit_pnl,
+            legs.lots,
+            tuple(position_label(i, pos) for i, pos in enumerate(st.session_state.option_positions)),
+        )
+    with tracer.span("plotly_chart"):
+        st.plotly_chart(chart_spec, use_container_width=True)
     
     # 中文圖例說明
     st.markdown("""
@@ -990,56 +1210,337 @@ if etf_lots > 0 or st.session_state.option_positions:
         <span style='color: #3b82f6;'>00631L</span> = ETF損益 | 
         <span style='color: #f59e0b;'>Options</span> = 選擇權組合 | 
         <span style='color: #10b981;'>Total P/L</span> = 組合總損益 | 
-        <span style='color: red;'>Current</span> = 現價
+        <span style='color: #8b5cf6;'>T-Nd</span> = 到期前 N 天估值 | 
+        <span style='color: #1d4ed8;'>rebalanced</span> = 00631L 每日再平衡模擬 (平均與 5-95% 區間) | 
+        <span style='color: red;'>Current</span> = 現價 | 
+        滑鼠移到曲線上可查看各倉位損益，拖曳可縮放
     </div>
     """, unsafe_allow_html=True)
     
     st.markdown("</div>", unsafe_allow_html=True)
     
-    # ======== 損益試算表 ========
+    # ======== 精確損益分析 ========
+    tracer.phase("到期損益分析")
     st.markdown("<div class='card'>", unsafe_allow_html=True)
-    st.markdown('<div class="section-title">📊 損益試算表</div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-title">🎯 到期損益分析</div>', unsafe_allow_html=True)
     
-    # 建立表格資料
-    table_data = {
-        "結算指數": [f"{p:,.0f}" for p in prices],
-        "指數變動": [f"{p - center:+,.0f}" for p in prices],
-    }
+    window_extremes = payoff_extremes(payoff, price_low, price_high)
+    global_extremes = payoff_extremes(payoff)
     
-    if etf_lots > 0:
-        table_data["00631L"] = [f"{pnl:+,.0f}" for pnl in etf_profits]
+    def format_extreme(value, at):
+        if np.isinf(value):
+            return "無上限"
+        return f"{value:+,.0f} 元 @ {at:,.0f}"
     
-    if st.session_state.option_positions:
-        table_data["選擇權組合"] = [f"{pnl:+,.0f}" for pnl in option_profits]
+    break_even_text = "、".join(f"{p:,.1f}" for p in break_evens) if len(break_evens) else "無"
+    
+    a1, a2 = st.columns(2)
+    a1.metric("模擬範圍最大獲利", f"{window_extremes.max_profit:+,.0f} 元", f"@ {window_extremes.max_profit_at:,.0f}", delta_color="off")
+    a2.metric("模擬範圍最大虧損", f"{window_extremes.max_loss:+,.0f} 元", f"@ {window_extremes.max_loss_at:,.0f}", delta_color="off")
     
-    table_data["總損益"] = [f"{pnl:+,.0f}" for pnl in combined_profits]
+    st.markdown(f"""
+    <div style='margin-top: 10px; padding: 12px; background-color: #f8fafc; border-radius: 8px; font-size: 14px;'>
+        <div style='display: flex; justify-content: space-between; margin-bottom: 5px;'>
+            <span>損益兩平指數:</span>
+            <span style='font-weight: 700;'>{break_even_text}</span>
+        </div>
+        <div style='display: flex; justify-content: space-between; margin-bottom: 5px;'>
+            <span>到期最大獲利 (全區間):</span>
+            <span class='profit'>{format_extreme(global_extremes.max_profit, global_extremes.max_profit_at)}</span>
+        </div>
+        <div style='display: flex; justify-content: space-between;'>
+            <span>到期最大虧損 (全區間):</span>
+            <span class='loss'>{format_extreme(global_extremes.max_loss, global_extremes.max_loss_at)}</span>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
     
-    df = pd.DataFrame(table_data)
+    with st.expander("分段斜率 (元/點)"):
+        seg_start, seg_end, seg_slope = payoff_segments(payoff, price_low, price_high)
+        st.dataframe(pd.DataFrame({
+            "起點指數": [f"{x:,.0f}" for x in seg_start],
+            "終點指數": [f"{x:,.0f}" for x in seg_end],
+            "斜率 (元/點)": [f"{m:+,.1f}" for m in seg_slope],
+        }), use_container_width=True, hide_index=True)
     
-    # 樣式函數
-    def style_pnl(val):
-        try:
-            num = float(val.replace(",", "").replace("+", ""))
-            if num > 0:
-                return 'color: #10b981; font-weight: bold'
-            elif num < 0:
-                return 'color: #ef4444; font-weight: bold'
-        except:
-            pass
-        return ''
-    
-    # 顯示表格
-    styled_df = df.style.map(style_pnl, subset=["總損益"])
-    if etf_lots > 0:
-        styled_df = styled_df.map(style_pnl, subset=["00631L"])
-    if st.session_state.option_positions:
-        styled_df = styled_df.map(style_pnl, subset=["選擇權組合"])
+    st.markdown("</div>", unsafe_allow_html=True)
+    
+    # ======== Greeks 與 Delta 避險 ========
+    @st.fragment
+    def render_greeks_card(center, legs, etf_lots, etf_current, days_to_expiry, leg_volatility, bs_rate, bs_volatility,
+                           target_delta_lots):
+        """Greeks 與避險口數；目標淨 Delta 與側邊欄共用，調整賣權履約價只重新執行此片段"""
+        st.markdown("<div class='card'>", unsafe_allow_html=True)
+        st.markdown('<div class="section-title">🧮 Greeks 與 Delta 避險</div>', unsafe_allow_html=True)
+    
+        book_greeks = portfolio_greeks(leg_greeks(center, legs, days_to_expiry, leg_volatility, bs_rate))
+        etf_delta = etf_index_delta(center, etf_lots, etf_current)
+        net_delta = etf_delta + book_greeks.delta
+    
+        g1, g2, g3, g4, g5 = st.columns(5)
+        g1.metric("00631L Delta", f"{etf_delta:+,.0f} 元/點", f"{etf_delta / OPTION_MULTIPLIER:+.2f} 口台指", delta_color="off")
+        g2.metric("倉位 Delta", f"{book_greeks.delta:+,.0f} 元/點", f"{book_greeks.delta / OPTION_MULTIPLIER:+.2f} 口台指", delta_color="off")
+        g3.metric("Gamma", f"{book_greeks.gamma:+,.2f} 元/點²")
+        g4.metric("Vega", f"{book_greeks.vega:+,.0f} 元/1%")
+        g5.metric("Theta", f"{book_greeks.theta:+,.0f} 元/日")
+    
+        hedge_put_strike = st.number_input(
+            "避險賣權履約價",
+            min_value=0.0,
+            step=100.0,
+            value=float(round(center / 100) * 100),
+            key="hedge_put_strike"
+        )
+    
+        target_delta = target_delta_lots * OPTION_MULTIPLIER
+        put_delta = float(bs_unit_greeks(center, hedge_put_strike, days_to_expiry / DAYS_PER_YEAR, bs_rate, bs_volatility, False).delta)
+        futures_lots = contracts_to_target(net_delta, target_delta, -MICRO_OPTION_MULTIPLIER)
+        put_lots = contracts_to_target(net_delta, target_delta, put_delta * OPTION_MULTIPLIER)
+    
+        st.markdown(f"""
+        <div style='margin-top: 10px; padding: 12px; background-color: #f0f9ff; border-radius: 8px; font-size: 14px;'>
+            <div style='display: flex; justify-content: space-between; margin-bottom: 5px;'>
+                <span>組合淨 Delta:</span>
+                <span style='font-weight: 700;'>{net_delta:+,.0f} 元/點 ({net_delta / OPTION_MULTIPLIER:+.2f} 口台指)</span>
+            </div>
+            <div style='display: flex; justify-content: space-between; margin-bottom: 5px;'>
+                <span>📌 微台期貨 (做空):</span>
+                <span style='font-weight: 700; color: #0c4a6e;'>{futures_lots:+.1f} 口</span>
+            </div>
+            <div style='display: flex; justify-content: space-between;'>
+                <span>📌 買進台指賣權 {hedge_put_strike:,.0f} (Delta {put_delta:+.2f}):</span>
+                <span style='font-weight: 700; color: #0c4a6e;'>{put_lots:+.1f} 口</span>
+            </div>
+            <div style='margin-top: 6px; font-size: 12px; color: #64748b;'>目標淨 Delta {target_delta_lots:+.2f} 口台指 (於側邊欄設定)；負數代表需減少該方向部位；賣權 Delta 以側邊欄波動率估算</div>
+        </div>
+        """, unsafe_allow_html=True)
+    
+        st.markdown("</div>", unsafe_allow_html=True)
     
-    st.dataframe(styled_df, use_container_width=True, hide_index=True)
+    tracer.phase("Greeks")
+    render_greeks_card(center, legs, etf_lots, etf_current, days_to_expiry, leg_volatility, bs_rate, bs_volatility,
+                       target_delta_lots)
+    
+    # ======== Monte Carlo 風險 ========
+    @st.fragment
+    def render_mc_card(legs, center, etf_lots, etf_cost, etf_current, days_to_expiry, bs_volatility, leg_volatility, bs_rate):
+        """Monte Carlo 風險值；參數與執行按鈕只重新執行此片段"""
+        st.markdown("<div class='card'>", unsafe_allow_html=True)
+        st.markdown('<div class="section-title">🎲 Monte Carlo 風險值</div>', unsafe_allow_html=True)
+    
+        mc1, mc2, mc3, mc4 = st.columns(4)
+        with mc1:
+            mc_horizon = st.number_input("模擬天數", min_value=1, step=1, value=max(int(days_to_expiry), 1), key="mc_horizon")
+        with mc2:
+            mc_paths = st.number_input("路徑數", min_value=10_000, step=100_000, value=200_000, key="mc_paths")
+        with mc3:
+            mc_confidence = st.selectbox("信賴水準", [0.95, 0.99], index=1, format_func=lambda c: f"{c:.0%}", key="mc_confidence")
+        with mc4:
+            mc_threshold = st.number_input("虧損門檻 (元)", min_value=0.0, step=100_000.0, value=500_000.0, format="%.0f", key="mc_threshold")
+    
+        if st.button("▶️ 執行模擬", use_container_width=True, key="run_mc"):
+            with st.spinner("模擬中..."):
+                st.session_state.mc_report = run_var(
+                    legs, center, etf_lots, etf_cost, etf_current,
+                    horizon_days=mc_horizon,
+                    sigma=bs_volatility,
+                    n_paths=mc_paths,
+                    confidence=mc_confidence,
+                    loss_threshold=mc_threshold,
+                    days_to_expiry=days_to_expiry,
+                    leg_sigma=leg_volatility,
+                    rate=bs_rate,
+                )
+    
+        mc_report = st.session_state.get("mc_report")
+        if mc_report is not None:
+            r1, r2, r3, r4 = st.columns(4)
+            r1.metric(f"VaR {mc_report.confidence:.0%}", f"{mc_report.var:,.0f} 元")
+            r2.metric(f"CVaR {mc_report.confidence:.0%}", f"{mc_report.cvar:,.0f} 元")
+            r3.metric(f"虧損超過 {mc_report.loss_threshold:,.0f} 機率", f"{mc_report.breach_prob:.2%}")
+            r4.metric("平均損益", f"{mc_report.mean_pnl:+,.0f} 元", f"σ {mc_report.std_pnl:,.0f}", delta_color="off")
+            st.caption(f"{mc_report.n_paths:,} 條路徑 × {mc_report.horizon_days} 天，指數年化波動率取側邊欄設定")
+    
+        st.markdown("</div>", unsafe_allow_html=True)
+    
+    tracer.phase("Monte Carlo")
+    render_mc_card(legs, center, etf_lots, etf_cost, etf_current, days_to_expiry, bs_volatility, leg_volatility, bs_rate)
+    
+    # ======== 損益試算表 ========
+    tracer.phase("損益試算表")
+    st.markdown("<div class='card'>", unsafe_allow_html=True)
+    st.markdown('<div class="section-title">📊 損益試算表</div>', unsafe_allow_html=True)
+    
+    # 建立表格資料
+    df = scenario_table(
+        prices,
+        center,
+        etf_profits if etf_lots > 0 else None,
+        option_profits if st.session_state.option_positions else None,
+        combined_profits,
+    )
+    
+    # 顯示表格 (數字格式由 column_config 套用；Styler 只上色，列數過多時不上色)
+    table = style_scenario_table(df) if len(df) <= STYLED_TABLE_MAX_ROWS else df
+    with tracer.span("st.dataframe"):
+        st.dataframe(
+            table,
+            use_container_width=True,
+            hide_index=True,
+            column_config=number_columns(df),
+        )
+    
+    # 各倉位損益明細 (需要時才產生；大型表格不套用樣式)
+    if st.session_state.option_positions and st.toggle("顯示各倉位損益明細", key="show_leg_detail"):
+        leg_labels = tuple(position_label(i, pos) for i, pos in enumerate(st.session_state.option_positions))
+        detail = leg_detail_table(prices, legs_key, analysis.unit_pnl, legs.lots, leg_labels)
+        st.dataframe(
+            detail,
+            use_container_width=True,
+            hide_index=True,
+            column_config=number_columns(detail),
+        )
+        st.download_button(
+            "⬇️ 下載明細 CSV",
+            data=lambda: detail.to_csv(index=False).encode("utf-8-sig"),
+            file_name="leg_pnl.csv",
+            mime="text/csv",
+            key="download_leg_detail",
+        )
     
     st.markdown("</div>", unsafe_allow_html=True)
 
+# ======== 所有組合彙總 ========
+@st.fragment
+def render_book_summary(center, price_range, etf_lots, etf_cost, etf_current):
+    """所有組合彙總；只在按下計算時讀取資料，且只重新執行此片段"""
+    with st.expander("📚 所有組合彙總"):
+        st.caption("一次讀取目前使用者的所有組合，在同一組指數網格上計算到期損益 (00631L 以目前現價估算)")
+        if st.button("▶️ 載入並計算", use_container_width=True, key="run_book_summary"):
+            with st.spinner("讀取所有組合中..."):
+                try:
+                    books = get_portfolios(current_user()).load_all()
+                except Exception as e:
+                    st.error(f"讀取組合失敗: {e}")
+                else:
+                    books = {name: {**doc, "option_positions": load_positions(doc)} for name, doc in books.items()}
+                    # 目前組合以畫面上尚未寫入的最新內容為準
+                    books[st.session_state.active_portfolio] = {
+                        "etf_lots": etf_lots,
+                        "etf_cost": etf_cost,
+                        "option_positions": st.session_state.option_positions,
+                    }
+                    st.session_state.book_result = evaluate_books(
+                        books, price_grid(center, price_range, PRICE_STEP), center, etf_current
+                    )
+
+        book_result = st.session_state.get("book_result")
+        if book_result is not None:
+            book_frame = pd.DataFrame(book_result.combined_pnl, index=book_result.prices, columns=book_result.names)
+            book_frame["合計"] = book_result.total_pnl
+            st.line_chart(book_frame)
+            center_idx = int(np.abs(book_result.prices - center).argmin())
+            st.dataframe(
+                pd.DataFrame({
+                    "組合": book_frame.columns,
+                    "目前指數損益": book_frame.iloc[center_idx].values,
+                    "最差損益": book_frame.min().values,
+                    "最差指數": book_frame.idxmin().values,
+                }).style.format({"目前指數損益": "{:+,.0f}", "最差損益": "{:+,.0f}", "最差指數": "{:,.0f}"}),
+                use_container_width=True,
+                hide_index=True,
+            )
+
+tracer.phase("組合彙總")
+render_book_summary(center, PRICE_RANGE, etf_lots, etf_cost, etf_current)
+
+# ======== 歷史避險回測 ========
+@st.fragment
+def render_backtest(etf_lots, hedge_ratio):
+    """歷史避險回測；參數調整與執行只重新執行此片段"""
+    with st.expander("📜 歷史避險回測"):
+        bt1, bt2, bt3, bt4 = st.columns(4)
+        with bt1:
+            bt_period = st.selectbox("回測期間", ["3y", "5y", "10y", "max"], index=1, key="bt_period")
+        with bt2:
+            bt_roll_days = st.number_input("轉倉週期 (交易日)", min_value=5, step=1, value=21, key="bt_roll_days")
+        with bt3:
+            bt_spread_pct = st.number_input("價差寬度 (%)", min_value=0.0, step=1.0, value=0.0, format="%.1f", key="bt_spread",
+                                            help="0 = 單買賣權；> 0 = 另外賣出更價外的賣權組成賣權價差")
+        with bt4:
+            bt_vol_markup = st.number_input("波動率加成", min_value=0.5, step=0.05, value=1.1, format="%.2f", key="bt_vol_markup",
+                                            help="權利金以近 20 日實現波動率 × 加成估算")
+    
+        if st.button("▶️ 執行回測", use_container_width=True, key="run_backtest"):
+            with st.spinner("下載歷史資料並回測中..."):
+                index_hist = get_price_history("^TWII", bt_period)
+                etf_hist = get_price_history("00631L.TW", bt_period)
+                if index_hist is None or etf_hist is None:
+                    st.error("無法取得歷史價格")
+                else:
+                    aligned = pd.concat([index_hist, etf_hist], axis=1, join="inner").dropna()
+                    st.session_state.backtest_result = run_backtest(
+                        aligned.index.values,
+                        aligned.iloc[:, 0].values,
+                        aligned.iloc[:, 1].values,
+                        max(etf_lots, 1.0),
+                        hedge_ratios=np.round(np.arange(0.0, 1.0 + 1e-9, 0.05), 2),
+                        strike_offsets=np.round(np.arange(0.0, 0.10 + 1e-9, 0.005), 3),
+                        roll_days=bt_roll_days,
+                        spread_width=bt_spread_pct / 100.0,
+                        vol_markup=bt_vol_markup,
+                    )
+    
+        bt_result = st.session_state.get("backtest_result")
+        if bt_result is not None:
+            ratio_grid, offset_grid = np.meshgrid(bt_result.hedge_ratios, bt_result.strike_offsets, indexing="ij")
+            final_equity = bt_result.hedged_equity[-1]
+            start_equity = bt_result.unhedged_equity[0]
+            summary = pd.DataFrame({
+                "每張避險口數": ratio_grid.ravel(),
+                "價外幅度": offset_grid.ravel(),
+                "總報酬": final_equity.ravel() / start_equity - 1,
+                "最大回撤": bt_result.max_drawdown.ravel(),
+                "避險成本 (元)": bt_result.hedge_cost.ravel(),
+            })
+            summary["報酬/回撤"] = summary["總報酬"] / summary["最大回撤"].where(summary["最大回撤"] > 0)
+        
+            st.caption(
+                f"未避險：總報酬 {bt_result.unhedged_equity[-1] / start_equity - 1:+.1%}，"
+                f"最大回撤 {bt_result.unhedged_max_drawdown:.1%}（共 {len(summary)} 組參數）"
+            )
+            st.dataframe(
+                summary.sort_values("報酬/回撤", ascending=False).head(15).style.format({
+                    "每張避險口數": "{:.2f}",
+                    "價外幅度": "{:.1%}",
+                    "總報酬": "{:+.1%}",
+                    "最大回撤": "{:.1%}",
+                    "避險成本 (元)": "{:,.0f}",
+                    "報酬/回撤": "{:.2f}",
+                }),
+                use_container_width=True,
+                hide_index=True,
+            )
+        
+            # 以目前的避險比例繪製權益曲線
+            ratio_idx = int(np.abs(bt_result.hedge_ratios - hedge_ratio).argmin())
+            offset_idx = st.select_slider(
+                "權益曲線價外幅度",
+                options=list(range(len(bt_result.strike_offsets))),
+                value=len(bt_result.strike_offsets) // 2,
+                format_func=lambda i: f"{bt_result.strike_offsets[i]:.1%}",
+                key="bt_offset_idx",
+            )
+            st.line_chart(pd.DataFrame({
+                "未避險": bt_result.unhedged_equity,
+                f"避險 {bt_result.hedge_ratios[ratio_idx]:.2f} 口/張": bt_result.hedged_equity[:, ratio_idx, offset_idx],
+            }, index=pd.to_datetime(bt_result.dates)))
+
+tracer.phase("歷史回測")
+render_backtest(etf_lots, hedge_ratio)
+
 # ======== 頁尾資訊 ========
+tracer.phase("頁尾")
 st.markdown("---")
 st.markdown(f"""
 <div style='text-align: center; color: #64748b; font-size: 13px;'>
@@ -1047,3 +1548,23 @@ st.markdown(f"""
     <p>資料更新時間: {date.today().strftime('%Y-%m-%d')}</p>
 </div>
 """, unsafe_allow_html=True)
+
+# ======== 效能量測面板 ========
+last_run = tracer.end_run()
+if last_run is not None:
+    with st.sidebar.expander("⏱️ 效能量測", expanded=True):
+        st.caption(f"第 {last_run.run} 次執行，共 {last_run.total * 1000:,.1f} ms")
+        st.dataframe(pd.DataFrame({
+            "階段": ["　" * span.depth + span.name for span in last_run.spans],
+            "ms": [span.seconds * 1000 for span in last_run.spans],
+        }).style.format({"ms": "{:,.1f}"}), use_container_width=True, hide_index=True)
+        phase_stats = tracer.stats()
+        st.caption(f"最近 {len(tracer.history)} 次 (含片段重新執行)")
+        st.dataframe(pd.DataFrame({
+            "名稱": [stat.name for stat in phase_stats],
+            "次數": [stat.runs for stat in phase_stats],
+            "p50 ms": [stat.p50 * 1000 for stat in phase_stats],
+            "p95 ms": [stat.p95 * 1000 for stat in phase_stats],
+        }).style.format({"p50 ms": "{:,.1f}", "p95 ms": "{:,.1f}"}), use_container_width=True, hide_index=True)
+        if tracer.export_path:
+            st.caption(f"每次執行的 span 已附加到 {tracer.export_path}")
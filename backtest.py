@@ -0,0 +1,128 @@
+"""00631L 避險計算器 - 歷史避險回測
+
+以歷史加權指數與 00631L 收盤價重播每日權益：每 roll_days 個交易日轉倉一次，
+依 hedge_ratio × ETF 張數買進價外賣權 (可選擇同時賣出更價外賣權組成價差)。
+歷史選擇權報價不易取得，權利金與每日市值以 Black-Scholes 搭配近期實現波動率估算。
+
+避險損益與口數成正比，因此只需對每個履約價偏移計算一次單口損益序列，
+再乘上所有 hedge_ratio，即可一次算完 (比例 × 偏移) 的整個參數網格。
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from pnl_engine import ETF_SHARES_PER_LOT, OPTION_MULTIPLIER
+from option_pricing import bs_price
+from mc_risk import TRADING_DAYS_PER_YEAR
+
+REALIZED_VOL_WINDOW = 20
+MIN_VOLATILITY = 0.05
+STRIKE_TICK = 100.0
+
+
+class BacktestResult(NamedTuple):
+    """回測結果；hedged_equity 形狀為 (天數, 比例數, 偏移數)"""
+    dates: np.ndarray
+    hedge_ratios: np.ndarray
+    strike_offsets: np.ndarray
+    unhedged_equity: np.ndarray
+    hedged_equity: np.ndarray
+    hedge_cost: np.ndarray  # 累計支付的淨權利金 (比例數, 偏移數)
+    unhedged_max_drawdown: float
+    max_drawdown: np.ndarray  # (比例數, 偏移數)，以比例表示
+
+
+def realized_volatility(closes, window=REALIZED_VOL_WINDOW):
+    """近 window 日的年化實現波動率 (資料不足時以已有資料估算)"""
+    log_ret = np.diff(np.log(closes), prepend=np.log(closes[0]))
+    csum = np.cumsum(log_ret)
+    csum_sq = np.cumsum(log_ret ** 2)
+    idx = np.arange(len(closes))
+    start = np.maximum(idx - window, 0)
+    n = np.maximum(idx - start, 1)
+    mean = (csum - csum[start]) / n
+    var = (csum_sq - csum_sq[start]) / n - mean ** 2
+    vol = np.sqrt(np.maximum(var, 0.0) * TRADING_DAYS_PER_YEAR)
+    return np.maximum(vol, MIN_VOLATILITY)
+
+
+def max_drawdown(equity, axis=0):
+    """最大回撤 (以正比例表示)"""
+    peak = np.maximum.accumulate(equity, axis=axis)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = np.where(peak > 0, 1.0 - equity / peak, 0.0)
+    return drawdown.max(axis=axis)
+
+
+def unit_hedge_pnl(index_closes, strike_offsets, roll_days=21, spread_width=0.0,
+                   vol_markup=1.0, rate=0.0):
+    """每個履約價偏移下，單口 (1 點乘數) 避險部位的累計損益與累計權利金
+
+    回傳 (cum_pnl, cum_premium)，形狀分別為 (天數, 偏移數)。
+    """
+    s = np.asarray(index_closes, dtype=float)
+    offsets = np.asarray(strike_offsets, dtype=float)
+    n_days = len(s)
+    vol = realized_volatility(s) * vol_markup
+
+    # 轉倉日與每日所屬的避險期
+    starts = np.arange(0, n_days - 1, roll_days)
+    ends = np.minimum(starts + roll_days, n_days - 1)
+    period = np.clip((np.arange(n_days) - 1) // roll_days, 0, len(starts) - 1)
+
+    # 每期轉倉時的履約價與權利金 (期數 × 偏移數)
+    s0 = s[starts][:, None]
+    k_long = np.round(s0 * (1.0 - offsets) / STRIKE_TICK) * STRIKE_TICK
+    k_short = np.round(s0 * (1.0 - offsets - spread_width) / STRIKE_TICK) * STRIKE_TICK
+    t0 = ((ends - starts) / TRADING_DAYS_PER_YEAR)[:, None]
+    v0 = vol[starts][:, None]
+    premium = bs_price(s0, k_long, t0, rate, v0, False)
+    if spread_width > 0:
+        premium = premium - bs_price(s0, k_short, t0, rate, v0, False)
+
+    # 每日市值 (天數 × 偏移數)
+    t_left = ((ends[period] - np.arange(n_days)) / TRADING_DAYS_PER_YEAR)[:, None]
+    spot = s[:, None]
+    value = bs_price(spot, k_long[period], t_left, rate, vol[:, None], False)
+    if spread_width > 0:
+        value = value - bs_price(spot, k_short[period], t_left, rate, vol[:, None], False)
+
+    # 已結束各期的實現損益 (到期價值 - 權利金)
+    settle = value[ends]  # 到期日 t_left = 0，即為內含價值
+    realized = np.cumsum(settle - premium, axis=0)
+    realized_before = np.vstack((np.zeros((1, len(offsets))), realized[:-1]))
+
+    cum_pnl = realized_before[period] + value - premium[period]
+    cum_pnl[0] = 0.0
+    cum_premium = np.cumsum(premium, axis=0)[period]
+    cum_premium[0] = 0.0
+    return cum_pnl, cum_premium
+
+
+def run_backtest(dates, index_closes, etf_closes, etf_lots, hedge_ratios, strike_offsets,
+                 roll_days=21, spread_width=0.0, vol_markup=1.0, rate=0.0):
+    """以一次向量化計算回測整個 (hedge_ratio × 履約價偏移) 參數網格"""
+    hedge_ratios = np.asarray(hedge_ratios, dtype=float)
+    strike_offsets = np.asarray(strike_offsets, dtype=float)
+    etf_closes = np.asarray(etf_closes, dtype=float)
+
+    unhedged = etf_closes * etf_lots * ETF_SHARES_PER_LOT
+    cum_pnl, cum_premium = unit_hedge_pnl(
+        index_closes, strike_offsets, roll_days, spread_width, vol_markup, rate
+    )
+
+    # 口數 = hedge_ratio × ETF 張數，每點 50 元
+    contracts = hedge_ratios * etf_lots * OPTION_MULTIPLIER
+    hedged = unhedged[:, None, None] + contracts[None, :, None] * cum_pnl[:, None, :]
+    hedge_cost = contracts[:, None] * cum_premium[-1][None, :]
+
+    return BacktestResult(
+        dates=np.asarray(dates),
+        hedge_ratios=hedge_ratios,
+        strike_offsets=strike_offsets,
+        unhedged_equity=unhedged,
+        hedged_equity=hedged,
+        hedge_cost=hedge_cost,
+        unhedged_max_drawdown=float(max_drawdown(unhedged)),
+        max_drawdown=max_drawdown(hedged),
+    )
@@ -0,0 +1,223 @@
+"""00631L 避險計算器 - 計算熱點效能基準
+
+在不同倉位數 (3 ~ 5,000) 與價格網格點數 (預設 ±1500 / 100 ~ 100,000 點) 下量測：
+倉位損益、00631L 損益、分段線性損益、口數增量更新、試算表建立與上色、損益圖規格。
+結果存成 JSON，可與先前的結果比較，中位數變慢超過門檻即回傳非 0：
+
+    python benchmarks.py --out bench/after.json
+    python benchmarks.py --quick --compare bench/before.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from pnl_engine import etf_pnl_curve, evaluate_legs, positions_to_legs, price_grid
+from payoff_analyzer import build_piecewise_payoff, break_even_points
+from scenario_cache import IncrementalScenario, full_analysis
+from tables import build_scenario_table, style_scenario_table
+from charts import pnl_figure
+from positions import Position, Product, OptionType, Direction
+
+CENTER = 22000.0
+PRICE_RANGE = 1500.0
+ETF_BOOK = (6.5, 180.0, 190.0)  # 張數、成本、現價
+LEG_COUNTS = (3, 50, 500, 5000)
+GRID_POINTS = (31, 1_000, 10_000, 100_000)  # 31 點 = 預設 ±1500 / 100
+QUICK_LEG_COUNTS = (3, 500)
+QUICK_GRID_POINTS = (31, 10_000)
+MAX_MATRIX_ELEMENTS = 10_000_000  # (價格 × 倉位) 達此大小的組合略過 (每個矩陣約 80 MB)
+MAX_FIGURE_LEGS = 50  # 損益圖每個倉位一條曲線，只量到此倉位數
+MAX_STYLED_ROWS = 10_000  # 上色後轉成 HTML 很慢，只量到此列數
+MIN_SECONDS = 0.2
+SAMPLE_SECONDS = 0.002
+MAX_REPEATS = 50
+DEFAULT_THRESHOLD = 0.20
+DEFAULT_OUTPUT = os.path.join("bench", "benchmark_results.json")  # bench/ 不納入版本控制
+
+
+def sample_positions(n, seed=0):
+    """固定亂數種子的倉位組合 (台指 / 微台選擇權與少量微台期貨)"""
+    rng = np.random.default_rng(seed)
+    positions = []
+    for _ in range(n):
+        if rng.random() < 0.1:
+            positions.append(Position.micro_futures(CENTER + rng.integers(-20, 21) * 50, int(rng.integers(1, 4))))
+            continue
+        positions.append(Position(
+            Product.TXO if rng.random() < 0.7 else Product.MICRO_OPTION,
+            OptionType.CALL if rng.random() < 0.5 else OptionType.PUT,
+            Direction.BUY if rng.random() < 0.5 else Direction.SELL,
+            float(CENTER + rng.integers(-40, 41) * 50),
+            int(rng.integers(1, 10)),
+            float(rng.uniform(5.0, 400.0)),
+        ))
+    return positions
+
+
+def grid(points):
+    """以 CENTER 為中心、±PRICE_RANGE 的 points 點網格"""
+    return price_grid(CENTER, PRICE_RANGE, 2 * PRICE_RANGE / (points - 1))
+
+
+def measure(func, min_seconds=MIN_SECONDS, max_repeats=MAX_REPEATS):
+    """先暖身並決定每次取樣的呼叫次數 (每次取樣至少 SAMPLE_SECONDS 秒)，
+    再重複取樣到累計 min_seconds 秒；回傳每次呼叫的秒數統計"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= SAMPLE_SECONDS:
+            break
+        number *= 10
+    samples = []
+    total = 0.0
+    while total < min_seconds and len(samples) < max_repeats:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed / number)
+        total += elapsed
+    samples = np.asarray(samples)
+    return {"median": float(np.median(samples)), "min": float(samples.min()), "repeats": len(samples), "number": number}
+
+
+def cases(leg_counts, grid_points):
+    """(名稱, 要量測的函式) 依序產生；準備資料不計入量測時間"""
+    for n_points in grid_points:
+        prices = grid(n_points)
+        yield f"etf_pnl[points={n_points}]", lambda prices=prices: etf_pnl_curve(prices, CENTER, *ETF_BOOK)
+
+    for n_legs in leg_counts:
+        legs = positions_to_legs(sample_positions(n_legs))
+        yield f"piecewise_payoff[legs={n_legs}]", lambda legs=legs: break_even_points(
+            build_piecewise_payoff(legs, CENTER, *ETF_BOOK)
+        )
+
+        for n_points in grid_points:
+            if n_legs * n_points >= MAX_MATRIX_ELEMENTS:
+                continue
+            prices = grid(n_points)
+            step = 2 * PRICE_RANGE / (n_points - 1)
+            label = f"legs={n_legs},points={n_points}"
+            yield f"position_pnl[{label}]", lambda legs=legs, prices=prices: evaluate_legs(
+                legs, prices, CENTER, *ETF_BOOK
+            )
+
+            analysis = full_analysis(legs, CENTER, *ETF_BOOK, PRICE_RANGE, step)
+            params = (CENTER, *ETF_BOOK, PRICE_RANGE, step)
+            state = IncrementalScenario(analysis, params)
+            bumped = legs.lots.copy()
+            bumped[0] += 1
+            toggled = (legs._asdict() | {"lots": bumped}, legs._asdict())
+
+            def incremental(state=state, toggled=toggled, legs=legs):
+                for fields in toggled:
+                    state.sync(type(legs)(**fields), state.params)
+
+            yield f"incremental_lots[{label}]", incremental
+
+            if n_legs > MAX_FIGURE_LEGS:
+                continue
+            labels = tuple(f"#{i + 1}" for i in range(n_legs))
+            yield f"figure[{label}]", lambda a=analysis, labels=labels: pnl_figure(
+                a.prices, a.etf_pnl, a.option_pnl, a.combined_pnl, None, 0, None,
+                a.break_evens, CENTER, a.leg_pnl, labels,
+            )
+
+    analysis = full_analysis(positions_to_legs(sample_positions(50)), CENTER, *ETF_BOOK, PRICE_RANGE, 100.0)
+    for n_points in grid_points:
+        prices = grid(n_points)
+        pnl = np.interp(prices, analysis.prices, analysis.combined_pnl)
+        yield f"table_build[points={n_points}]", lambda prices=prices, pnl=pnl: build_scenario_table(
+            prices, CENTER, pnl, pnl, pnl
+        )
+        if n_points <= MAX_STYLED_ROWS:
+            frame = build_scenario_table(prices, CENTER, pnl, pnl, pnl)
+            yield f"table_style[points={n_points}]", lambda frame=frame: style_scenario_table(frame).to_html()
+
+
+def run_benchmarks(leg_counts=LEG_COUNTS, grid_points=GRID_POINTS, name_filter=None, min_seconds=MIN_SECONDS):
+    results = {}
+    for name, func in cases(leg_counts, grid_points):
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(func, min_seconds)
+        print(f"{name:<48} {results[name]['median'] * 1000:>12.3f} ms", flush=True)
+    return results
+
+
+def environment():
+    """記錄執行環境，比較結果時參考"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """與基準結果比較，回傳中位數變慢超過 threshold 的 [(名稱, 基準秒數, 目前秒數)]"""
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if current["median"] > before["median"] * (1.0 + threshold):
+            regressions.append((name, before["median"], current["median"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="計算熱點效能基準")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="結果 JSON 路徑")
+    parser.add_argument("--quick", action="store_true", help="只量測較少的倉位數與網格點數")
+    parser.add_argument("--filter", help="只執行名稱包含此字串的項目")
+    parser.add_argument("--min-time", type=float, default=MIN_SECONDS, help="每個項目至少量測的秒數")
+    parser.add_argument("--compare", help="基準結果 JSON，用來檢查效能退步")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允許變慢的比例 (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    leg_counts, grid_points = (QUICK_LEG_COUNTS, QUICK_GRID_POINTS) if args.quick else (LEG_COUNTS, GRID_POINTS)
+    results = run_benchmarks(leg_counts, grid_points, args.filter, args.min_time)
+
+    directory = os.path.dirname(os.path.abspath(args.out))
+    os.makedirs(directory, exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f"變慢: {name} {before * 1000:.3f} ms -> {after * 1000:.3f} ms ({after / before - 1:+.0%})")
+        if regressions:
+            return 1
+        print(f"沒有超過 {args.threshold:.0%} 的效能退步")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""00631L 避險計算器 - 損益曲線圖 (Plotly 圖表規格)
+
+直接由損益陣列組出 Plotly 的 figure dict，在瀏覽器端繪製，可縮放並以滑鼠
+查看各倉位損益。點數過多時先移除線性區段中間的點 (到期損益為分段線性，
+只需保留轉折點)，仍超過上限再以 LTTB 取樣，保留曲線形狀。
+"""
+import numpy as np
+
+MAX_CHART_POINTS = 600
+MAX_HOVER_LEGS = 12
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets 取樣，回傳保留點的索引 (含首尾)"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # 與前一個保留點、下一桶平均點構成的三角形面積最大者
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+
+def shape_preserving_indices(x, series, primary, max_points=MAX_CHART_POINTS):
+    """取樣索引：保留所有曲線的轉折點，超過 max_points 時再依 primary 曲線做 LTTB"""
+    x = np.asarray(x, dtype=float)
+    if len(x) <= max_points:
+        return np.arange(len(x))
+    ys = np.vstack([np.asarray(s, dtype=float) for s in series])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = np.diff(ys, axis=1) / np.diff(x)
+    bend = np.abs(np.diff(slopes, axis=1))
+    tol = 1e-9 * (np.nanmax(np.abs(slopes)) + 1.0)
+    keep = np.concatenate(([True], (bend > tol).any(axis=0), [True]))
+    idx = np.flatnonzero(keep)
+    if len(idx) > max_points:
+        idx = idx[lttb_indices(x[idx], np.asarray(primary, dtype=float)[idx], max_points)]
+    return idx
+
+
+def _line(x, y, name, color, width=2, dash=None, opacity=1.0, **extra):
+    trace = {
+        "type": "scatter",
+        "mode": "lines",
+        "x": x,
+        "y": y,
+        "name": name,
+        "line": {"color": color, "width": width},
+        "opacity": opacity,
+        "hovertemplate": f"{name}: %{{y:+,.0f}}<extra></extra>",
+    }
+    if dash:
+        trace["line"]["dash"] = dash
+    trace.update(extra)
+    return trace
+
+
+def _leg_hover(leg_pnl, leg_labels):
+    """各倉位損益的 customdata 與提示文字 (倉位過多時其餘合併為「其他」)"""
+    leg_pnl = np.asarray(leg_pnl, dtype=float)
+    labels = list(leg_labels)
+    if leg_pnl.shape[1] > MAX_HOVER_LEGS:
+        keep = MAX_HOVER_LEGS - 1
+        leg_pnl = np.column_stack((leg_pnl[:, :keep], leg_pnl[:, keep:].sum(axis=1)))
+        labels = labels[:keep] + [f"其他 {len(labels) - keep} 筆"]
+    lines = "".join(f"<br>  {label}: %{{customdata[{j}]:+,.0f}}" for j, label in enumerate(labels))
+    return np.round(leg_pnl, 0).tolist(), lines
+
+
+def pnl_figure(prices, etf_profits, option_profits, combined_profits, pre_expiry_profits,
+               days_to_expiry, etf_bands, break_evens, center, leg_pnl=None, leg_labels=(),
+               max_points=MAX_CHART_POINTS):
+    """組出損益曲線圖的 Plotly figure dict (None 的曲線不繪製)"""
+    prices = np.asarray(prices, dtype=float)
+    curves = [c for c in (etf_profits, option_profits, combined_profits, pre_expiry_profits) if c is not None]
+    if etf_bands is not None:
+        curves += [etf_bands.p5, etf_bands.p95, etf_bands.mean]
+    idx = shape_preserving_indices(prices, curves, combined_profits, max_points)
+
+    def pick(values):
+        return np.asarray(values, dtype=float)[idx].tolist()
+
+    x = pick(prices)
+    traces = []
+    if etf_profits is not None:
+        traces.append(_line(x, pick(etf_profits), "00631L", "#3b82f6", dash="dash", opacity=0.7))
+    if etf_bands is not None:
+        traces.append(_line(x, pick(etf_bands.p95), "00631L rebalanced 95%", "rgba(59,130,246,0)",
+                            width=0, showlegend=False, hoverinfo="skip"))
+        traces.append(_line(x, pick(etf_bands.p5), "00631L rebalanced 5-95%", "rgba(59,130,246,0)",
+                            width=0, fill="tonexty", fillcolor="rgba(59,130,246,0.12)", hoverinfo="skip"))
+        traces.append(_line(x, pick(etf_bands.mean), "00631L rebalanced mean", "#1d4ed8", width=1.5))
+    if option_profits is not None:
+        traces.append(_line(x, pick(option_profits), "Options", "#f59e0b", dash="dash", opacity=0.7))
+
+    total = _line(x, pick(combined_profits), "Total P/L", "#10b981", width=3)
+    if leg_pnl is not None and len(leg_labels):
+        customdata, lines = _leg_hover(np.asarray(leg_pnl)[idx], leg_labels)
+        total["customdata"] = customdata
+        total["hovertemplate"] = f"Total P/L: %{{y:+,.0f}}{lines}<extra></extra>"
+    traces.append(total)
+
+    if pre_expiry_profits is not None:
+        traces.append(_line(x, pick(pre_expiry_profits), f"Total P/L (T-{days_to_expiry}d)", "#8b5cf6", dash="dot"))
+    if len(break_evens):
+        traces.append({
+            "type": "scatter",
+            "mode": "markers",
+            "x": np.asarray(break_evens, dtype=float).tolist(),
+            "y": [0.0] * len(break_evens),
+            "name": "Break-even",
+            "marker": {"color": "#ef4444", "size": 9},
+            "hovertemplate": "Break-even %{x:,.1f}<extra></extra>",
+        })
+
+    layout = {
+        "title": {"text": "P/L Curve"},
+        "xaxis": {"title": {"text": "Settlement Index"}, "tickformat": ",.0f"},
+        "yaxis": {"title": {"text": "P/L (TWD)"}, "tickformat": ",.0f", "zeroline": False},
+        "hovermode": "x unified",
+        "height": 520,
+        "margin": {"l": 60, "r": 20, "t": 50, "b": 50},
+        "legend": {"orientation": "h", "y": -0.18},
+        "shapes": [
+            {"type": "line", "xref": "paper", "x0": 0, "x1": 1, "y0": 0, "y1": 0,
+             "line": {"color": "gray", "width": 0.5}},
+            {"type": "line", "yref": "paper", "x0": center, "x1": center, "y0": 0, "y1": 1,
+             "line": {"color": "red", "width": 1, "dash": "dash"}, "opacity": 0.5},
+        ],
+        "annotations": [
+            {"x": center, "yref": "paper", "y": 1, "text": f"Current {center:,.0f}", "showarrow": False,
+             "font": {"color": "red", "size": 11}, "yanchor": "bottom"},
+        ],
+    }
+    return {"data": traces, "layout": layout}
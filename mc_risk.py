@@ -0,0 +1,188 @@
+"""00631L 避險計算器 - Monte Carlo 風險值 (VaR / CVaR) 與 00631L 再平衡模擬
+
+加權指數以幾何布朗運動模擬，每條路徑在期末以與損益曲線相同的規則
+(pnl_engine) 評價 00631L + 選擇權 / 期貨組合。路徑依固定大小分塊產生，
+每塊只回傳尾端損益與統計量，因此百萬條路徑也不會佔用大量記憶體；
+分塊可分散到多個行程平行計算，每塊使用獨立且可重現的亂數種子。
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from pnl_engine import ETF_SHARES_PER_LOT, LEVERAGE_00631L, etf_pnl_curve, leg_pnl_matrix
+from option_pricing import DAYS_PER_YEAR, leg_value_pnl_matrix
+
+MC_CHUNK_SIZE = 50_000
+
+
+class RiskReport(NamedTuple):
+    """Monte Carlo 風險結果 (VaR / CVaR 以正數表示虧損金額)"""
+    n_paths: int
+    horizon_days: int
+    confidence: float
+    var: float
+    cvar: float
+    loss_threshold: float
+    breach_prob: float
+    mean_pnl: float
+    std_pnl: float
+
+
+class _ChunkResult(NamedTuple):
+    tail: np.ndarray  # 本塊最差的 k 筆損益 (由小到大)
+    breaches: int
+    total: float
+    total_sq: float
+    count: int
+
+
+def simulate_index(spot, n_paths, horizon_days, sigma, rng, drift=0.0):
+    """模擬 horizon_days 天後的加權指數 (GBM 期末分佈為精確解)"""
+    t = horizon_days / DAYS_PER_YEAR
+    z = rng.standard_normal(n_paths)
+    return spot * np.exp((drift - 0.5 * sigma ** 2) * t + sigma * math.sqrt(t) * z)
+
+
+def book_pnl(spots, legs, base_index, etf_lots, etf_cost, etf_current,
+             days_left=0.0, leg_sigma=0.2, rate=0.0):
+    """組合在一批指數價位的損益：到期時用內含價值，未到期用 Black-Scholes"""
+    etf = etf_pnl_curve(spots, base_index, etf_lots, etf_cost, etf_current)
+    if len(legs) == 0:
+        return etf
+    if days_left <= 0:
+        legs_pnl = leg_pnl_matrix(spots, legs)
+    else:
+        legs_pnl = leg_value_pnl_matrix(spots, legs, days_left, leg_sigma, rate)
+    return etf + legs_pnl.sum(axis=1)
+
+
+def _simulate_chunk(args):
+    """單一分塊：產生路徑、評價組合並化約為尾端樣本與統計量"""
+    (seed, n_paths, tail_k, spot, horizon_days, sigma, drift, legs, book,
+     days_left, leg_sigma, rate, loss_threshold) = args
+    rng = np.random.default_rng(seed)
+    spots = simulate_index(spot, n_paths, horizon_days, sigma, rng, drift)
+    pnl = book_pnl(spots, legs, *book, days_left=days_left, leg_sigma=leg_sigma, rate=rate)
+
+    k = min(tail_k, n_paths)
+    tail = np.sort(np.partition(pnl, k - 1)[:k])
+    return _ChunkResult(
+        tail, int((pnl < -loss_threshold).sum()), float(pnl.sum()), float((pnl ** 2).sum()), n_paths
+    )
+
+
+def run_var(legs, spot, etf_lots, etf_cost, etf_current, *, horizon_days, sigma,
+            n_paths=200_000, confidence=0.99, loss_threshold=0.0, days_to_expiry=None,
+            leg_sigma=None, rate=0.0, drift=0.0, seed=0, chunk_size=MC_CHUNK_SIZE,
+            max_workers=None):
+    """執行 Monte Carlo VaR / CVaR
+
+    days_to_expiry 為 None 或不大於 horizon_days 時，期末以到期內含價值評價
+    (與損益曲線一致)；否則以剩餘天數的 Black-Scholes 價值評價。
+    max_workers=1 時不啟動行程池，直接在目前行程計算。
+    """
+    n_paths = int(n_paths)
+    n_chunks = max(1, math.ceil(n_paths / chunk_size))
+    sizes = [chunk_size] * (n_chunks - 1) + [n_paths - chunk_size * (n_chunks - 1)]
+    # 扣除浮點誤差，避免 1e6 × 0.01 被進位成 10001
+    tail_k = max(1, math.ceil(n_paths * (1.0 - confidence) - 1e-9))
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+
+    days_left = 0.0
+    if days_to_expiry is not None:
+        days_left = max(days_to_expiry - horizon_days, 0.0)
+    book = (spot, etf_lots, etf_cost, etf_current)
+    leg_sigma = sigma if leg_sigma is None else leg_sigma
+    tasks = [
+        (s, size, tail_k, spot, horizon_days, sigma, drift, legs, book,
+         days_left, leg_sigma, rate, loss_threshold)
+        for s, size in zip(seeds, sizes)
+    ]
+
+    if max_workers is None:
+        max_workers = min(n_chunks, os.cpu_count() or 1)
+    if max_workers <= 1 or n_chunks == 1:
+        results = [_simulate_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_simulate_chunk, tasks))
+
+    # 合併各分塊：全體最差 k 筆必定落在各塊最差 k 筆之中
+    tail = np.sort(np.concatenate([r.tail for r in results]))[:tail_k]
+    count = sum(r.count for r in results)
+    mean = sum(r.total for r in results) / count
+    variance = max(sum(r.total_sq for r in results) / count - mean ** 2, 0.0)
+
+    return RiskReport(
+        n_paths=count,
+        horizon_days=int(horizon_days),
+        confidence=float(confidence),
+        var=float(-tail[-1]),
+        cvar=float(-tail.mean()),
+        loss_threshold=float(loss_threshold),
+        breach_prob=sum(r.breaches for r in results) / count,
+        mean_pnl=mean,
+        std_pnl=math.sqrt(variance),
+    )
+
+
+# ======== 00631L 每日再平衡模型 ========
+TRADING_DAYS_PER_YEAR = 245  # 台股年交易日數
+REBALANCE_BLOCK_ELEMENTS = 4_000_000  # 每次向量化處理的 (價位 × 路徑 × 天數) 上限
+
+
+class LeveragedEtfBands(NamedTuple):
+    """各指數價位下 00631L 損益的分佈 (每個欄位長度同價格網格)"""
+    prices: np.ndarray
+    mean: np.ndarray
+    p5: np.ndarray
+    p25: np.ndarray
+    p50: np.ndarray
+    p75: np.ndarray
+    p95: np.ndarray
+
+
+def calendar_to_trading_days(days):
+    """日曆日換算為交易日 (至少 1 天)"""
+    return max(int(round(days * TRADING_DAYS_PER_YEAR / DAYS_PER_YEAR)), 1)
+
+
+def simulate_rebalanced_etf(prices, base_index, etf_lots, etf_cost, etf_current, *,
+                            n_days, sigma, n_paths=10_000, leverage=None, seed=0):
+    """模擬 00631L 每日再平衡後，在各期末指數價位下的損益分佈
+
+    以布朗橋產生「期末指數固定為該價位」的每日路徑：對數報酬的條件分佈為
+    平均分攤的總報酬加上去除均值的雜訊，雜訊與期末價位無關，
+    因此所有價位共用同一組雜訊，只需產生一次 (路徑 × 天數) 的亂數。
+    ETF 淨值為每日 (1 + 槓桿 × 指數日報酬) 的連乘。
+    """
+    prices = np.asarray(prices, dtype=float)
+    leverage = LEVERAGE_00631L if leverage is None else leverage
+    if etf_lots <= 0 or base_index <= 0:
+        zeros = np.zeros_like(prices)
+        return LeveragedEtfBands(prices, *([zeros] * 6))
+
+    rng = np.random.default_rng(seed)
+    daily_sigma = sigma / math.sqrt(TRADING_DAYS_PER_YEAR)
+    noise = rng.standard_normal((n_paths, n_days)) * daily_sigma
+    noise -= noise.mean(axis=1, keepdims=True)
+
+    # 每一價位的平均日對數報酬 (價位 0 為 -inf，對應 ETF 淨值歸零)
+    with np.errstate(divide="ignore"):
+        drift = np.log(prices / base_index) / n_days
+    growth = np.empty((len(prices), n_paths))
+    block = max(1, REBALANCE_BLOCK_ELEMENTS // (n_paths * n_days))
+    for start in range(0, len(prices), block):
+        stop = start + block
+        log_ret = drift[start:stop, None, None] + noise[None, :, :]
+        daily_etf = np.maximum(1.0 + leverage * np.expm1(log_ret), 0.0)
+        with np.errstate(divide="ignore"):
+            growth[start:stop] = np.exp(np.log(daily_etf).sum(axis=2))
+
+    shares = etf_lots * ETF_SHARES_PER_LOT
+    pnl = (etf_current * growth - etf_cost) * shares
+    p5, p25, p50, p75, p95 = np.percentile(pnl, [5, 25, 50, 75, 95], axis=1)
+    return LeveragedEtfBands(prices, pnl.mean(axis=1), p5, p25, p50, p75, p95)
@@ -0,0 +1,235 @@
+"""00631L 避險計算器 - Black-Scholes 到期前估值與 Greeks (NumPy 向量化)"""
+from typing import NamedTuple
+
+import numpy as np
+from scipy.special import ndtr
+
+DAYS_PER_YEAR = 365.0
+
+
+def bs_price(spot, strike, t, rate, sigma, is_call, div_yield=0.0):
+    """歐式選擇權 Black-Scholes 理論價，所有參數皆可廣播"""
+    spot = np.asarray(spot, dtype=float)
+    strike = np.asarray(strike, dtype=float)
+    t = np.maximum(np.asarray(t, dtype=float), 0.0)
+    sigma = np.asarray(sigma, dtype=float)
+
+    sig_t = sigma * np.sqrt(t)
+    fwd_s = spot * np.exp(-div_yield * t)
+    pv_k = strike * np.exp(-rate * t)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(fwd_s / pv_k) + 0.5 * sig_t ** 2) / sig_t
+    # 到期或零波動：退化為折現後的內含價值
+    d1 = np.where(sig_t > 0, d1, np.where(fwd_s > pv_k, np.inf, -np.inf))
+    d2 = d1 - sig_t
+
+    call = fwd_s * ndtr(d1) - pv_k * ndtr(d2)
+    # 買賣權平價求賣權
+    put = call - fwd_s + pv_k
+    return np.where(is_call, call, put)
+
+
+def leg_value_pnl_matrix(prices, legs, days_to_expiry, sigma, rate=0.0):
+    """計算 (價格 × 倉位) 在到期前某一天的理論損益矩陣
+
+    sigma 可為單一波動率或每個倉位各自的波動率陣列。
+    """
+    prices = np.asarray(prices, dtype=float)
+    t = max(float(days_to_expiry), 0.0) / DAYS_PER_YEAR
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=float), legs.strike.shape)
+
+    spot = prices[:, None]
+    value = bs_price(spot, legs.strike[None, :], t, rate, sigma[None, :], legs.is_call[None, :])
+    # 期貨以指數現價評價 (不考慮基差)
+    value = np.where(legs.is_futures, spot - legs.strike, value)
+    return (value - legs.premium) * (legs.sign * legs.lots * legs.multiplier)
+
+
+def bs_vega(spot, strike, t, rate, sigma, div_yield=0.0):
+    """Black-Scholes vega (每 1.00 波動率變動的價格變化)"""
+    spot = np.asarray(spot, dtype=float)
+    t = np.maximum(np.asarray(t, dtype=float), 0.0)
+    sig_t = np.asarray(sigma, dtype=float) * np.sqrt(t)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(spot / strike) + (rate - div_yield) * t + 0.5 * sig_t ** 2) / sig_t
+    pdf = np.exp(-0.5 * d1 ** 2) / np.sqrt(2.0 * np.pi)
+    vega = spot * np.exp(-div_yield * t) * pdf * np.sqrt(t)
+    return np.where(sig_t > 0, vega, 0.0)
+
+
+# ======== 隱含波動率 ========
+IV_LOWER = 1e-4
+IV_UPPER = 5.0
+IV_MAX_ITER = 60
+IV_TOL = 1e-6  # 價格誤差容忍 (點)
+IV_CACHE_MAX = 4096
+
+_iv_cache = {}
+
+
+def implied_vol_batch(target, spot, strike, t, rate, is_call, div_yield=0.0):
+    """一次反推整批倉位的隱含波動率
+
+    以陣列 Newton 迭代求解，步出區間或 vega 過小時改用二分法。
+    價格不在無套利區間內 (例如權利金低於內含價值) 的倉位回傳 NaN。
+    """
+    target, spot, strike, is_call = np.broadcast_arrays(
+        np.asarray(target, dtype=float),
+        np.asarray(spot, dtype=float),
+        np.asarray(strike, dtype=float),
+        np.asarray(is_call, dtype=bool),
+    )
+    t = float(t)
+    if target.size == 0 or t <= 0:
+        return np.full(target.shape, np.nan)
+
+    # 無套利上下界
+    fwd_s = spot * np.exp(-div_yield * t)
+    pv_k = strike * np.exp(-rate * t)
+    lower_bound = np.where(is_call, np.maximum(fwd_s - pv_k, 0.0), np.maximum(pv_k - fwd_s, 0.0))
+    upper_bound = np.where(is_call, fwd_s, pv_k)
+    valid = (target > lower_bound) & (target < upper_bound)
+
+    lo = np.full(target.shape, IV_LOWER)
+    hi = np.full(target.shape, IV_UPPER)
+    # Brenner-Subrahmanyam 近似作為起始值
+    sigma = np.clip(np.sqrt(2.0 * np.pi / t) * target / spot, IV_LOWER, IV_UPPER)
+    active = valid.copy()
+
+    for _ in range(IV_MAX_ITER):
+        if not active.any():
+            break
+        price = bs_price(spot, strike, t, rate, sigma, is_call, div_yield)
+        diff = price - target
+        active &= np.abs(diff) > IV_TOL
+
+        # 價格對波動率單調遞增，依誤差方向縮小區間
+        hi = np.where(active & (diff > 0), sigma, hi)
+        lo = np.where(active & (diff < 0), sigma, lo)
+
+        vega = bs_vega(spot, strike, t, rate, sigma, div_yield)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            newton = sigma - diff / vega
+        use_newton = (vega > 1e-8) & (newton > lo) & (newton < hi)
+        step = np.where(use_newton, newton, 0.5 * (lo + hi))
+        sigma = np.where(active, step, sigma)
+
+    return np.where(valid, sigma, np.nan)
+
+
+def implied_vols_cached(legs, spot, days_to_expiry, rate=0.0):
+    """取得每個倉位的隱含波動率，已解過的 (履約價, 類型, 權利金, 指數) 直接讀快取
+
+    期貨倉位與無法求解的倉位回傳 NaN。
+    """
+    t_key = round(float(days_to_expiry), 6)
+    spot_key = round(float(spot), 4)
+    rate_key = round(float(rate), 8)
+    keys = [
+        (float(k), bool(c), float(p), spot_key, t_key, rate_key)
+        for k, c, p in zip(legs.strike, legs.is_call, legs.premium)
+    ]
+
+    ivs = np.full(len(keys), np.nan)
+    missing = []
+    for i, key in enumerate(keys):
+        if legs.is_futures[i]:
+            continue
+        if key in _iv_cache:
+            ivs[i] = _iv_cache[key]
+        else:
+            missing.append(i)
+
+    if missing:
+        idx = np.array(missing)
+        solved = implied_vol_batch(
+            legs.premium[idx], spot, legs.strike[idx],
+            days_to_expiry / DAYS_PER_YEAR, rate, legs.is_call[idx],
+        )
+        ivs[idx] = solved
+        # 簡單 FIFO 淘汰，避免快取無限成長
+        while len(_iv_cache) + len(idx) > IV_CACHE_MAX and _iv_cache:
+            _iv_cache.pop(next(iter(_iv_cache)))
+        for i, iv in zip(missing, solved):
+            _iv_cache[keys[i]] = float(iv)
+
+    return ivs
+
+
+# ======== Greeks ========
+GREEK_NAMES = ("delta", "gamma", "vega", "theta")
+
+
+class Greeks(NamedTuple):
+    """Greeks (單位皆為新台幣)
+
+    delta: 指數每漲 1 點的損益；gamma: 指數每漲 1 點的 delta 變化；
+    vega: 波動率每升 1% 的損益；theta: 每經過 1 天的損益。
+    """
+    delta: np.ndarray
+    gamma: np.ndarray
+    vega: np.ndarray
+    theta: np.ndarray
+
+
+def bs_unit_greeks(spot, strike, t, rate, sigma, is_call, div_yield=0.0):
+    """單位 (1 點乘數、多方 1 口) 選擇權的 Greeks，所有參數皆可廣播"""
+    spot = np.asarray(spot, dtype=float)
+    strike = np.asarray(strike, dtype=float)
+    t = np.maximum(np.asarray(t, dtype=float), 0.0)
+    sigma = np.asarray(sigma, dtype=float)
+
+    sqrt_t = np.sqrt(t)
+    sig_t = sigma * sqrt_t
+    df_q = np.exp(-div_yield * t)
+    df_r = np.exp(-rate * t)
+    live = sig_t > 0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(spot * df_q / (strike * df_r)) + 0.5 * sig_t ** 2) / sig_t
+        d1 = np.where(live, d1, np.where(spot * df_q > strike * df_r, np.inf, -np.inf))
+        d2 = d1 - sig_t
+        pdf = np.exp(-0.5 * d1 ** 2) / np.sqrt(2.0 * np.pi)
+
+        call_delta = df_q * ndtr(d1)
+        delta = np.where(is_call, call_delta, call_delta - df_q)
+        gamma = np.where(live, df_q * pdf / (spot * sig_t), 0.0)
+        vega = np.where(live, spot * df_q * pdf * sqrt_t / 100.0, 0.0)
+
+        decay = np.where(live, -spot * df_q * pdf * sigma / (2.0 * sqrt_t), 0.0)
+        call_theta = decay - rate * strike * df_r * ndtr(d2) + div_yield * spot * df_q * ndtr(d1)
+        put_theta = decay + rate * strike * df_r * ndtr(-d2) - div_yield * spot * df_q * ndtr(-d1)
+        theta = np.where(live, np.where(is_call, call_theta, put_theta), 0.0) / DAYS_PER_YEAR
+
+    return Greeks(delta, gamma, vega, theta)
+
+
+def leg_greeks(spot, legs, days_to_expiry, sigma, rate=0.0):
+    """計算每個倉位的 Greeks (已乘上方向、口數與乘數)
+
+    spot 可為單一指數或指數陣列，結果形狀為 spot.shape + (倉位數,)。
+    """
+    spot = np.asarray(spot, dtype=float)[..., None]
+    t = max(float(days_to_expiry), 0.0) / DAYS_PER_YEAR
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=float), legs.strike.shape)
+
+    unit = bs_unit_greeks(spot, legs.strike, t, rate, sigma, legs.is_call)
+    # 期貨 delta 固定為 1，其餘 Greeks 為 0
+    scale = legs.sign * legs.lots * legs.multiplier
+    return Greeks(*(
+        np.where(legs.is_futures, float(name == "delta"), value) * scale
+        for name, value in zip(GREEK_NAMES, unit)
+    ))
+
+
+def portfolio_greeks(per_leg):
+    """將每個倉位的 Greeks 以一次加總合併為組合 Greeks"""
+    return Greeks(*np.stack(per_leg).sum(axis=-1))
+
+
+def contracts_to_target(net_delta, target_delta, unit_delta):
+    """使淨 Delta 達到目標所需的口數 (依 unit_delta 的方向建立部位)"""
+    if unit_delta == 0:
+        return 0.0
+    return (target_delta - net_delta) / unit_delta
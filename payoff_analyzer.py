@@ -0,0 +1,129 @@
+"""00631L 避險計算器 - 到期損益的精確分段線性分析
+
+到期時 00631L (線性近似) 加上選擇權、期貨的總損益為分段線性函數，
+轉折點只出現在選擇權履約價。排序履約價後以累加斜率即可得到完整表示，
+不需要密集取樣。
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from pnl_engine import etf_index_delta, etf_pnl_curve
+
+
+class PiecewisePayoff(NamedTuple):
+    """分段線性損益 (定義域為指數 >= 0)
+
+    breakpoints[0] 固定為 0；slopes[i] 為 [breakpoints[i], breakpoints[i+1])
+    區段的斜率 (元/點)，slopes[-1] 為最後一個轉折點右側的斜率。
+    """
+    breakpoints: np.ndarray
+    values: np.ndarray
+    slopes: np.ndarray
+
+
+class PayoffExtremes(NamedTuple):
+    """區間內的最大獲利與最大虧損 (無上限時為 ±inf)"""
+    max_profit: float
+    max_profit_at: float
+    max_loss: float
+    max_loss_at: float
+
+
+def build_piecewise_payoff(legs, base_index, etf_lots, etf_cost, etf_current):
+    """由履約價建立精確分段線性損益，複雜度 O(倉位數 log 倉位數)"""
+    weight = legs.sign * legs.lots * legs.multiplier
+    is_option = ~legs.is_futures
+
+    # 指數為 0 時的損益：買權價值 0、賣權價值 K、期貨為 -K
+    value_at_zero = np.where(
+        legs.is_futures, -legs.strike, np.where(legs.is_put, legs.strike, 0.0)
+    ) - legs.premium
+    start_value = float((value_at_zero * weight).sum())
+    start_value += float(etf_pnl_curve([0.0], base_index, etf_lots, etf_cost, etf_current)[0])
+
+    # 最左段斜率：賣權 -1、期貨 +1 (再乘上權重)，加上 ETF 的 Delta
+    start_slope = float(np.where(legs.is_futures, weight, np.where(legs.is_put, -weight, 0.0)).sum())
+    start_slope += etf_index_delta(base_index, etf_lots, etf_current)
+
+    # 每個履約價的斜率跳升量 (買權、賣權皆為 +權重)
+    strikes = legs.strike[is_option]
+    keep = strikes > 0
+    kinks, inverse = np.unique(strikes[keep], return_inverse=True)
+    jumps = np.bincount(inverse, weights=weight[is_option][keep], minlength=len(kinks))
+
+    breakpoints = np.concatenate(([0.0], kinks))
+    slopes = start_slope + np.concatenate(([0.0], np.cumsum(jumps)))
+    values = start_value + np.concatenate(([0.0], np.cumsum(slopes[:-1] * np.diff(breakpoints))))
+    return PiecewisePayoff(breakpoints, values, slopes)
+
+
+def evaluate_piecewise(payoff, prices):
+    """在任意價格計算分段線性損益 (最後一個轉折點右側以尾端斜率外插)"""
+    prices = np.asarray(prices, dtype=float)
+    idx = np.clip(np.searchsorted(payoff.breakpoints, prices, side="right") - 1, 0, None)
+    return payoff.values[idx] + payoff.slopes[idx] * (prices - payoff.breakpoints[idx])
+
+
+def break_even_points(payoff):
+    """精確的損益兩平指數 (由小到大)"""
+    x, y, m = payoff.breakpoints, payoff.values, payoff.slopes
+    roots = list(x[y == 0])
+
+    # 區段內變號：線性內插求根
+    seg = (y[:-1] * y[1:]) < 0
+    roots.extend(x[:-1][seg] - y[:-1][seg] / m[:-1][seg])
+
+    # 最右側區段：斜率與端點損益方向相反時仍會穿越零點
+    if y[-1] * m[-1] < 0:
+        roots.append(x[-1] - y[-1] / m[-1])
+
+    return np.unique(np.asarray(roots, dtype=float))
+
+
+def payoff_extremes(payoff, lower=None, upper=None):
+    """區間 [lower, upper] 內的最大獲利與最大虧損
+
+    upper 為 None 時考慮指數無上限，尾端斜率不為 0 即回傳 ±inf。
+    """
+    lower = 0.0 if lower is None else max(float(lower), 0.0)
+    inside = payoff.breakpoints > lower
+    if upper is not None:
+        inside &= payoff.breakpoints < upper
+    candidates = [[lower], payoff.breakpoints[inside]]
+    if upper is not None:
+        candidates.append([float(upper)])
+    candidates = np.concatenate(candidates)
+    values = evaluate_piecewise(payoff, candidates)
+
+    hi_i, lo_i = int(np.argmax(values)), int(np.argmin(values))
+    max_profit, max_profit_at = float(values[hi_i]), float(candidates[hi_i])
+    max_loss, max_loss_at = float(values[lo_i]), float(candidates[lo_i])
+
+    if upper is None:
+        if payoff.slopes[-1] > 0:
+            max_profit, max_profit_at = np.inf, np.inf
+        elif payoff.slopes[-1] < 0:
+            max_loss, max_loss_at = -np.inf, np.inf
+
+    return PayoffExtremes(max_profit, max_profit_at, max_loss, max_loss_at)
+
+
+def payoff_segments(payoff, lower, upper):
+    """列出區間內每一段的起訖指數與斜率"""
+    inside = (payoff.breakpoints > lower) & (payoff.breakpoints < upper)
+    edges = np.concatenate(([lower], payoff.breakpoints[inside], [upper]))
+    idx = np.clip(np.searchsorted(payoff.breakpoints, edges[:-1], side="right") - 1, 0, None)
+    return edges[:-1], edges[1:], payoff.slopes[idx]
+
+
+def strike_grid(legs, lower, upper, step):
+    """與口數無關的取樣點：均勻格點 + 區間內所有選擇權履約價
+
+    到期損益只在履約價轉折，這些點之間皆為直線；口數改變時格點不變，
+    可沿用每個倉位 1 口的損益向量做增量更新。
+    """
+    uniform = np.arange(lower, upper + 1e-6, step)
+    strikes = legs.strike[~legs.is_futures]
+    strikes = strikes[(strikes >= lower) & (strikes <= upper)]
+    return np.unique(np.concatenate((uniform, strikes)))
@@ -0,0 +1,156 @@
+"""00631L 避險計算器 - Firebase 延遲寫入 (write-behind)
+
+按鈕與側邊欄變更只把最新文件放進有界佇列，背景執行緒在防抖時間內合併
+連續修改，與上次寫入的內容比對後只以 update() 送出有變動的子路徑。
+程式結束時會把最後一筆修改寫完。
+"""
+import atexit
+import copy
+import queue
+import threading
+import time
+
+DEBOUNCE_SECONDS = 0.5
+MAX_PENDING = 32
+
+
+def _as_mapping(value):
+    """list 以索引為鍵轉成 dict (與 Firebase 儲存陣列的方式相同)"""
+    if isinstance(value, list):
+        return {str(i): v for i, v in enumerate(value)}
+    return value
+
+
+def diff_paths(old, new, prefix=""):
+    """比較兩份文件，回傳 {子路徑: 新值} (刪除的欄位為 None)"""
+    old_map, new_map = _as_mapping(old), _as_mapping(new)
+    if not isinstance(old_map, dict) or not isinstance(new_map, dict):
+        return {} if old == new else {prefix: copy.deepcopy(new)}
+
+    changes = {}
+    for key in new_map:
+        path = f"{prefix}/{key}" if prefix else str(key)
+        if key not in old_map:
+            changes[path] = copy.deepcopy(new_map[key])
+        else:
+            changes.update(diff_paths(old_map[key], new_map[key], path))
+    for key in old_map:
+        if key not in new_map:
+            changes[f"{prefix}/{key}" if prefix else str(key)] = None
+    return changes
+
+
+class WriteBehindWriter:
+    """合併短時間內的多次修改，於背景以差異更新寫入"""
+
+    def __init__(self, ref, debounce=DEBOUNCE_SECONDS, max_pending=MAX_PENDING):
+        self.ref = ref
+        self.debounce = debounce
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._persisted = None
+        # 以序號追蹤寫入進度：被合併掉的舊文件視同已由較新的文件寫入
+        self._progress = threading.Condition()
+        self._submitted = 0
+        self._written = 0
+        self._closed = False
+        self.last_error = None
+        self.writes = 0
+        self._thread = threading.Thread(target=self._run, name="firebase-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def prime(self, document):
+        """設定目前資料庫中的內容 (載入資料後呼叫)，作為差異比對基準
+
+        writer 由同一組合的所有 session 共用，has_pending 時呼叫會蓋掉其他 session 尚未寫入的差異。
+        """
+        self._persisted = copy.deepcopy(document)
+
+    def submit(self, document):
+        """排入最新文件 (不阻塞)"""
+        if self._closed:
+            return
+        with self._progress:
+            self._submitted += 1
+            item = (self._submitted, copy.deepcopy(document))
+        self._put_latest(item)
+
+    def _put_latest(self, item):
+        """放入佇列 (不阻塞)；佇列已滿時丟棄最舊的一筆，反正只需最新狀態"""
+        while True:
+            try:
+                self._pending.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._pending.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            # 防抖：在時間窗內持續收集，只保留最後一筆
+            stop = False
+            deadline = time.monotonic() + self.debounce
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    newer = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if newer is None:
+                    stop = True
+                    break
+                item = newer
+            seq, document = item
+            self._write(document)
+            with self._progress:
+                self._written = max(self._written, seq)
+                self._progress.notify_all()
+            if stop:
+                break
+
+    def _write(self, document):
+        try:
+            if self._persisted is None:
+                self.ref.set(document)
+            else:
+                changes = diff_paths(self._persisted, document)
+                if not changes:
+                    return
+                if "" in changes:
+                    self.ref.set(document)
+                else:
+                    self.ref.update(changes)
+            self._persisted = document
+            self.writes += 1
+            self.last_error = None
+        except Exception as e:
+            # 保留舊的比對基準，下次寫入會包含這次沒送出的變動
+            self.last_error = e
+
+    @property
+    def has_pending(self):
+        """是否還有尚未寫入的修改"""
+        with self._progress:
+            return self._written < self._submitted
+
+    def flush(self, timeout=None):
+        """等待目前已排入的修改全部寫入；逾時回傳 False"""
+        with self._progress:
+            target = self._submitted
+            return self._progress.wait_for(lambda: self._written >= target, timeout)
+
+    def close(self, timeout=10.0):
+        """寫完最後一筆修改後停止背景執行緒"""
+        if self._closed:
+            return
+        self._closed = True
+        # 不可阻塞：佇列已滿時 (例如寫入卡住) atexit 會一直等待
+        self._put_latest(None)
+        self._thread.join(timeout)
@@ -0,0 +1,159 @@
+"""00631L 避險計算器 - 損益計算引擎 (NumPy 向量化)"""
+from typing import NamedTuple
+
+import numpy as np
+
+# ======== 商品常數 ========
+OPTION_MULTIPLIER = 50.0  # 台指選擇權每點 50 元
+MICRO_OPTION_MULTIPLIER = 10.0  # 微台選擇權每點 10 元
+ETF_SHARES_PER_LOT = 1000  # 1張 = 1000股
+LEVERAGE_00631L = 2.0  # 00631L 為 2 倍槓桿 ETF
+
+
+class LegArrays(NamedTuple):
+    """倉位欄位陣列 (每個元素對應一個倉位)"""
+    strike: np.ndarray
+    lots: np.ndarray
+    premium: np.ndarray
+    multiplier: np.ndarray
+    sign: np.ndarray  # 買進 +1 / 賣出、做空 -1
+    is_call: np.ndarray
+    is_put: np.ndarray
+    is_futures: np.ndarray
+
+    def __len__(self):
+        return len(self.strike)
+
+
+class ScenarioResult(NamedTuple):
+    """一組價格網格上的損益結果"""
+    prices: np.ndarray
+    legs: LegArrays
+    leg_pnl: np.ndarray  # 形狀 (價格數, 倉位數)
+    option_pnl: np.ndarray
+    etf_pnl: np.ndarray
+    combined_pnl: np.ndarray
+
+
+def positions_to_legs(positions):
+    """將 Position 列表轉為欄位陣列，只在每次重算時轉換一次"""
+    n = len(positions)
+    strike = np.fromiter((p.strike for p in positions), float, n)
+    lots = np.fromiter((p.lots for p in positions), float, n)
+    multiplier = np.fromiter((p.multiplier for p in positions), float, n)
+    sign = np.fromiter((p.sign for p in positions), float, n)
+    is_call = np.fromiter((p.is_call for p in positions), bool, n)
+    is_futures = np.fromiter((p.is_futures for p in positions), bool, n)
+    is_put = ~(is_call | is_futures)
+    # 期貨無權利金
+    premium = np.where(is_futures, 0.0, np.fromiter((p.premium for p in positions), float, n))
+    return LegArrays(strike, lots, premium, multiplier, sign, is_call, is_put, is_futures)
+
+
+def leg_pnl_matrix(prices, legs):
+    """計算 (價格 × 倉位) 到期損益矩陣，一次廣播完成"""
+    prices = np.asarray(prices, dtype=float)
+    # 結算價 - 履約價 (期貨為 結算價 - 進場價)
+    diff = prices[:, None] - legs.strike[None, :]
+    # 買權取 max(S-K, 0)、賣權取 max(K-S, 0)，期貨維持線性
+    payoff_dir = np.where(legs.is_call, 1.0, -1.0)
+    value = np.maximum(diff * payoff_dir, 0.0)
+    value = np.where(legs.is_futures, diff, value)
+    # 損益 = 方向 × (到期價值 - 權利金) × 口數 × 乘數
+    return (value - legs.premium) * (legs.sign * legs.lots * legs.multiplier)
+
+
+def etf_pnl_curve(prices, base_index, etf_lots, etf_cost, etf_current):
+    """計算 00631L 在各指數價位下的損益 (線性 2 倍槓桿近似)"""
+    prices = np.asarray(prices, dtype=float)
+    if etf_lots <= 0 or base_index <= 0:
+        return np.zeros_like(prices)
+
+    # 00631L 是 2 倍槓桿，價格變動 = 指數變動 × 2
+    etf_price_change_pct = (prices - base_index) / base_index * LEVERAGE_00631L
+    new_etf_price = etf_current * (1 + etf_price_change_pct)
+
+    # 計算損益 = (新價格 - 成本) × 股數
+    shares = etf_lots * ETF_SHARES_PER_LOT
+    return (new_etf_price - etf_cost) * shares
+
+
+def etf_index_delta(base_index, etf_lots, etf_current):
+    """00631L 持股的等值指數 Delta (指數每漲 1 點的損益，元)"""
+    if etf_lots <= 0 or base_index <= 0:
+        return 0.0
+    shares = etf_lots * ETF_SHARES_PER_LOT
+    return shares * etf_current * LEVERAGE_00631L / base_index
+
+
+def price_grid(center, price_range, price_step):
+    """建立以 center 為中心的模擬價格網格"""
+    offsets = np.arange(-price_range, price_range + 1e-6, price_step)
+    return center + offsets
+
+
+def evaluate_legs(legs, prices, base_index, etf_lots, etf_cost, etf_current):
+    """以已轉換的倉位陣列計算價格網格上的各項損益"""
+    prices = np.asarray(prices, dtype=float)
+    leg_pnl = leg_pnl_matrix(prices, legs)
+    option_pnl = leg_pnl.sum(axis=1)
+    etf_pnl = etf_pnl_curve(prices, base_index, etf_lots, etf_cost, etf_current)
+    return ScenarioResult(prices, legs, leg_pnl, option_pnl, etf_pnl, etf_pnl + option_pnl)
+
+
+def evaluate_scenario(positions, prices, base_index, etf_lots, etf_cost, etf_current):
+    """計算整組倉位在價格網格上的各項損益"""
+    legs = positions_to_legs(positions)
+    return evaluate_legs(legs, prices, base_index, etf_lots, etf_cost, etf_current)
+
+
+# ======== 多投資組合彙總 ========
+class BookResult(NamedTuple):
+    """多個投資組合在同一價格網格上的損益，矩陣形狀皆為 (價格數, 組合數)"""
+    prices: np.ndarray
+    names: list
+    option_pnl: np.ndarray
+    etf_pnl: np.ndarray
+    combined_pnl: np.ndarray
+
+    @property
+    def total_pnl(self):
+        """所有組合合計"""
+        return self.combined_pnl.sum(axis=1)
+
+
+def etf_pnl_matrix(prices, base_index, etf_lots, etf_cost, etf_current):
+    """多組 00631L 持股 (etf_lots、etf_cost 為陣列) 的損益矩陣 (價格數, 組合數)"""
+    prices = np.asarray(prices, dtype=float)
+    etf_lots = np.asarray(etf_lots, dtype=float)
+    etf_cost = np.asarray(etf_cost, dtype=float)
+    if base_index <= 0:
+        return np.zeros((len(prices), len(etf_lots)))
+    new_etf_price = etf_current * (1 + (prices - base_index) / base_index * LEVERAGE_00631L)
+    shares = np.where(etf_lots > 0, etf_lots, 0.0) * ETF_SHARES_PER_LOT
+    return (new_etf_price[:, None] - etf_cost[None, :]) * shares[None, :]
+
+
+def evaluate_books(books, prices, base_index, etf_current):
+    """一次計算所有投資組合的到期損益
+
+    books 為 {名稱: 倉位文件}，option_positions 為 Position 列表。所有組合的
+    倉位合併成一組陣列，只算一次 (價格 × 倉位) 損益矩陣，再以歸屬矩陣加總回各組合。
+    """
+    names = list(books)
+    positions, owner = [], []
+    for i, name in enumerate(names):
+        book_positions = books[name].get("option_positions") or []
+        positions.extend(book_positions)
+        owner.extend([i] * len(book_positions))
+
+    prices = np.asarray(prices, dtype=float)
+    legs = positions_to_legs(positions)
+    membership = np.zeros((len(legs), len(names)))
+    membership[np.arange(len(legs)), owner] = 1.0
+    option_pnl = leg_pnl_matrix(prices, legs) @ membership
+
+    etf_lots = [float(books[name].get("etf_lots") or 0.0) for name in names]
+    etf_cost = [float(books[name].get("etf_cost") or 0.0) for name in names]
+    etf_pnl = etf_pnl_matrix(prices, base_index, etf_lots, etf_cost, etf_current)
+    return BookResult(prices, names, option_pnl, etf_pnl, option_pnl + etf_pnl)
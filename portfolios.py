@@ -0,0 +1,98 @@
+"""00631L 避險計算器 - 多投資組合 (每位使用者各自的路徑)
+
+資料庫結構為 {根路徑}/{使用者}/{組合名稱} = 倉位文件。畫面只載入目前選取的
+組合；組合清單以淺層查詢取得，彙總時才一次讀取該使用者的整個節點。
+"""
+import threading
+import time
+
+from persistence import WriteBehindWriter
+
+DEFAULT_USER = "default"
+DEFAULT_PORTFOLIO = "主帳戶"
+NAMES_TTL_SECONDS = 30.0
+
+# Firebase 鍵不允許 . $ # [ ] /；email 中的 . 依慣例改為 ,
+_KEY_TRANSLATION = str.maketrans({".": ",", "$": "_", "#": "_", "[": "_", "]": "_", "/": "_"})
+
+
+def safe_key(name):
+    """把使用者或組合名稱轉為合法的資料庫鍵"""
+    key = str(name).strip().translate(_KEY_TRANSLATION)
+    if not key:
+        raise ValueError("名稱不可為空白")
+    return key
+
+
+class PortfolioRepository:
+    """單一使用者的所有投資組合；子路徑的儲存物件與延遲寫入在行程內共用"""
+
+    def __init__(self, root, user=DEFAULT_USER, legacy=None, clock=time.monotonic):
+        self.user = safe_key(user)
+        self.node = root.child(self.user)
+        self.legacy = legacy
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._stores = {}
+        self._writers = {}
+        self._names = None
+        self._names_at = 0.0
+
+    def names(self, refresh=False):
+        """組合名稱 (短暫快取)；預設使用者沒有任何組合時先匯入舊版單一倉位"""
+        with self._lock:
+            expired = self.clock() - self._names_at >= NAMES_TTL_SECONDS
+            if refresh or self._names is None or expired:
+                self._names = self.node.keys()
+                self._names_at = self.clock()
+                if not self._names and self.user == DEFAULT_USER and self._migrate_legacy():
+                    self._names = [DEFAULT_PORTFOLIO]
+            return list(self._names)
+
+    def _migrate_legacy(self):
+        if self.legacy is None:
+            return False
+        try:
+            document = self.legacy.get()
+        finally:
+            self.legacy.close()
+        self.legacy = None
+        if not document:
+            return False
+        self.store(DEFAULT_PORTFOLIO).set(document)
+        return True
+
+    def store(self, name):
+        """組合的儲存物件 (第一次讀寫時才連線)"""
+        key = safe_key(name)
+        with self._lock:
+            if key not in self._stores:
+                self._stores[key] = self.node.child(key)
+            return self._stores[key]
+
+    def writer(self, name):
+        """組合的背景延遲寫入"""
+        key = safe_key(name)
+        store = self.store(key)
+        with self._lock:
+            if key not in self._writers:
+                self._writers[key] = WriteBehindWriter(store)
+            return self._writers[key]
+
+    def create(self, name, document):
+        """新增組合並立即寫入；名稱 (轉成鍵後) 已存在時丟出 ValueError，不覆蓋原有資料"""
+        key = safe_key(name)
+        with self._lock:
+            if key in self.names(refresh=True):
+                raise ValueError(f"組合「{key}」已存在")
+            self.store(key).set(document)
+            if self._names is not None and key not in self._names:
+                self._names = sorted(self._names + [key])
+        return key
+
+    def load_all(self):
+        """一次讀取所有組合 {名稱: 倉位文件}"""
+        data = self.node.get() or {}
+        if isinstance(data, list):
+            data = {str(i): v for i, v in enumerate(data)}
+        return {name: document for name, document in sorted(data.items()) if isinstance(document, dict)}
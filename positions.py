@@ -0,0 +1,125 @@
+"""00631L 避險計算器 - 倉位資料模型
+
+倉位以 __slots__ dataclass 搭配列舉表示，產品、類型、方向只在載入時由
+字串轉換一次，計算與畫面直接使用屬性，不再比對字串。
+
+儲存格式以 schema_version 標示版本。舊版資料 (沒有 product 欄位、期貨
+方向不一致等) 在載入時轉換為目前版本，之後寫回即不再需要轉換。
+"""
+from dataclasses import dataclass
+from enum import Enum
+
+from pnl_engine import OPTION_MULTIPLIER, MICRO_OPTION_MULTIPLIER
+
+SCHEMA_VERSION = 2
+
+
+class Product(str, Enum):
+    TXO = "台指"
+    MICRO_OPTION = "微台"
+    MICRO_FUTURES = "微台期貨"
+
+    @property
+    def multiplier(self):
+        return OPTION_MULTIPLIER if self is Product.TXO else MICRO_OPTION_MULTIPLIER
+
+
+class OptionType(str, Enum):
+    CALL = "Call"
+    PUT = "Put"
+    FUTURES = "Futures"
+
+    @property
+    def label(self):
+        return {"Call": "買權", "Put": "賣權", "Futures": ""}[self.value]
+
+
+class Direction(str, Enum):
+    BUY = "買進"
+    SELL = "賣出"
+    SHORT = "做空"
+
+
+@dataclass(slots=True)
+class Position:
+    """單一倉位 (期貨的 strike 為進場價)"""
+    product: Product
+    type: OptionType
+    direction: Direction
+    strike: float
+    lots: int
+    premium: float = 0.0
+
+    @property
+    def is_futures(self):
+        return self.type is OptionType.FUTURES
+
+    @property
+    def is_call(self):
+        return self.type is OptionType.CALL
+
+    @property
+    def multiplier(self):
+        return self.product.multiplier
+
+    @property
+    def sign(self):
+        return 1.0 if self.direction is Direction.BUY else -1.0
+
+    @classmethod
+    def micro_futures(cls, entry_price, lots):
+        """微台期貨固定做空，無權利金"""
+        return cls(Product.MICRO_FUTURES, OptionType.FUTURES, Direction.SHORT, float(entry_price), int(lots))
+
+    @classmethod
+    def from_record(cls, record):
+        """由目前版本的儲存格式建立"""
+        return cls(
+            Product(record["product"]),
+            OptionType(record["type"]),
+            Direction(record["direction"]),
+            float(record["strike"]),
+            int(record["lots"]),
+            float(record.get("premium", 0.0)),
+        )
+
+    def to_record(self):
+        return {
+            "product": self.product.value,
+            "type": self.type.value,
+            "direction": self.direction.value,
+            "strike": self.strike,
+            "lots": self.lots,
+            "premium": self.premium,
+        }
+
+
+def migrate_record(record):
+    """把任一版本的倉位紀錄轉為目前版本"""
+    product = record.get("product") or "台指"
+    if product == "微台期貨" or record.get("type") == "Futures":
+        return Position.micro_futures(record["strike"], record["lots"]).to_record()
+    return Position(
+        Product(product),
+        OptionType(record["type"]),
+        Direction(record["direction"]),
+        float(record["strike"]),
+        int(record["lots"]),
+        float(record.get("premium", 0.0)),
+    ).to_record()
+
+
+def migrate_document(document):
+    """轉換整份倉位文件，回傳 (新文件, 是否有轉換)；已是目前版本時原樣回傳"""
+    if document.get("schema_version") == SCHEMA_VERSION:
+        return document, False
+    migrated = dict(document)
+    migrated["option_positions"] = [migrate_record(r) for r in document.get("option_positions") or [] if r]
+    migrated["schema_version"] = SCHEMA_VERSION
+    return migrated, True
+
+
+def load_positions(document):
+    """由 (任一版本的) 倉位文件建立 Position 列表"""
+    document, _ = migrate_document(document)
+    return [Position.from_record(r) for r in document.get("option_positions") or [] if r]
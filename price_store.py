@@ -0,0 +1,213 @@
+"""00631L 避險計算器 - 本機價格資料庫 (SQLite)
+
+日收盤價以 (ticker, 日期) 為鍵存放於 data/prices.sqlite，只向 Yahoo Finance
+抓取比已存資料更新的 K 棒；報價另存一張表並記錄抓取時間，重新整理時
+只需清除報價，不影響歷史資料。
+"""
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta
+
+import pandas as pd
+
+DEFAULT_STORE_PATH = os.path.join("data", "prices.sqlite")
+QUOTE_FETCH_PERIOD = "5d"
+MARKET_CLOSE = dt_time(13, 30)  # 台股收盤時間
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    close REAL NOT NULL,
+    PRIMARY KEY (ticker, date)
+);
+CREATE TABLE IF NOT EXISTS backfills (
+    ticker TEXT PRIMARY KEY,
+    start TEXT  -- 已向前補抓到的起始日期，NULL 代表已抓過全部 (period="max")
+);
+CREATE TABLE IF NOT EXISTS quotes (
+    ticker TEXT PRIMARY KEY,
+    price REAL NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+def yahoo_fetcher(ticker, start=None, end=None, period=None):
+    """從 Yahoo Finance 抓取日收盤價，回傳以日期為索引的 Series"""
+    import yfinance as yf
+
+    if start is not None:
+        hist = yf.Ticker(ticker).history(start=start, end=end)
+    else:
+        hist = yf.Ticker(ticker).history(period=period or "max")
+    if hist.empty:
+        return pd.Series(dtype=float)
+    closes = hist["Close"].dropna()
+    if closes.index.tz is not None:
+        closes.index = closes.index.tz_localize(None)
+    closes.index = closes.index.normalize()
+    return closes
+
+
+def period_start(period, today=None):
+    """將 "5y"、"6mo"、"max" 等期間換算為起始日期 (max 回傳 None)"""
+    today = today or date.today()
+    if period == "max":
+        return None
+    if period.endswith("mo"):
+        return today - timedelta(days=31 * int(period[:-2]))
+    if period.endswith("y"):
+        return today - timedelta(days=366 * int(period[:-1]))
+    if period.endswith("d"):
+        return today - timedelta(days=int(period[:-1]))
+    raise ValueError(f"不支援的期間: {period}")
+
+
+class PriceStore:
+    """以 SQLite 儲存的日收盤價與報價快取"""
+
+    def __init__(self, path=DEFAULT_STORE_PATH, fetcher=yahoo_fetcher):
+        self.path = path
+        self.fetcher = fetcher
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # 每次操作各自開連線，可安全地在 Streamlit 多執行緒中使用
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ======== K 棒 ========
+    def date_range(self, ticker):
+        """已存資料的 (最早, 最晚) 日期，無資料時為 (None, None)"""
+        with self._connect() as conn:
+            first, last = conn.execute(
+                "SELECT MIN(date), MAX(date) FROM bars WHERE ticker = ?", (ticker,)
+            ).fetchone()
+        if first is None:
+            return None, None
+        return date.fromisoformat(first), date.fromisoformat(last)
+
+    def backfilled(self, ticker, start):
+        """是否已向前補抓過涵蓋 start 的資料 (start 為 None 代表全部期間)
+
+        補抓後仍早於最早 K 棒的部分是商品上市前，不需要每次重抓。
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT start FROM backfills WHERE ticker = ?", (ticker,)).fetchone()
+        if row is None:
+            return False
+        if row[0] is None:
+            return True
+        return start is not None and date.fromisoformat(row[0]) <= start
+
+    def mark_backfilled(self, ticker, start):
+        """記錄已補抓到 start (保留涵蓋範圍較大的紀錄)"""
+        if self.backfilled(ticker, start):
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO backfills VALUES (?, ?)",
+                (ticker, None if start is None else start.isoformat()),
+            )
+
+    def upsert(self, ticker, closes):
+        """寫入 (或覆蓋) 一批日收盤價"""
+        rows = [(ticker, pd.Timestamp(d).date().isoformat(), float(c)) for d, c in closes.items()]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def history(self, ticker, start=None):
+        """從磁碟讀取日收盤價 Series (不連網)"""
+        query = "SELECT date, close FROM bars WHERE ticker = ?"
+        params = [ticker]
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(start.isoformat())
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY date", params).fetchall()
+        index = pd.to_datetime([r[0] for r in rows])
+        return pd.Series([r[1] for r in rows], index=index, name=ticker, dtype=float)
+
+    def sync(self, ticker, period=QUOTE_FETCH_PERIOD):
+        """增量更新：只抓取最後一根 K 棒之後的資料 (最後一根重抓以更新收盤價)
+
+        尚無資料時抓取 period 期間。回傳寫入筆數，網路失敗時回傳 0。
+        """
+        _, last = self.date_range(ticker)
+        try:
+            if last is None:
+                closes = self.fetcher(ticker, period=period)
+            else:
+                closes = self.fetcher(ticker, start=last)
+        except Exception:
+            return 0
+        return self.upsert(ticker, closes) if len(closes) else 0
+
+    def ensure_history(self, ticker, period):
+        """確保磁碟上有 period 期間的資料：往前補齊缺少的舊資料 (同一範圍只補抓一次)，再往後增量更新"""
+        start = period_start(period)
+        first, last = self.date_range(ticker)
+        if first is None:
+            try:
+                closes = self.fetcher(ticker, start=start, period=period)
+                self.upsert(ticker, closes)
+                self.mark_backfilled(ticker, start)
+            except Exception:
+                pass
+        else:
+            if (start is None or start < first) and not self.backfilled(ticker, start):
+                try:
+                    if start is None:
+                        older = self.fetcher(ticker, period="max")
+                    else:
+                        older = self.fetcher(ticker, start=start, end=first)
+                    self.upsert(ticker, older[older.index < pd.Timestamp(first)])
+                    self.mark_backfilled(ticker, start)
+                except Exception:
+                    pass
+            self.sync(ticker)
+        return self.history(ticker, start)
+
+    # ======== 報價 ========
+    def cached_quote(self, ticker):
+        """最後已知報價 (price, fetched_at, 是否來自報價表)
+
+        報價表沒有資料時退回最後一根 K 棒的收盤價 (時間以該日收盤計)，
+        完全沒有資料時回傳 None。
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT price, fetched_at FROM quotes WHERE ticker = ?", (ticker,)
+            ).fetchone()
+            if row is not None:
+                return row[0], row[1], True
+            last = conn.execute(
+                "SELECT date, close FROM bars WHERE ticker = ? ORDER BY date DESC LIMIT 1", (ticker,)
+            ).fetchone()
+        if last is None:
+            return None
+        closed_at = datetime.combine(date.fromisoformat(last[0]), MARKET_CLOSE).timestamp()
+        return last[1], closed_at, False
+
+    def save_quote(self, ticker, price, fetched_at=None):
+        """記錄最新報價與抓取時間"""
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO quotes VALUES (?, ?, ?)", (ticker, float(price), fetched_at))
+
+    def invalidate_quotes(self):
+        """清除報價快取 (歷史 K 棒與最後收盤價保留)"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM quotes")
@@ -0,0 +1,247 @@
+"""00631L 避險計算器 - 報價服務
+
+一次批次抓取 ^TWII 與 00631L.TW，整體受時間預算限制；連續失敗達門檻時
+斷路器開啟，冷卻期間不再連網。任何失敗都回傳最後一次成功的報價與其時間，
+由畫面顯示報價已過多久。抓取函式可替換，方便以假資料或本機服務測試。
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import NamedTuple
+
+import pandas as pd
+
+INDEX_TICKER = "^TWII"
+ETF_TICKER = "00631L.TW"
+QUOTE_TICKERS = (INDEX_TICKER, ETF_TICKER)
+
+QUOTE_TTL_SECONDS = 300
+FETCH_BUDGET_SECONDS = 3.0
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 60.0
+
+SOURCE_CACHE = "快取"
+SOURCE_LIVE = "即時"
+SOURCE_STALE = "離線備援"
+
+
+class Quote(NamedTuple):
+    """單一商品報價；fetched_at 為取得該價格的時間 (epoch 秒)"""
+    price: float
+    fetched_at: float
+    source: str
+
+    def age(self, now=None):
+        return (time.time() if now is None else now) - self.fetched_at
+
+
+class QuoteSnapshot(NamedTuple):
+    """一次取價的結果"""
+    quotes: dict  # ticker -> Quote 或 None
+    latency: float  # 本次取價耗時 (秒)
+    error: str  # 失敗原因，成功時為空字串
+    circuit_open: bool
+
+
+def yahoo_batch_fetch(tickers):
+    """以一次 yf.download 抓取多檔商品近 5 日收盤價，回傳 {ticker: Series}"""
+    import yfinance as yf
+
+    data = yf.download(
+        list(tickers), period="5d", progress=False, threads=True, group_by="column",
+        auto_adjust=False, timeout=FETCH_BUDGET_SECONDS,
+    )
+    if data.empty:
+        return {}
+    closes = data["Close"]
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(tickers[0])
+    if closes.index.tz is not None:
+        closes.index = closes.index.tz_localize(None)
+    closes.index = closes.index.normalize()
+    return {t: closes[t].dropna() for t in tickers if t in closes}
+
+
+class CircuitBreaker:
+    """連續失敗 threshold 次後開啟，cooldown 秒後允許再試一次"""
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN_SECONDS, clock=time.time):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.open_until = 0.0
+
+    @property
+    def is_open(self):
+        return self.failures >= self.threshold and self.clock() < self.open_until
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.open_until = self.clock() + self.cooldown
+
+
+class QuoteService:
+    """具時間預算、斷路器與過期備援的批次報價服務"""
+
+    def __init__(self, store, fetch_batch=yahoo_batch_fetch, tickers=QUOTE_TICKERS,
+                 budget=FETCH_BUDGET_SECONDS, ttl=QUOTE_TTL_SECONDS, breaker=None, clock=time.time):
+        self.store = store
+        self.fetch_batch = fetch_batch
+        self.tickers = tuple(tickers)
+        self.budget = budget
+        self.ttl = ttl
+        self.clock = clock
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        # 抓取在背景執行緒進行；同時只有一次抓取 (由 _lock 保證)，逾時的抓取連同其執行緒
+        # 一起放棄，改用新的執行緒池，卡住的連線不會佔住之後的抓取
+        self._executor = self._new_executor()
+        self._lock = threading.Lock()
+        self.abandoned = 0
+
+    @staticmethod
+    def _new_executor():
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="quote-fetch")
+
+    def _abandon(self, future):
+        """放棄逾時的抓取：取消尚未開始的工作，執行中的留給舊執行緒池自行結束"""
+        future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._new_executor()
+        self.abandoned += 1
+
+    def _cached(self, allow_stale):
+        quotes = {}
+        now = self.clock()
+        for ticker in self.tickers:
+            cached = self.store.cached_quote(ticker)
+            if cached is None:
+                quotes[ticker] = None
+                continue
+            price, fetched_at, from_quote = cached
+            if from_quote and now - fetched_at < self.ttl:
+                quotes[ticker] = Quote(price, fetched_at, SOURCE_CACHE)
+            elif allow_stale:
+                quotes[ticker] = Quote(price, fetched_at, SOURCE_STALE)
+            else:
+                quotes[ticker] = None
+        return quotes
+
+    def get(self, force=False):
+        """取得所有商品報價：未過期直接讀快取，否則在時間預算內批次連網"""
+        start = self.clock()
+        if not force:
+            fresh = self._cached(allow_stale=False)
+            if all(q is not None for q in fresh.values()):
+                return QuoteSnapshot(fresh, 0.0, "", self.breaker.is_open)
+
+        with self._lock:
+            if self.breaker.is_open:
+                return QuoteSnapshot(self._cached(allow_stale=True), 0.0, "斷路器開啟，暫停連網", True)
+
+            error = ""
+            future = None
+            try:
+                future = self._executor.submit(self.fetch_batch, self.tickers)
+                closes = future.result(timeout=self.budget)
+                missing = [t for t in self.tickers if t not in closes or closes[t].empty]
+                if missing:
+                    raise ValueError(f"缺少報價: {', '.join(missing)}")
+            except FutureTimeout:
+                self._abandon(future)
+                error = f"逾時 ({self.budget:.1f} 秒)"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+            if error:
+                self.breaker.record_failure()
+                quotes = self._cached(allow_stale=True)
+            else:
+                self.breaker.record_success()
+                now = self.clock()
+                quotes = {}
+                for ticker in self.tickers:
+                    self.store.upsert(ticker, closes[ticker])
+                    price = float(closes[ticker].iloc[-1])
+                    self.store.save_quote(ticker, price, now)
+                    quotes[ticker] = Quote(price, now, SOURCE_LIVE)
+
+        return QuoteSnapshot(quotes, self.clock() - start, error, self.breaker.is_open)
+
+
+# ======== 行程共用的背景報價更新 ========
+REFRESH_INTERVAL_SECONDS = 60.0
+
+
+class QuoteRefresher:
+    """背景執行緒定期取價，並把結果發佈為記憶體中的共用快照
+
+    所有 session 只讀取 snapshot()，不做任何 I/O；多個 session 同時要求
+    重新整理時只會觸發一次取價。
+    """
+
+    def __init__(self, service, interval=REFRESH_INTERVAL_SECONDS):
+        self.service = service
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._published = threading.Condition()
+        self._generation = 0
+        self._force = False
+        self._thread = None
+        # 先以磁碟上的最後報價建立初始快照 (不連網)
+        self._snapshot = QuoteSnapshot(service._cached(allow_stale=True), 0.0, "", False)
+        self.published_at = service.clock()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="quote-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._published:
+                force, self._force = self._force, False
+                self._wake.clear()
+            try:
+                snapshot = self.service.get(force=force)
+            except Exception as e:
+                snapshot = self._snapshot._replace(error=str(e) or type(e).__name__)
+            with self._published:
+                self._snapshot = snapshot
+                self.published_at = self.service.clock()
+                self._generation += 1
+                self._published.notify_all()
+            self._wake.wait(self.interval)
+
+    def snapshot(self):
+        """目前的共用報價快照 (不做 I/O)"""
+        return self._snapshot
+
+    def age(self):
+        """快照發佈至今的秒數"""
+        return self.service.clock() - self.published_at
+
+    def request_refresh(self, force=True, wait=None):
+        """要求立即取價；多個請求會合併為下一次取價
+
+        wait 為秒數時，最多等待該次取價發佈後回傳最新快照。
+        """
+        with self._published:
+            target = self._generation + 1
+            self._force = self._force or force
+            self._wake.set()
+            if wait:
+                self._published.wait_for(lambda: self._generation >= target, timeout=wait)
+        return self._snapshot
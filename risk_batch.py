@@ -0,0 +1,221 @@
+"""00631L 避險計算器 - 批次風險計算 (不需啟動 Streamlit)
+
+讀取一或多個與 hedge_positions.json 相同格式的倉位文件，計算價格網格上的
+到期損益、Greeks、到期損益極值與 Monte Carlo VaR，輸出 CSV 或 Parquet。
+每個檔案在獨立行程中計算，可用於每日收盤後批次檢查所有帳戶，或單獨剖析計算引擎：
+
+    python risk_batch.py 帳戶A.json 帳戶B.json --index 22000 --out risk_out
+    python risk_batch.py data/*.json --index 22000 --format parquet --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from pnl_engine import etf_index_delta, positions_to_legs
+from payoff_analyzer import evaluate_piecewise, payoff_extremes
+from option_pricing import leg_greeks, portfolio_greeks, implied_vols_cached
+from mc_risk import run_var
+from positions import load_positions
+from scenario_cache import full_analysis
+
+OUTPUT_FORMATS = ("csv", "parquet")
+
+
+class BatchSettings(NamedTuple):
+    """所有檔案共用的評價參數 (與畫面側邊欄的預設值相同)"""
+    index: float
+    etf_price: float = None  # None 時使用文件中的 etf_current_price
+    price_range: float = 1500.0
+    price_step: float = 100.0
+    days_to_expiry: float = 7.0
+    volatility: float = 0.20
+    rate: float = 0.015
+    implied_vol: bool = False
+    mc_paths: int = 100_000  # 0 代表不計算 VaR
+    mc_horizon: int = None  # None 時等於距到期天數
+    confidence: float = 0.99
+    seed: int = 0
+
+
+class PortfolioRisk(NamedTuple):
+    """單一倉位文件的計算結果"""
+    name: str
+    summary: dict
+    scenarios: pd.DataFrame
+    legs: pd.DataFrame
+
+
+def evaluate_document(document, settings, name=""):
+    """計算單一倉位文件的情境損益、Greeks 與風險指標"""
+    positions = load_positions(document)
+    center = float(settings.index)
+    etf_lots = float(document.get("etf_lots", 0.0))
+    etf_current = float(settings.etf_price or document.get("etf_current_price", 0.0))
+    etf_cost = float(document.get("etf_cost") or etf_current)
+
+    analysis = full_analysis(
+        positions_to_legs(positions), center, etf_lots, etf_cost, etf_current,
+        settings.price_range, settings.price_step,
+    )
+    legs = analysis.legs
+
+    leg_volatility = settings.volatility
+    if settings.implied_vol and len(legs):
+        leg_iv = implied_vols_cached(legs, center, settings.days_to_expiry, settings.rate)
+        leg_volatility = np.where(np.isnan(leg_iv), settings.volatility, leg_iv)
+    per_leg = leg_greeks(center, legs, settings.days_to_expiry, leg_volatility, settings.rate)
+    book_greeks = portfolio_greeks(per_leg)
+    etf_delta = etf_index_delta(center, etf_lots, etf_current)
+
+    lower = max(center - settings.price_range, 0.0)
+    window = payoff_extremes(analysis.payoff, lower, center + settings.price_range)
+    overall = payoff_extremes(analysis.payoff)
+    summary = {
+        "portfolio": name,
+        "index": center,
+        "etf_lots": etf_lots,
+        "positions": len(positions),
+        "pnl_at_index": float(evaluate_piecewise(analysis.payoff, center)),
+        "window_max_profit": window.max_profit,
+        "window_max_profit_at": window.max_profit_at,
+        "window_max_loss": window.max_loss,
+        "window_max_loss_at": window.max_loss_at,
+        "expiry_max_loss": overall.max_loss,
+        "break_evens": " ".join(f"{p:.1f}" for p in analysis.break_evens),
+        "etf_delta": etf_delta,
+        "option_delta": float(book_greeks.delta),
+        "net_delta": etf_delta + float(book_greeks.delta),
+        "gamma": float(book_greeks.gamma),
+        "vega": float(book_greeks.vega),
+        "theta": float(book_greeks.theta),
+    }
+
+    if settings.mc_paths > 0:
+        horizon = settings.mc_horizon or max(int(settings.days_to_expiry), 1)
+        # 已在外層以行程池平行處理多個檔案，VaR 本身不再開行程池
+        report = run_var(
+            legs, center, etf_lots, etf_cost, etf_current,
+            horizon_days=horizon,
+            sigma=settings.volatility,
+            n_paths=settings.mc_paths,
+            confidence=settings.confidence,
+            days_to_expiry=settings.days_to_expiry,
+            leg_sigma=leg_volatility,
+            rate=settings.rate,
+            seed=settings.seed,
+            max_workers=1,
+        )
+        summary.update(var=report.var, cvar=report.cvar, mc_mean=report.mean_pnl, mc_std=report.std_pnl)
+
+    scenarios = pd.DataFrame({
+        "portfolio": name,
+        "settlement": analysis.prices,
+        "change": analysis.prices - center,
+        "etf_pnl": analysis.etf_pnl,
+        "option_pnl": analysis.option_pnl,
+        "total_pnl": analysis.combined_pnl,
+    })
+    leg_table = pd.DataFrame({
+        "portfolio": name,
+        "product": [p.product.value for p in positions],
+        "type": [p.type.value for p in positions],
+        "direction": [p.direction.value for p in positions],
+        "strike": legs.strike,
+        "lots": legs.lots,
+        "premium": legs.premium,
+        "volatility": np.broadcast_to(leg_volatility, legs.strike.shape),
+        **{greek: np.asarray(value) for greek, value in per_leg._asdict().items()},
+    })
+    return PortfolioRisk(name, summary, scenarios, leg_table)
+
+
+def evaluate_file(path, settings):
+    """讀取並計算單一檔案 (行程池的工作單位)"""
+    with open(path, encoding="utf-8") as f:
+        document = json.load(f)
+    return evaluate_document(document, settings, os.path.splitext(os.path.basename(path))[0])
+
+
+def evaluate_files(paths, settings, max_workers=None):
+    """以行程池平行計算多個檔案，結果依輸入順序排列；max_workers=1 時在目前行程計算"""
+    paths = list(paths)
+    if max_workers is None:
+        max_workers = min(len(paths), os.cpu_count() or 1)
+    if max_workers <= 1 or len(paths) <= 1:
+        return [evaluate_file(path, settings) for path in paths]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(evaluate_file, paths, [settings] * len(paths)))
+
+
+def write_results(results, out_dir, fmt="csv"):
+    """輸出 summary、scenarios、legs 三個表格，回傳寫出的檔案路徑"""
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"不支援的輸出格式: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+    tables = {
+        "summary": pd.DataFrame([r.summary for r in results]),
+        "scenarios": pd.concat([r.scenarios for r in results], ignore_index=True),
+        "legs": pd.concat([r.legs for r in results], ignore_index=True),
+    }
+    written = []
+    for table_name, frame in tables.items():
+        path = os.path.join(out_dir, f"{table_name}.{fmt}")
+        if fmt == "parquet":
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False, encoding="utf-8-sig")  # 加 BOM 讓 Excel 正確顯示中文
+        written.append(path)
+    return written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批次計算倉位文件的情境損益、Greeks 與風險值")
+    parser.add_argument("files", nargs="+", help="倉位文件 (hedge_positions.json 格式)")
+    parser.add_argument("--index", type=float, required=True, help="目前加權指數")
+    parser.add_argument("--etf-price", type=float, help="00631L 現價 (預設使用文件中的現價)")
+    parser.add_argument("--range", dest="price_range", type=float, default=1500.0, help="模擬範圍 ±點數")
+    parser.add_argument("--step", dest="price_step", type=float, default=100.0, help="價格網格間距")
+    parser.add_argument("--days", dest="days_to_expiry", type=float, default=7.0, help="距到期天數")
+    parser.add_argument("--vol", type=float, default=20.0, help="年化波動率 (%%)")
+    parser.add_argument("--rate", type=float, default=1.5, help="無風險利率 (%%)")
+    parser.add_argument("--implied-vol", action="store_true", help="以權利金反推各倉位隱含波動率")
+    parser.add_argument("--mc-paths", type=int, default=100_000, help="Monte Carlo 路徑數 (0 = 不計算 VaR)")
+    parser.add_argument("--mc-horizon", type=int, help="VaR 模擬天數 (預設為距到期天數)")
+    parser.add_argument("--confidence", type=float, default=0.99, help="VaR 信賴水準")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    parser.add_argument("--out", default="risk_output", help="輸出目錄")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv", help="輸出格式")
+    parser.add_argument("--workers", type=int, help="平行行程數 (預設為 CPU 核心數)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = BatchSettings(
+        index=args.index,
+        etf_price=args.etf_price,
+        price_range=args.price_range,
+        price_step=args.price_step,
+        days_to_expiry=args.days_to_expiry,
+        volatility=args.vol / 100.0,
+        rate=args.rate / 100.0,
+        implied_vol=args.implied_vol,
+        mc_paths=args.mc_paths,
+        mc_horizon=args.mc_horizon,
+        confidence=args.confidence,
+        seed=args.seed,
+    )
+    results = evaluate_files(args.files, settings, args.workers)
+    for path in write_results(results, args.out, args.format):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
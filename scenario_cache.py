@@ -0,0 +1,254 @@
+"""00631L 避險計算器 - 情境計算結果快取
+
+以正規化後的倉位陣列與參數計算內容雜湊作為鍵，保存價格網格、分段線性損益
+與各項損益陣列。快取在行程內共用，依最近使用順序 (LRU) 淘汰並限制總記憶體。
+
+到期損益對口數為線性，因此另外保存每個倉位 1 口的損益向量：只改變單一倉位
+口數、新增或刪除一個倉位時，以 IncrementalScenario 做一次向量加減即可更新總損益。
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+
+from pnl_engine import LegArrays, positions_to_legs, leg_pnl_matrix, etf_pnl_curve
+from payoff_analyzer import build_piecewise_payoff, break_even_points, strike_grid
+
+SCENARIO_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class ScenarioAnalysis(NamedTuple):
+    """一組倉位與參數的到期損益計算結果 (放入快取後陣列皆為唯讀)"""
+    payoff: tuple  # PiecewisePayoff
+    prices: np.ndarray
+    break_evens: np.ndarray
+    legs: LegArrays
+    unit_pnl: np.ndarray  # 每個倉位 1 口的損益，形狀 (價格數, 倉位數)
+    option_pnl: np.ndarray
+    etf_pnl: np.ndarray
+    combined_pnl: np.ndarray
+
+    @property
+    def leg_pnl(self):
+        """各倉位損益 (價格數, 倉位數)，需要明細時才展開"""
+        return self.unit_pnl * self.legs.lots
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    entries: int
+    nbytes: int
+
+
+def _arrays(value):
+    """走訪 NamedTuple 取出其中所有 ndarray"""
+    if isinstance(value, np.ndarray):
+        yield value
+    elif isinstance(value, tuple):
+        for item in value:
+            yield from _arrays(item)
+
+
+def scenario_key(legs, *params):
+    """倉位陣列與參數的內容雜湊 (倉位以 positions_to_legs 轉成的數值陣列表示)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for array in legs:
+        digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(b"|")
+    digest.update(np.asarray(params, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+class ScenarioCache:
+    """有記憶體上限的 LRU 快取，記錄命中與未命中次數"""
+
+    def __init__(self, max_bytes=SCENARIO_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        arrays = {id(a): a for a in _arrays(value)}  # 同一陣列可能出現在多個欄位
+        nbytes = sum(a.nbytes for a in arrays.values())
+        if nbytes > self.max_bytes:
+            return
+        for array in arrays.values():
+            array.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(self.hits, self.misses, len(self._entries), self.nbytes)
+
+
+scenario_cache = ScenarioCache()
+
+
+def _unit_legs(legs):
+    """口數皆為 1 的同一組倉位"""
+    fields = legs._asdict()
+    fields["lots"] = np.ones(len(legs))
+    return LegArrays(**fields)
+
+
+def _contracts(legs):
+    """除口數外的倉位內容 (倉位數, 欄位數)，用來判斷倉位是否相同"""
+    return np.column_stack((legs.strike, legs.premium, legs.multiplier, legs.sign, legs.is_call, legs.is_futures))
+
+
+def _take(legs, index):
+    return LegArrays(*(array[index] for array in legs))
+
+
+class IncrementalScenario:
+    """可增量更新的到期損益 (每個 session 一份)
+
+    保存每個倉位 1 口的損益向量與目前的選擇權總損益。價格網格只由均勻格點與
+    履約價組成、與口數無關，因此口數變動只需 option_pnl += 單位向量 × 口數差，
+    成本為 O(價格數)，不必重算整個 (價格 × 倉位) 矩陣。
+    """
+
+    def __init__(self, analysis, params):
+        self.params = params
+        self.prices = analysis.prices
+        self.legs = analysis.legs
+        self.unit_pnl = analysis.unit_pnl  # 只整批替換，不就地修改 (可能與快取共用)
+        self.etf_pnl = analysis.etf_pnl
+        self.option_pnl = analysis.option_pnl.copy()
+        self._contracts = _contracts(analysis.legs)
+
+    def _set_lots(self, index, lots):
+        delta = lots - self.legs.lots[index]
+        if delta:
+            self.option_pnl += self.unit_pnl[:, index] * delta
+
+    def _append(self, leg):
+        """新增一個倉位；履約價不在網格上時回傳 False (需重算網格)"""
+        lower, upper = self.prices[0], self.prices[-1]
+        strike = leg.strike[0]
+        if not leg.is_futures[0] and lower <= strike <= upper and not np.isin(strike, self.prices):
+            return False
+        unit = leg_pnl_matrix(self.prices, _unit_legs(leg))
+        self.option_pnl += unit[:, 0] * leg.lots[0]
+        self.unit_pnl = np.column_stack((self.unit_pnl, unit))
+        return True
+
+    def _remove(self, index):
+        self.option_pnl -= self.unit_pnl[:, index] * self.legs.lots[index]
+        self.unit_pnl = np.delete(self.unit_pnl, index, axis=1)
+
+    def sync(self, legs, params):
+        """把狀態更新為 legs；只支援口數變動、尾端新增一個或刪除一個倉位，其餘回傳 False"""
+        if params != self.params:
+            return False
+        contracts = _contracts(legs)
+        old = self._contracts
+        n, m = len(legs), len(self.legs)
+        if n == m and np.array_equal(contracts, old):
+            for j in np.flatnonzero(legs.lots != self.legs.lots):
+                self._set_lots(j, legs.lots[j])
+        elif n == m + 1 and np.array_equal(contracts[:m], old):
+            for j in np.flatnonzero(legs.lots[:m] != self.legs.lots):
+                self._set_lots(j, legs.lots[j])
+            if not self._append(_take(legs, slice(m, n))):
+                return False
+        elif n == m - 1:
+            mismatch = np.flatnonzero((contracts != old[:n]).any(axis=1))
+            k = mismatch[0] if len(mismatch) else n
+            if not np.array_equal(contracts[k:], old[k + 1:]):
+                return False
+            kept = np.delete(np.arange(m), k)
+            self._remove(k)
+            for j in np.flatnonzero(legs.lots != self.legs.lots[kept]):
+                self.option_pnl += self.unit_pnl[:, j] * (legs.lots[j] - self.legs.lots[kept][j])
+        else:
+            return False
+        self.legs = legs
+        self._contracts = contracts
+        return True
+
+    def analysis(self):
+        """目前狀態的計算結果 (分段線性損益與損益兩平點只與倉位數有關)"""
+        center, etf_lots, etf_cost, etf_current = self.params[:4]
+        payoff = build_piecewise_payoff(self.legs, center, etf_lots, etf_cost, etf_current)
+        option_pnl = self.option_pnl.copy()
+        return ScenarioAnalysis(
+            payoff=payoff,
+            prices=self.prices,
+            break_evens=break_even_points(payoff),
+            legs=self.legs,
+            unit_pnl=self.unit_pnl,
+            option_pnl=option_pnl,
+            etf_pnl=self.etf_pnl,
+            combined_pnl=self.etf_pnl + option_pnl,
+        )
+
+
+def full_analysis(legs, center, etf_lots, etf_cost, etf_current, price_range, price_step):
+    """完整計算價格網格、分段線性損益、損益兩平點與各項損益"""
+    payoff = build_piecewise_payoff(legs, center, etf_lots, etf_cost, etf_current)
+    prices = strike_grid(legs, max(center - price_range, 0.0), center + price_range, price_step)
+    unit_pnl = leg_pnl_matrix(prices, _unit_legs(legs))
+    option_pnl = unit_pnl @ legs.lots
+    etf_pnl = etf_pnl_curve(prices, center, etf_lots, etf_cost, etf_current)
+    return ScenarioAnalysis(
+        payoff=payoff,
+        prices=prices,
+        break_evens=break_even_points(payoff),
+        legs=legs,
+        unit_pnl=unit_pnl,
+        option_pnl=option_pnl,
+        etf_pnl=etf_pnl,
+        combined_pnl=etf_pnl + option_pnl,
+    )
+
+
+def analyze_positions(positions, center, etf_lots, etf_cost, etf_current, price_range, price_step,
+                      cache=scenario_cache, state=None):
+    """計算 (或從快取取得) 各項損益，回傳 (ScenarioAnalysis, IncrementalScenario)
+
+    state 為上一次回傳的 IncrementalScenario；快取未命中且只有單一倉位的口數、
+    新增或刪除有變動時以增量更新，否則完整重算。
+    """
+    legs = positions_to_legs(positions)
+    params = (center, etf_lots, etf_cost, etf_current, price_range, price_step)
+    key = scenario_key(legs, *params)
+    result = cache.get(key)
+    if result is not None:
+        return result, IncrementalScenario(result, params)
+
+    if state is not None and state.sync(legs, params):
+        result = state.analysis()
+    else:
+        result = full_analysis(legs, *params)
+        state = IncrementalScenario(result, params)
+    cache.put(key, result)
+    return result, state
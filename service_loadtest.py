@@ -0,0 +1,134 @@
+"""00631L 避險計算器 - 估值服務壓力測試
+
+以多條 keep-alive 連線同時送出請求，回報延遲 p50 / p99、每秒請求數與服務端批次大小：
+
+    python service_loadtest.py --spawn --connections 64 --requests 50
+    python service_loadtest.py --port 8631 --endpoint /greeks
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from valuation_service import DEFAULT_HOST, DEFAULT_PORT
+
+SAMPLE_POSITIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hedge_positions.json")
+
+
+def sample_payload(index):
+    """以範例倉位文件組成請求內容"""
+    try:
+        with open(SAMPLE_POSITIONS, encoding="utf-8") as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        payload = {"etf_lots": 5.0, "etf_cost": 180.0, "etf_current_price": 190.0, "option_positions": [
+            {"type": "Put", "direction": "買進", "strike": index - 500, "lots": 2, "premium": 80.0},
+        ]}
+    payload["index"] = index
+    return payload
+
+
+async def request(reader, writer, method, path, body=b""):
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(host, port, path, body, n_requests, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, "POST", path, body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(host, port, path, connections, n_requests, index):
+    body = json.dumps(sample_payload(index), ensure_ascii=False).encode("utf-8")
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(host, port, path, body, n_requests, latencies, errors) for _ in range(connections)
+    ))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, stats = await request(reader, writer, "GET", "/stats")
+    writer.close()
+    return np.asarray(latencies) * 1000.0, errors, elapsed, stats
+
+
+async def wait_for_port(host, port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="估值服務壓力測試")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--endpoint", default="/evaluate", choices=["/evaluate", "/greeks", "/break-evens"])
+    parser.add_argument("--connections", type=int, default=32, help="同時連線數")
+    parser.add_argument("--requests", type=int, default=50, help="每條連線的請求數")
+    parser.add_argument("--index", type=float, default=22000.0)
+    parser.add_argument("--spawn", action="store_true", help="在子行程啟動估值服務，測試完關閉")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.spawn:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "valuation_service.py"),
+             "--host", args.host, "--port", str(args.port)],
+            stdout=subprocess.DEVNULL,
+        )
+    try:
+        if server is not None:
+            asyncio.run(wait_for_port(args.host, args.port))
+        latencies, errors, elapsed, stats = asyncio.run(
+            run(args.host, args.port, args.endpoint, args.connections, args.requests, args.index)
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"{args.endpoint}: {len(latencies):,} 筆請求 / {args.connections} 條連線，{elapsed:.2f} 秒 "
+          f"({len(latencies) / elapsed:,.0f} req/s)")
+    print(f"延遲 p50 {p50:.2f} ms・p99 {p99:.2f} ms・最大 {latencies.max():.2f} ms")
+    print(f"錯誤 {len(errors)} 筆")
+    print(f"服務端批次: {json.dumps(stats, ensure_ascii=False)}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""00631L 避險計算器 - 倉位資料儲存後端
+
+三種後端提供與 firebase_admin.db.Reference 相同的 get / set / update 介面，
+因此 WriteBehindWriter 可直接搭配任一後端；child() 取得子路徑、keys() 列出子節點：
+
+- firebase：Firebase Realtime Database (第一次讀寫時才初始化，以監聽串流維護讀取快取)
+- local：本機 JSON 檔，先寫暫存檔並 fsync 後再以 rename 原子替換
+- memory：行程內記憶體，可作為 Firebase 的本機替身供開發、CI 與效能測試使用
+"""
+import atexit
+import copy
+import json
+import os
+import tempfile
+import threading
+
+BACKEND_FIREBASE = "firebase"
+BACKEND_LOCAL = "local"
+BACKEND_MEMORY = "memory"
+BACKENDS = (BACKEND_FIREBASE, BACKEND_LOCAL, BACKEND_MEMORY)
+
+STORAGE_ENV_VAR = "HEDGE_STORAGE"
+DEFAULT_LOCAL_PATH = "hedge_portfolios.json"
+DEFAULT_FIREBASE_PATH = "hedge_portfolios"
+LEGACY_LOCAL_PATH = "hedge_positions.json"  # 多投資組合之前的單一倉位文件
+LEGACY_FIREBASE_PATH = "hedge_positions"
+FIREBASE_DATABASE_URL = "https://l-op-bf09b-default-rtdb.asia-southeast1.firebasedatabase.app/"
+LISTENER_READY_TIMEOUT = 5.0
+
+_APP_LOCK = threading.Lock()
+
+
+def apply_updates(document, changes):
+    """依 Firebase update() 的語意把 {子路徑: 值} 套用到文件 (None 代表刪除)"""
+    document = {} if document is None else copy.deepcopy(document)
+    for path, value in changes.items():
+        parts = path.split("/")
+        node = document
+        for part in parts[:-1]:
+            if isinstance(node, list):
+                node = node[int(part)]
+            else:
+                node = node.setdefault(part, {})
+        key = parts[-1]
+        if isinstance(node, list):
+            index = int(key)
+            if value is None:
+                if index < len(node):
+                    node[index] = None
+            elif index < len(node):
+                node[index] = copy.deepcopy(value)
+            else:
+                node.extend([None] * (index - len(node)))
+                node.append(copy.deepcopy(value))
+            # Firebase 陣列尾端刪除後長度隨之縮短
+            while node and node[-1] is None:
+                node.pop()
+        elif value is None:
+            node.pop(key, None)
+        else:
+            node[key] = copy.deepcopy(value)
+    return document
+
+
+def node_at(document, path):
+    """取出文件中 path 指向的節點，不存在時回傳 None"""
+    node = document
+    for part in filter(None, path.split("/")):
+        if isinstance(node, dict):
+            node = node.get(part)
+        elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+            node = node[int(part)]
+        else:
+            return None
+    return node
+
+
+def join_path(prefix, path):
+    """串接資料庫路徑"""
+    return "/".join(p for p in (prefix.strip("/"), path.strip("/")) if p)
+
+
+def _child_keys(node):
+    if isinstance(node, dict):
+        return sorted(node)
+    if isinstance(node, list):
+        return [str(i) for i, v in enumerate(node) if v is not None]
+    return []
+
+
+class _DocumentStore:
+    """整份資料存成單一文件的後端；child() 回傳共用同一份文件的子路徑視圖"""
+
+    prefix = ""
+
+    def get(self):
+        with self._lock:
+            return copy.deepcopy(node_at(self._read(), self.prefix))
+
+    def set(self, value):
+        with self._lock:
+            if self.prefix:
+                self._write(apply_updates(self._read(), {self.prefix: value}))
+            else:
+                self._write(copy.deepcopy(value))
+
+    def update(self, changes):
+        with self._lock:
+            self._write(apply_updates(
+                self._read(), {join_path(self.prefix, path): value for path, value in changes.items()}
+            ))
+
+    def child(self, path):
+        view = copy.copy(self)
+        view.prefix = join_path(self.prefix, path)
+        return view
+
+    def keys(self):
+        """子節點名稱"""
+        return _child_keys(self.get())
+
+    def close(self):
+        pass
+
+
+class MemoryStore(_DocumentStore):
+    """記憶體後端 (Firebase 替身)"""
+
+    def __init__(self, initial=None):
+        self._box = [copy.deepcopy(initial)]  # 以 list 包住，讓子路徑視圖共用同一份資料
+        self._lock = threading.Lock()
+
+    def _read(self):
+        return self._box[0]
+
+    def _write(self, value):
+        self._box[0] = value
+
+
+class LocalJsonStore(_DocumentStore):
+    """本機 JSON 檔後端，寫入為原子操作 (暫存檔 + fsync + rename)"""
+
+    def __init__(self, path=DEFAULT_LOCAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, value):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".hedge_", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        # 確保 rename 本身也寫入磁碟 (Windows 不支援開啟目錄)
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+
+def apply_event(document, event_type, path, data):
+    """把 Firebase listen() 的 put / patch 事件套用到本機快取"""
+    path = path.strip("/")
+    if event_type == "put":
+        if not path:
+            return copy.deepcopy(data)
+        return apply_updates(document, {path: data})
+    if event_type == "patch":
+        prefix = f"{path}/" if path else ""
+        return apply_updates(document, {f"{prefix}{key}": value for key, value in data.items()})
+    return document
+
+
+class FirebaseStore:
+    """Firebase Realtime Database 後端
+
+    firebase_admin 於第一次讀寫時初始化 (整個行程一次)。啟用監聽後第一次讀寫時
+    以 listen() 串流維護該路徑的記憶體快取，新的 session 直接從快取讀取，
+    其他裝置的修改也會即時反映。
+    """
+
+    def __init__(self, credential_source, path=DEFAULT_FIREBASE_PATH, database_url=FIREBASE_DATABASE_URL,
+                 listen=True):
+        self.credential_source = credential_source
+        self.path = path
+        self.database_url = database_url
+        self.listen = listen
+        self.version = 0  # 快取每收到一次事件加 1
+        self._ref = None
+        self._lock = threading.Lock()
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._registration = None
+
+    def _database(self):
+        import firebase_admin
+        from firebase_admin import credentials, db
+
+        with _APP_LOCK:
+            try:
+                firebase_admin.get_app()
+            except ValueError:
+                cred = credentials.Certificate(self.credential_source)
+                firebase_admin.initialize_app(cred, {"databaseURL": self.database_url})
+        return db
+
+    def reference(self):
+        if self._ref is None:
+            with self._lock:
+                if self._ref is None:
+                    self._ref = self._database().reference(self.path)
+                    if self.listen:
+                        self._registration = self._ref.listen(self._on_event)
+                        atexit.register(self.close)
+        return self._ref
+
+    def warm_up(self):
+        """在背景執行緒初始化 firebase_admin，不阻塞呼叫端"""
+        threading.Thread(target=self._database, name="firebase-warm-up", daemon=True).start()
+        return self
+
+    def child(self, path):
+        """子路徑 (各自建立 Reference 與監聽，只在讀寫時才連線)"""
+        return FirebaseStore(self.credential_source, join_path(self.path, path), self.database_url, self.listen)
+
+    def keys(self):
+        """以淺層查詢只取子節點名稱，不下載內容也不建立監聽"""
+        return _child_keys(self._database().reference(self.path).get(shallow=True))
+
+    def _on_event(self, event):
+        with self._cache_lock:
+            self._cache = apply_event(self._cache, event.event_type, event.path, event.data)
+            self.version += 1
+        self._ready.set()
+
+    def get(self):
+        ref = self.reference()
+        # 監聽的第一個事件即為完整文件；逾時則直接讀取
+        if self.listen and self._ready.wait(LISTENER_READY_TIMEOUT):
+            with self._cache_lock:
+                return copy.deepcopy(self._cache)
+        return ref.get()
+
+    def set(self, value):
+        self.reference().set(value)
+
+    def update(self, changes):
+        self.reference().update(changes)
+
+    def close(self):
+        """停止監聽串流"""
+        if self._registration is not None:
+            self._registration.close()
+            self._registration = None
+
+
+def configured_backend(settings=None, has_firebase_credentials=False):
+    """決定使用的後端：環境變數 HEDGE_STORAGE > 設定檔 backend > 有 Firebase 憑證時用 firebase，否則 local"""
+    settings = settings or {}
+    backend = os.environ.get(STORAGE_ENV_VAR) or settings.get("backend")
+    if not backend:
+        backend = BACKEND_FIREBASE if has_firebase_credentials else BACKEND_LOCAL
+    backend = backend.lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"不支援的儲存後端: {backend}")
+    return backend
+
+
+def open_store(backend, credential_source=None, local_path=DEFAULT_LOCAL_PATH, firebase_path=DEFAULT_FIREBASE_PATH):
+    """依後端名稱建立儲存物件"""
+    if backend == BACKEND_FIREBASE:
+        if credential_source is None:
+            raise FileNotFoundError("找不到 Firebase 憑證")
+        return FirebaseStore(credential_source, firebase_path).warm_up()
+    if backend == BACKEND_LOCAL:
+        return LocalJsonStore(local_path)
+    if backend == BACKEND_MEMORY:
+        return MemoryStore()
+    raise ValueError(f"不支援的儲存後端: {backend}")
@@ -0,0 +1,52 @@
+"""00631L 避險計算器 - 損益試算表
+
+由損益陣列直接組出數值欄位的 DataFrame。數字格式由畫面的 column_config 套用
+(其優先於 Styler 的格式)，Styler 只負責損益顏色。
+"""
+import numpy as np
+import pandas as pd
+
+PNL_COLUMNS = ("00631L", "選擇權組合", "總損益")
+INDEX_COLUMN = "結算指數"
+INDEX_FORMAT = "%,.0f"
+SIGNED_FORMAT = "%+,.0f"
+
+
+def build_scenario_table(prices, center, etf_profits, option_profits, combined_profits):
+    """損益試算表 (None 的欄位不列出)"""
+    table_data = {
+        INDEX_COLUMN: prices,
+        "指數變動": prices - center,
+    }
+    if etf_profits is not None:
+        table_data["00631L"] = etf_profits
+    if option_profits is not None:
+        table_data["選擇權組合"] = option_profits
+    table_data["總損益"] = combined_profits
+    return pd.DataFrame(table_data)
+
+
+def pnl_colors(frame):
+    """依正負號一次產生整個表格的文字顏色 (獲利綠、虧損紅)"""
+    values = frame.to_numpy()
+    css = np.where(values > 0, "color: #10b981; font-weight: bold",
+                   np.where(values < 0, "color: #ef4444; font-weight: bold", ""))
+    return pd.DataFrame(css, index=frame.index, columns=frame.columns)
+
+
+def style_scenario_table(frame):
+    """損益欄位上色"""
+    pnl_columns = [c for c in PNL_COLUMNS if c in frame.columns]
+    return frame.style.apply(pnl_colors, axis=None, subset=pnl_columns)
+
+
+def column_formats(frame):
+    """各欄位的 printf 格式：結算指數取整數，其餘 (指數變動與損益) 取整數並加正負號"""
+    return {column: INDEX_FORMAT if column == INDEX_COLUMN else SIGNED_FORMAT for column in frame.columns}
+
+
+def build_leg_detail(prices, leg_pnl, leg_labels):
+    """各倉位損益明細 (價格 × 倉位)"""
+    detail = pd.DataFrame(leg_pnl, columns=list(leg_labels))
+    detail.insert(0, INDEX_COLUMN, prices)
+    return detail
@@ -0,0 +1,32 @@
+"""測試用的 firebase_admin.db.Reference 替身
+
+以 MemoryStore 套用與 Firebase 相同的 set / update 語意，另外記錄每次寫入呼叫，
+並可指定接下來幾次寫入失敗。
+"""
+import copy
+import threading
+
+from storage import MemoryStore
+
+
+class FakeReference(MemoryStore):
+    def __init__(self, initial=None):
+        super().__init__(initial)
+        self.calls = []  # [(方法名稱, 參數)]
+        self.fail_writes = 0
+        self._calls_lock = threading.Lock()
+
+    def _record(self, method, value):
+        with self._calls_lock:
+            if self.fail_writes:
+                self.fail_writes -= 1
+                raise ConnectionError("模擬 Firebase 寫入失敗")
+            self.calls.append((method, copy.deepcopy(value)))
+
+    def set(self, value):
+        self._record("set", value)
+        super().set(value)
+
+    def update(self, changes):
+        self._record("update", changes)
+        super().update(changes)
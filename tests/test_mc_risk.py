@@ -0,0 +1,15 @@
+"""00631L 每日再平衡模擬"""
+import warnings
+
+import numpy as np
+
+from mc_risk import simulate_rebalanced_etf
+
+
+def test_zero_price_grid_has_no_warning_and_wipes_out_etf():
+    prices = np.array([0.0, 11000.0, 22000.0])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        bands = simulate_rebalanced_etf(prices, 22000.0, 1.0, 180.0, 190.0, n_days=5, sigma=0.2, n_paths=200)
+    assert bands.mean[0] == -180.0 * 1000
+    assert np.isfinite(bands.mean).all()
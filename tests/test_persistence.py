@@ -0,0 +1,121 @@
+"""WriteBehindWriter 的防抖合併、差異更新與失敗重送"""
+import threading
+import time
+
+import pytest
+
+from persistence import WriteBehindWriter, diff_paths
+from fake_firebase import FakeReference
+
+FLUSH_TIMEOUT = 5.0
+
+
+def document(lots=(1, 2, 3), etf_lots=6.5):
+    return {
+        "etf_lots": etf_lots,
+        "option_positions": [{"strike": 21000 + 100 * i, "lots": n} for i, n in enumerate(lots)],
+    }
+
+
+@pytest.fixture
+def ref():
+    return FakeReference(document())
+
+
+@pytest.fixture
+def writer(ref):
+    writer = WriteBehindWriter(ref, debounce=0.1)
+    writer.prime(document())
+    yield writer
+    writer.close()
+
+
+def test_diff_paths_reports_changed_leaves_only():
+    old, new = document(), document(lots=(1, 5, 3), etf_lots=7.0)
+    assert diff_paths(old, new) == {"etf_lots": 7.0, "option_positions/1/lots": 5}
+    assert diff_paths(old, document()) == {}
+
+
+def test_diff_paths_shrinking_list_deletes_removed_indices():
+    changes = diff_paths(document(lots=(1, 2, 3)), document(lots=(1,)))
+    assert changes == {"option_positions/1": None, "option_positions/2": None}
+
+
+def test_rapid_edits_coalesce_into_one_update(writer, ref):
+    for lots in range(2, 12):
+        writer.submit(document(lots=(lots, 2, 3)))
+    assert writer.flush(FLUSH_TIMEOUT)
+    assert ref.calls == [("update", {"option_positions/0/lots": 11})]
+    assert ref.get() == document(lots=(11, 2, 3))
+    assert not writer.has_pending
+
+
+def test_shrinking_list_sends_none_for_removed_indices(writer, ref):
+    writer.submit(document(lots=(1,)))
+    assert writer.flush(FLUSH_TIMEOUT)
+    assert ref.calls == [("update", {"option_positions/1": None, "option_positions/2": None})]
+    assert ref.get() == document(lots=(1,))
+
+
+def test_failed_write_keeps_baseline_and_resends(writer, ref):
+    ref.fail_writes = 1
+    writer.submit(document(lots=(4, 2, 3)))
+    assert writer.flush(FLUSH_TIMEOUT)
+    assert isinstance(writer.last_error, ConnectionError)
+    assert ref.calls == []
+    assert ref.get() == document()
+
+    # 下一次寫入與舊基準比對，包含上次沒送出的變動
+    writer.submit(document(lots=(4, 2, 3), etf_lots=8.0))
+    assert writer.flush(FLUSH_TIMEOUT)
+    assert writer.last_error is None
+    assert ref.calls == [("update", {"etf_lots": 8.0, "option_positions/0/lots": 4})]
+    assert ref.get() == document(lots=(4, 2, 3), etf_lots=8.0)
+
+
+def test_unprimed_writer_sets_whole_document():
+    ref = FakeReference()
+    writer = WriteBehindWriter(ref, debounce=0.0)
+    try:
+        writer.submit(document())
+        assert writer.flush(FLUSH_TIMEOUT)
+        assert ref.calls == [("set", document())]
+    finally:
+        writer.close()
+
+
+def test_close_flushes_last_pending_edit():
+    ref = FakeReference(document())
+    writer = WriteBehindWriter(ref, debounce=30.0)
+    writer.prime(document())
+    writer.submit(document(lots=(1, 2, 9)))
+    assert writer.has_pending
+
+    start = time.monotonic()
+    writer.close()
+    assert time.monotonic() - start < FLUSH_TIMEOUT  # 不等完防抖時間
+    assert ref.calls == [("update", {"option_positions/2/lots": 9})]
+    assert not writer.has_pending
+
+    writer.submit(document(lots=(7, 7, 7)))  # 關閉後的修改不再寫入
+    assert ref.get() == document(lots=(1, 2, 9))
+
+
+def test_close_does_not_block_on_full_queue():
+    ref = FakeReference(document())
+    writing, release = threading.Event(), threading.Event()
+    update = ref.update
+    ref.update = lambda changes: (writing.set(), release.wait(FLUSH_TIMEOUT), update(changes))
+    writer = WriteBehindWriter(ref, debounce=0.0, max_pending=2)
+    writer.prime(document())
+    writer.submit(document(lots=(0, 2, 3)))
+    assert writing.wait(FLUSH_TIMEOUT)
+    for lots in range(1, 10):  # 寫入卡住時佇列會被填滿
+        writer.submit(document(lots=(lots, 2, 3)))
+
+    start = time.monotonic()
+    writer.close(timeout=0.2)  # 寫入仍卡住，只等待 timeout 秒
+    assert time.monotonic() - start < 1.0
+    release.set()
+    writer._thread.join(FLUSH_TIMEOUT)
+    assert ref.get() == document(lots=(9, 2, 3))
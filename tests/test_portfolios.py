@@ -0,0 +1,22 @@
+"""PortfolioRepository 建立組合不覆蓋既有資料"""
+import pytest
+
+from portfolios import PortfolioRepository, DEFAULT_PORTFOLIO
+from storage import MemoryStore
+
+
+def test_create_rejects_existing_portfolio():
+    root = MemoryStore({"alice": {DEFAULT_PORTFOLIO: {"etf_lots": 6.5}}})
+    repo = PortfolioRepository(root, "alice")
+    with pytest.raises(ValueError):
+        repo.create(DEFAULT_PORTFOLIO, {"etf_lots": 0.0})
+    assert repo.store(DEFAULT_PORTFOLIO).get() == {"etf_lots": 6.5}
+
+
+def test_create_rejects_names_mapping_to_same_key():
+    repo = PortfolioRepository(MemoryStore(), "alice")
+    assert repo.create("a.b", {"etf_lots": 1.0}) == "a,b"
+    with pytest.raises(ValueError):
+        repo.create("a,b", {"etf_lots": 2.0})
+    assert repo.store("a,b").get() == {"etf_lots": 1.0}
+    assert repo.names() == ["a,b"]
@@ -0,0 +1,51 @@
+"""PriceStore 向前補抓只做一次，之後只增量更新"""
+from datetime import date, timedelta
+
+import pandas as pd
+
+from price_store import PriceStore
+
+LISTED = date.today() - timedelta(days=400)  # 商品上市日
+
+
+class FakeFetcher:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, ticker, start=None, end=None, period=None):
+        self.calls.append((start, end, period))
+        first = LISTED if start is None else max(start, LISTED)
+        last = date.today() if end is None else end
+        index = pd.date_range(first, last, freq="D")
+        return pd.Series(100.0, index=index)
+
+
+def test_max_period_backfills_once(tmp_path):
+    fetcher = FakeFetcher()
+    store = PriceStore(str(tmp_path / "prices.sqlite"), fetcher)
+    store.sync("X")  # 只有最近幾天的資料
+    fetcher.calls.clear()
+
+    store.ensure_history("X", "max")
+    assert [c[2] for c in fetcher.calls].count("max") == 1
+    fetcher.calls.clear()
+
+    history = store.ensure_history("X", "max")
+    assert all(c[2] != "max" for c in fetcher.calls)
+    assert len(fetcher.calls) == 1  # 只剩 sync()
+    assert history.index[0].date() == LISTED
+
+
+def test_start_before_listing_backfills_once(tmp_path):
+    fetcher = FakeFetcher()
+    store = PriceStore(str(tmp_path / "prices.sqlite"), fetcher)
+    store.ensure_history("X", "2y")  # 早於上市日，最早 K 棒仍是上市日
+    fetcher.calls.clear()
+
+    store.ensure_history("X", "2y")
+    store.ensure_history("X", "1y")  # 範圍較小，也已涵蓋
+    assert all(c[0] is None or c[0] >= date.today() - timedelta(days=7) for c in fetcher.calls)
+    assert len(fetcher.calls) == 2
+
+    store.ensure_history("X", "5y")  # 範圍較大，需要再補抓一次
+    assert any(c[1] is not None for c in fetcher.calls[2:])
@@ -0,0 +1,73 @@
+"""QuoteService 逾時放棄與 QuoteRefresher 強制取價"""
+import threading
+
+import pandas as pd
+
+from quotes import QuoteService, QuoteRefresher, CircuitBreaker, SOURCE_LIVE
+
+TICKERS = ("A", "B")
+
+
+class FakeStore:
+    """PriceStore 中 QuoteService 會用到的部分"""
+
+    def __init__(self):
+        self.quotes = {}
+
+    def cached_quote(self, ticker):
+        return self.quotes.get(ticker)
+
+    def upsert(self, ticker, closes):
+        pass
+
+    def save_quote(self, ticker, price, fetched_at):
+        self.quotes[ticker] = (price, fetched_at, True)
+
+
+def closes(price=100.0):
+    return {t: pd.Series([price]) for t in TICKERS}
+
+
+def test_hung_fetches_do_not_block_later_fetches():
+    release = threading.Event()
+    hang = [True]
+
+    def fetch(tickers):
+        if hang[0]:
+            release.wait(10.0)
+        return closes()
+
+    service = QuoteService(FakeStore(), fetch, TICKERS, budget=0.2, breaker=CircuitBreaker(threshold=10))
+    try:
+        for _ in range(3):
+            snapshot = service.get(force=True)
+            assert snapshot.error.startswith("逾時")
+        assert service.abandoned == 3
+
+        hang[0] = False
+        snapshot = service.get(force=True)
+        assert snapshot.error == ""
+        assert all(q.source == SOURCE_LIVE for q in snapshot.quotes.values())
+    finally:
+        release.set()
+
+
+def test_refresh_request_forces_fetch():
+    forced = []
+
+    class Service:
+        clock = staticmethod(lambda: 0.0)
+
+        def _cached(self, allow_stale):
+            return {}
+
+        def get(self, force=False):
+            forced.append(force)
+            return refresher.snapshot()
+
+    refresher = QuoteRefresher(Service(), interval=60.0).start()
+    try:
+        refresher.request_refresh(force=True, wait=5.0)
+        assert forced[-1] is True
+    finally:
+        refresher.stop()
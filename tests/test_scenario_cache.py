@@ -0,0 +1,143 @@
+"""情境快取 (LRU、記憶體上限) 與 IncrementalScenario 增量更新的一致性"""
+import random
+
+import numpy as np
+import pytest
+
+from positions import Position, Product, OptionType, Direction
+from pnl_engine import positions_to_legs, evaluate_legs
+from scenario_cache import CacheStats, ScenarioCache, analyze_positions, full_analysis
+
+PARAMS = (22000.0, 10.0, 180.0, 190.0, 3000.0, 100.0)  # 指數、張數、成本、現價、範圍、間距
+ATOL = 1e-6
+
+
+def random_position(rng, off_grid=False):
+    if rng.random() < 0.15:
+        return Position.micro_futures(rng.choice([21000.0, 22050.5]), rng.randint(1, 3))
+    strike = float(rng.randrange(19000, 25000, 100))
+    if off_grid:
+        strike += 50.0  # 不在 100 點網格上，新增時需重算網格
+    return Position(
+        rng.choice([Product.TXO, Product.MICRO_OPTION]),
+        rng.choice([OptionType.CALL, OptionType.PUT]),
+        rng.choice([Direction.BUY, Direction.SELL]),
+        strike,
+        rng.randint(0, 5),
+        rng.uniform(1.0, 300.0),
+    )
+
+
+def analyze(positions, state):
+    """以空快取計算，確保走增量或完整重算的路徑"""
+    return analyze_positions(positions, *PARAMS, cache=ScenarioCache(), state=state)
+
+
+def assert_matches_full(positions, result):
+    legs = positions_to_legs(positions)
+    reference = evaluate_legs(legs, result.prices, PARAMS[0], *PARAMS[1:4])
+    np.testing.assert_allclose(result.option_pnl, reference.option_pnl, atol=ATOL)
+    np.testing.assert_allclose(result.combined_pnl, reference.combined_pnl, atol=ATOL)
+    np.testing.assert_allclose(result.leg_pnl, reference.leg_pnl, atol=ATOL)
+
+    full = full_analysis(legs, *PARAMS)
+    np.testing.assert_allclose(full.break_evens, result.break_evens, atol=ATOL)
+    # 增量結果的網格可能多出已刪除倉位的履約價，但必須涵蓋完整重算的網格
+    assert np.isin(full.prices, result.prices).all()
+    np.testing.assert_allclose(
+        np.interp(full.prices, result.prices, result.combined_pnl), full.combined_pnl, atol=ATOL
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_edits_match_full_analysis(seed):
+    rng = random.Random(seed)
+    positions = [random_position(rng) for _ in range(5)]
+    result, state = analyze(positions, None)
+    incremental = 0
+    for _ in range(300):
+        op = rng.random()
+        if op < 0.6 and positions:
+            rng.choice(positions).lots = rng.randint(0, 8)
+        elif op < 0.8:
+            positions.append(random_position(rng, off_grid=rng.random() < 0.2))
+        elif positions:
+            positions.pop(rng.randrange(len(positions)))
+        before = state
+        result, state = analyze(positions, state)
+        incremental += state is before
+        assert_matches_full(positions, result)
+    assert incremental > 0
+
+
+def test_lot_change_updates_in_place():
+    positions = [random_position(random.Random(1)) for _ in range(4)]
+    _, state = analyze(positions, None)
+    positions[2].lots += 3
+    result, new_state = analyze(positions, state)
+    assert new_state is state
+    assert_matches_full(positions, result)
+
+
+def test_delete_from_middle_updates_in_place():
+    rng = random.Random(2)
+    positions = [random_position(rng) for _ in range(6)]
+    _, state = analyze(positions, None)
+    del positions[3]
+    result, new_state = analyze(positions, state)
+    assert new_state is state
+    assert_matches_full(positions, result)
+
+
+def test_off_grid_strike_falls_back_to_full_analysis():
+    positions = [Position(Product.TXO, OptionType.PUT, Direction.BUY, 21500.0, 2, 80.0)]
+    _, state = analyze(positions, None)
+    positions.append(Position(Product.TXO, OptionType.CALL, Direction.SELL, 22550.0, 1, 60.0))
+    result, new_state = analyze(positions, state)
+    assert new_state is not state
+    assert 22550.0 in result.prices
+    assert_matches_full(positions, result)
+
+
+def test_changed_params_fall_back_to_full_analysis():
+    positions = [Position(Product.TXO, OptionType.PUT, Direction.BUY, 21500.0, 2, 80.0)]
+    _, state = analyze(positions, None)
+    result, new_state = analyze_positions(positions, 22100.0, *PARAMS[1:], cache=ScenarioCache(), state=state)
+    assert new_state is not state
+    assert result.prices[0] == pytest.approx(22100.0 - PARAMS[4])
+
+
+def test_cache_evicts_least_recently_used_within_byte_cap():
+    entry = lambda: (np.zeros(100),)  # 800 bytes
+    cache = ScenarioCache(max_bytes=2500)
+    for key in "abc":
+        cache.put(key, entry())
+    assert cache.get("a") is not None  # a 變成最近使用
+    cache.put("d", entry())  # 超過 2500 bytes，淘汰最久未使用的 b
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.stats() == CacheStats(hits=4, misses=1, entries=3, nbytes=2400)
+
+    cache.put("a", (np.zeros(200),))  # 覆蓋既有鍵時重新計算大小
+    assert cache.get("c") is None
+    assert cache.stats().nbytes == 2400
+    assert cache.stats().entries == 2
+
+
+def test_cache_skips_oversized_entries_and_freezes_arrays():
+    cache = ScenarioCache(max_bytes=1000)
+    cache.put("small", (np.zeros(10),))
+    cache.put("big", (np.zeros(200),))  # 1600 bytes，大於上限，不放入也不淘汰其他項目
+
+    assert cache.get("big") is None
+    small = cache.get("small")
+    assert not small[0].flags.writeable
+    assert cache.stats() == CacheStats(hits=1, misses=1, entries=1, nbytes=80)
+
+
+def test_cache_counts_shared_arrays_once():
+    shared = np.zeros(100)
+    cache = ScenarioCache()
+    cache.put("k", (shared, (shared, np.zeros(10))))
+    assert cache.stats().nbytes == 880
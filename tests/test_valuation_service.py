@@ -0,0 +1,59 @@
+"""估值服務對格式錯誤的請求回應 400"""
+import asyncio
+import json
+
+import pytest
+
+from service_loadtest import request
+from valuation_service import ValuationService
+
+PUT = {"type": "Put", "direction": "買進", "strike": 21500, "lots": 2, "premium": 80.0}
+
+
+async def serve_once(exchange):
+    server = await asyncio.start_server(ValuationService().handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        return await exchange(reader, writer)
+    finally:
+        writer.close()
+        server.close()
+        await server.wait_closed()
+
+
+def post(path, payload):
+    async def exchange(reader, writer):
+        return await request(reader, writer, "POST", path, json.dumps(payload).encode("utf-8"))
+    return asyncio.run(serve_once(exchange))
+
+
+def test_valid_request():
+    status, body = post("/evaluate", {"index": 22000, "option_positions": [PUT], "etf_lots": 1.0,
+                                      "etf_current_price": 190.0})
+    assert status == 200
+    assert len(body["prices"]) == 31
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/evaluate", {"index": 22000, "option_positions": [dict(PUT, strike="nan")]}),
+    ("/break-evens", {"index": 22000, "option_positions": [dict(PUT, premium="inf")]}),
+    ("/greeks", {"index": 22000, "option_positions": [dict(PUT, lots=float("inf"))]}),
+    ("/evaluate", {"index": 22000, "option_positions": [dict(PUT, lots=-1)]}),
+    ("/evaluate", {"index": 22000, "etf_lots": 5.0}),
+    ("/evaluate", {"index": 22000, "price_range": 1e9, "price_step": 1}),
+    ("/evaluate", {"index": 22000, "option_positions": [PUT] * 200, "price_range": 10000, "price_step": 1}),
+])
+def test_invalid_input_returns_400(path, payload):
+    status, body = post(path, payload)
+    assert status == 400, body
+
+
+def test_non_numeric_content_length_returns_400():
+    async def exchange(reader, writer):
+        writer.write(b"POST /evaluate HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+        await writer.drain()
+        return await reader.read()
+    response = asyncio.run(serve_once(exchange))
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in response
@@ -0,0 +1,170 @@
+"""00631L 避險計算器 - 每次重新執行的耗時量測
+
+以 phase("名稱") 標記頁面的依序階段 (開始下一階段即結束上一階段)，以 span("名稱")
+包住巢狀的細項。每次重新執行結束時保留各階段耗時，累積最近數次的 p50 / p95，
+並可逐筆附加到本機 JSONL 檔。停用時 phase() 直接返回、span() 回傳共用的空
+context manager，只多一次屬性判斷。
+"""
+import contextlib
+import json
+import os
+import time
+from collections import deque
+from typing import NamedTuple
+
+import numpy as np
+
+TRACE_ENV_VAR = "HEDGE_TRACE"
+TRACE_FILE_ENV_VAR = "HEDGE_TRACE_FILE"
+DEFAULT_TRACE_PATH = os.path.join("data", "hedge_trace.jsonl")  # data/ 不納入版本控制
+HISTORY_RUNS = 200
+TOTAL_NAME = "整頁"
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def trace_enabled(flag=None):
+    """環境變數 HEDGE_TRACE 或網址參數 (?debug=1) 為真時啟用"""
+    value = flag if flag is not None else os.environ.get(TRACE_ENV_VAR, "")
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+class SpanRecord(NamedTuple):
+    name: str
+    offset: float  # 距本次執行開始的秒數
+    seconds: float
+    depth: int
+
+
+class RunTrace(NamedTuple):
+    """一次重新執行的量測結果"""
+    run: int
+    started_at: float  # epoch 秒
+    total: float
+    spans: list
+
+
+class PhaseStats(NamedTuple):
+    name: str
+    runs: int
+    p50: float
+    p95: float
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start", "depth")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        # 階段內的 span 縮排在階段之下
+        self.depth = self.tracer._depth + (self.tracer._phase is not None)
+        self.tracer._depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.tracer._depth -= 1
+        self.tracer._record(self.name, self.start, elapsed, self.depth)
+        return False
+
+
+class Tracer:
+    """單一 session 的耗時量測"""
+
+    def __init__(self, enabled=False, export_path=None, history=HISTORY_RUNS):
+        self.enabled = enabled
+        self.export_path = export_path
+        self.history = deque(maxlen=history)  # 每次執行 {名稱: 秒數}
+        self.last_run = None
+        self.runs = 0
+        self._spans = None
+        self._start = 0.0
+        self._started_at = 0.0
+        self._phase = None
+        self._depth = 0
+
+    def begin_run(self):
+        if not self.enabled:
+            return
+        self.runs += 1
+        self._spans = []
+        self._start = time.perf_counter()
+        self._started_at = time.time()
+        self._phase = None
+        self._depth = 0
+
+    def phase(self, name):
+        """結束目前階段並開始新的階段"""
+        if not self.enabled:
+            return
+        self._close_phase()
+        self._phase = (name, time.perf_counter())
+
+    def span(self, name):
+        """巢狀細項的 context manager"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def _close_phase(self):
+        if self._phase is not None:
+            name, start = self._phase
+            self._phase = None
+            self._record(name, start, time.perf_counter() - start, 0)
+
+    def _record(self, name, start, seconds, depth):
+        if self._spans is None:
+            # 片段 (fragment) 單獨重新執行時不經過 begin_run，自成一筆紀錄
+            self._finish([SpanRecord(name, 0.0, seconds, 0)], seconds, time.time() - seconds)
+            return
+        self._spans.append(SpanRecord(name, start - self._start, seconds, depth))
+
+    def end_run(self):
+        """結束本次執行，回傳 RunTrace (停用時回傳 None)"""
+        if not self.enabled or self._spans is None:
+            return None
+        self._close_phase()
+        spans = sorted(self._spans, key=lambda s: s.offset)
+        self._spans = None
+        self.last_run = self._finish(spans, time.perf_counter() - self._start, self._started_at, full=True)
+        return self.last_run
+
+    def _finish(self, spans, total, started_at, full=False):
+        run = RunTrace(self.runs, started_at, total, spans)
+        totals = {TOTAL_NAME: total} if full else {}
+        for span in spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.seconds
+        self.history.append(totals)
+        if self.export_path:
+            self.export(run)
+        return run
+
+    def export(self, run):
+        """把一次執行的所有 span 附加到 JSONL 檔 (每行一個 span)"""
+        directory = os.path.dirname(self.export_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.export_path, "a", encoding="utf-8") as f:
+            for span in run.spans:
+                f.write(json.dumps({
+                    "run": run.run,
+                    "started_at": run.started_at,
+                    "name": span.name,
+                    "offset_ms": round(span.offset * 1000.0, 3),
+                    "ms": round(span.seconds * 1000.0, 3),
+                    "depth": span.depth,
+                }, ensure_ascii=False) + "\n")
+
+    def stats(self):
+        """最近數次執行中各名稱的 p50 / p95 (秒)，依 p50 由大到小"""
+        names = {name for totals in self.history for name in totals}
+        result = []
+        for name in names:
+            samples = np.array([totals[name] for totals in self.history if name in totals])
+            p50, p95 = np.percentile(samples, [50, 95])
+            result.append(PhaseStats(name, len(samples), float(p50), float(p95)))
+        return sorted(result, key=lambda s: s.p50, reverse=True)
@@ -0,0 +1,334 @@
+"""00631L 避險計算器 - 本機 HTTP/JSON 估值服務
+
+以 asyncio 串流實作的輕量 HTTP/1.1 服務 (只用標準函式庫，支援 keep-alive)，
+提供與畫面相同的到期損益、損益兩平點與 Greeks。倉位格式與倉位文件的
+option_positions 相同 (任一 schema_version 皆可)。
+
+數毫秒內抵達、參數相同的請求會合併成一批：所有倉位串成一組陣列，只算一次
+(價格 × 倉位) 矩陣或 Greeks，再以歸屬矩陣加總回各請求。
+
+    python valuation_service.py --port 8631
+
+POST /evaluate    {"index": 22000, "option_positions": [...], "etf_lots": 6.5, ...}
+POST /break-evens {"index": 22000, "option_positions": [...], ...}
+POST /greeks      {"index": 22000, "option_positions": [...], "days_to_expiry": 7, ...}
+GET  /stats       批次統計
+"""
+import argparse
+import asyncio
+import json
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from pnl_engine import evaluate_books, etf_index_delta, positions_to_legs, price_grid
+from payoff_analyzer import build_piecewise_payoff, break_even_points, payoff_extremes
+from option_pricing import leg_greeks
+from positions import load_positions
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8631
+BATCH_WINDOW_SECONDS = 0.002
+MAX_BATCH_SIZE = 256
+MAX_BODY_BYTES = 4 * 1024 * 1024
+MAX_GRID_POINTS = 20_001  # 單一請求的價格網格點數上限
+MAX_GRID_CELLS = 2_000_000  # 單一請求的 (價格 × 倉位) 上限，計算在事件迴圈中進行
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+            500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Book(NamedTuple):
+    """一個請求的組合內容 (已轉為 Position)"""
+    positions: list
+    etf_lots: float
+    etf_cost: float
+
+
+def finite_number(payload, name, default=None):
+    """取出有限的數值欄位 (拒絕 nan、inf 與非數值)"""
+    value = payload.get(name, default)
+    if value is None:
+        raise HttpError(400, f"缺少欄位: {name}")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise HttpError(400, f"{name} 必須是數值") from None
+    if not math.isfinite(value):
+        raise HttpError(400, f"{name} 必須是有限的數值")
+    return value
+
+
+def parse_book(payload):
+    """由請求內容建立 Book 與共用參數"""
+    if not isinstance(payload, dict):
+        raise HttpError(400, "請求內容必須是 JSON 物件")
+    records = payload.get("option_positions") or []
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise HttpError(400, "option_positions 必須是倉位物件的陣列")
+    index = finite_number(payload, "index")
+    try:
+        positions = load_positions(payload)
+        etf_current = finite_number(payload, "etf_current_price", 0.0)
+        etf_cost = finite_number(payload, "etf_cost", 0.0) or etf_current
+        book = Book(positions, finite_number(payload, "etf_lots", 0.0), etf_cost)
+    except KeyError as e:
+        raise HttpError(400, f"缺少欄位: {e.args[0]}") from None
+    except (TypeError, ValueError, OverflowError) as e:
+        raise HttpError(400, f"欄位格式錯誤: {e}") from None
+    for i, p in enumerate(positions):
+        if not (math.isfinite(p.strike) and math.isfinite(p.premium)) or p.lots < 0:
+            raise HttpError(400, f"option_positions[{i}] 的 strike、premium 必須是有限的數值，lots 不可為負")
+    if index <= 0:
+        raise HttpError(400, "index 必須大於 0")
+    if book.etf_lots and etf_current <= 0:
+        raise HttpError(400, "etf_lots 不為 0 時需要大於 0 的 etf_current_price")
+    return book, index, etf_current
+
+
+def grid_size(price_range, price_step, n_positions):
+    """檢查價格網格大小，回傳點數；過大的網格會阻塞事件迴圈，直接拒絕"""
+    if price_range <= 0 or price_step <= 0:
+        raise HttpError(400, "price_range、price_step 必須大於 0")
+    points = int(2 * price_range / price_step) + 1
+    if points > MAX_GRID_POINTS:
+        raise HttpError(400, f"價格網格過大 ({points:,} 點，上限 {MAX_GRID_POINTS:,})")
+    if points * max(n_positions, 1) > MAX_GRID_CELLS:
+        raise HttpError(400, f"價格網格 × 倉位數過大 (上限 {MAX_GRID_CELLS:,})")
+    return points
+
+
+# ======== 批次計算 ========
+def evaluate_batch(key, books):
+    """同一網格上的多個組合，一次計算到期損益"""
+    index, price_range, price_step, etf_current = key
+    prices = price_grid(index, price_range, price_step)
+    prices = prices[prices >= 0]
+    result = evaluate_books(
+        {i: {"option_positions": b.positions, "etf_lots": b.etf_lots, "etf_cost": b.etf_cost}
+         for i, b in enumerate(books)},
+        prices, index, etf_current,
+    )
+    price_list = prices.tolist()
+    return [
+        {
+            "prices": price_list,
+            "etf_pnl": result.etf_pnl[:, i].tolist(),
+            "option_pnl": result.option_pnl[:, i].tolist(),
+            "total_pnl": result.combined_pnl[:, i].tolist(),
+        }
+        for i in range(len(books))
+    ]
+
+
+def greeks_batch(key, books):
+    """同一指數、天數、波動率下的多個組合，一次計算所有倉位的 Greeks"""
+    index, days_to_expiry, volatility, rate, etf_current = key
+    positions = [p for b in books for p in b.positions]
+    owner = np.repeat(np.arange(len(books)), [len(b.positions) for b in books])
+    membership = np.zeros((len(positions), len(books)))
+    membership[np.arange(len(positions)), owner] = 1.0
+
+    per_leg = leg_greeks(index, positions_to_legs(positions), days_to_expiry, volatility, rate)
+    totals = {name: np.asarray(value) @ membership for name, value in per_leg._asdict().items()}
+    results = []
+    for i, book in enumerate(books):
+        etf_delta = etf_index_delta(index, book.etf_lots, etf_current)
+        greeks = {name: float(value[i]) for name, value in totals.items()}
+        greeks["etf_delta"] = etf_delta
+        greeks["net_delta"] = etf_delta + greeks["delta"]
+        results.append(greeks)
+    return results
+
+
+def break_evens(book, index, etf_current):
+    """損益兩平點與到期損益極值 (分段線性，成本只與倉位數有關，不需批次)"""
+    legs = positions_to_legs(book.positions)
+    payoff = build_piecewise_payoff(legs, index, book.etf_lots, book.etf_cost, etf_current)
+    extremes = payoff_extremes(payoff)
+
+    def finite(value):
+        return float(value) if np.isfinite(value) else None  # JSON 沒有 inf
+
+    return {
+        "break_evens": break_even_points(payoff).tolist(),
+        "max_profit": finite(extremes.max_profit),
+        "max_profit_at": finite(extremes.max_profit_at),
+        "max_loss": finite(extremes.max_loss),
+        "max_loss_at": finite(extremes.max_loss_at),
+    }
+
+
+class MicroBatcher:
+    """把 window 秒內送達、key 相同的工作合併成一次 compute(key, items) 呼叫
+
+    compute 在事件迴圈中直接執行；計算期間抵達的請求自然累積成下一批。
+    """
+
+    def __init__(self, compute, window=BATCH_WINDOW_SECONDS, max_batch=MAX_BATCH_SIZE):
+        self.compute = compute
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # key -> [(item, future)]
+        self._timers = {}
+        self.batches = 0
+        self.requests = 0
+        self.largest = 0
+
+    def submit(self, key, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._pending.setdefault(key, [])
+        queue.append((item, future))
+        if len(queue) >= self.max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        queue = self._pending.pop(key, [])
+        if not queue:
+            return
+        self.batches += 1
+        self.requests += len(queue)
+        self.largest = max(self.largest, len(queue))
+        try:
+            results = self.compute(key, [item for item, _ in queue])
+        except Exception as e:
+            for _, future in queue:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(queue, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "largest_batch": self.largest,
+            "mean_batch": self.requests / self.batches if self.batches else 0.0,
+        }
+
+
+# ======== HTTP ========
+class ValuationService:
+    """路由與請求處理"""
+
+    def __init__(self, window=BATCH_WINDOW_SECONDS, max_batch=MAX_BATCH_SIZE):
+        self.evaluator = MicroBatcher(evaluate_batch, window, max_batch)
+        self.greeks = MicroBatcher(greeks_batch, window, max_batch)
+
+    async def dispatch(self, method, path, payload):
+        if path == "/stats":
+            return {"evaluate": self.evaluator.stats(), "greeks": self.greeks.stats()}
+        if path not in ("/evaluate", "/break-evens", "/greeks"):
+            raise HttpError(404, f"找不到路徑: {path}")
+        if method != "POST":
+            raise HttpError(405, "請使用 POST")
+
+        book, index, etf_current = parse_book(payload)
+        if path == "/break-evens":
+            return break_evens(book, index, etf_current)
+        if path == "/evaluate":
+            key = (index, finite_number(payload, "price_range", 1500.0),
+                   finite_number(payload, "price_step", 100.0), etf_current)
+            grid_size(key[1], key[2], len(book.positions))
+            return await self.evaluator.submit(key, book)
+        key = (index, finite_number(payload, "days_to_expiry", 7.0), finite_number(payload, "volatility", 0.20),
+               finite_number(payload, "rate", 0.015), etf_current)
+        return await self.greeks.submit(key, book)
+
+    async def handle(self, reader, writer):
+        """處理一條連線上的所有請求 (HTTP/1.1 keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version.strip() == "HTTP/1.1"
+
+                status, body = 200, None
+                try:
+                    try:
+                        length = int(headers.get("content-length", 0))
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        keep_alive = False  # 無法判斷內容長度，不能繼續使用此連線
+                        raise HttpError(400, "Content-Length 格式錯誤")
+                    if length > MAX_BODY_BYTES:
+                        raise HttpError(413, "請求內容過大")
+                    raw = await reader.readexactly(length) if length else b""
+                    try:
+                        payload = json.loads(raw) if raw else {}
+                    except ValueError:
+                        raise HttpError(400, "請求內容不是合法的 JSON") from None
+                    body = await self.dispatch(method, path.split("?", 1)[0], payload)
+                except HttpError as e:
+                    status, body = e.status, {"error": str(e)}
+                    keep_alive = keep_alive and e.status != 413
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    raise
+                except Exception as e:
+                    status, body = 500, {"error": f"內部錯誤: {type(e).__name__}: {e}"}
+
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, window=BATCH_WINDOW_SECONDS, max_batch=MAX_BATCH_SIZE):
+    service = ValuationService(window, max_batch)
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"估值服務啟動於 http://{host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="00631L 避險計算器本機估值服務")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_SECONDS * 1000, help="批次合併等待時間 (毫秒)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH_SIZE, help="單批最多請求數")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.window_ms / 1000.0, args.max_batch))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()